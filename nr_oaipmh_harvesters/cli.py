@@ -0,0 +1,138 @@
+import json
+from pathlib import Path
+
+import click
+from flask.cli import with_appcontext
+
+from nr_oaipmh_harvesters.nusl.field_stats import field_stats
+from nr_oaipmh_harvesters.nusl.institution_overrides import (
+    generate_institution_overrides,
+)
+from nr_oaipmh_harvesters.nusl.retry_queue import retry_deferred
+from nr_oaipmh_harvesters.nusl.validate_dump import validate_dump
+from nr_oaipmh_harvesters.nusl.validation import DEFAULT_SCHEMA
+from nr_oaipmh_harvesters.readers.indexed_oai_dir import load_dump_file
+from nr_oaipmh_harvesters.readers.oai_zstd import OAIZstdDumpWriter
+
+
+@click.group()
+def nusl():
+    """NUSL harvesting tools."""
+
+
+@nusl.command("convert-dump")
+@click.argument("source")
+@click.argument("target")
+@click.option("--chunk-size", type=int, default=1000, help="Records per chunk")
+@click.option("--level", type=int, default=3, help="zstd compression level")
+def convert_dump(source, target, chunk_size, level):
+    """Converts oai_dir dump in SOURCE to oai_zstd dump in TARGET."""
+    writer = OAIZstdDumpWriter(target, level=level)
+    chunk = []
+    files = sorted(Path(source).glob("*.yaml.gz"))
+    with click.progressbar(files, label="Converting") as bar:
+        for fn in bar:
+            chunk.extend(load_dump_file(fn))
+            while len(chunk) >= chunk_size:
+                writer.write_chunk(chunk[:chunk_size])
+                chunk = chunk[chunk_size:]
+    writer.write_chunk(chunk)
+
+
+@nusl.command("validate")
+@click.argument("source")
+@click.option(
+    "--errors",
+    "errors_path",
+    default="errors.jsonl",
+    help="File the errors are appended to, one json per line",
+)
+@click.option(
+    "--checkpoint",
+    "checkpoint_path",
+    help="File with finished chunks, defaults to <errors>.checkpoint",
+)
+@click.option(
+    "--processes", type=int, help="Number of processes, defaults to cpu count"
+)
+@click.option("--chunk-size", type=int, default=1000, help="Records per chunk")
+@click.option(
+    "--schema", "schema_class", default=DEFAULT_SCHEMA, help="Marshmallow schema"
+)
+def validate(source, errors_path, checkpoint_path, processes, chunk_size, schema_class):
+    """
+    Transforms and validates local dump in SOURCE (oai_dir or oai_zstd) in parallel.
+    When interrupted, running it again with the same arguments continues where it has stopped.
+    """
+    validate_dump(
+        source,
+        errors_path,
+        checkpoint_path=checkpoint_path,
+        processes=processes,
+        chunk_size=chunk_size,
+        schema_class=schema_class,
+    )
+
+
+@nusl.command("field-stats")
+@click.argument("source")
+@click.option(
+    "--output",
+    default="field-stats.csv",
+    help="Output file, parquet when it ends with .parquet, csv otherwise",
+)
+@click.option(
+    "--processes", type=int, help="Number of processes, defaults to cpu count"
+)
+@click.option("--tags", "tag_filter", help="Regular expression the tags must match")
+@click.option("--top", type=int, default=10, help="Number of most common values")
+def field_stats_command(source, output, processes, tag_filter, top):
+    """
+    Writes statistics of the tags used in the local dump in SOURCE (oai_dir or oai_zstd)
+    - number of records with the tag, number of values, distinct values and top values.
+    """
+    field_stats(source, output, processes=processes, tag_filter=tag_filter, top=top)
+
+
+@nusl.command("institution-overrides")
+@click.argument("logs", nargs=-1, required=True)
+@click.option("--output", default="institution-overrides.json", help="Output json file")
+@click.option(
+    "--min-count",
+    type=int,
+    default=10,
+    help="Minimal number of lookups of the name to be included",
+)
+def institution_overrides(logs, output, min_count):
+    """
+    Generates the table of institution overrides (NUSL_INSTITUTION_OVERRIDES) from
+    harvester LOGS with debug level institution lookups. Only names that have always
+    been resolved to the same institution are included.
+    """
+
+    def log_lines():
+        for log_file in logs:
+            with open(log_file, errors="replace") as f:
+                yield from f
+
+    overrides = generate_institution_overrides(log_lines(), min_count=min_count)
+    with open(output, "w") as f:
+        json.dump(overrides, f, ensure_ascii=False, indent=2, sort_keys=True)
+    click.echo(
+        f"{sum(len(x) for x in overrides.values())} overrides written to {output}"
+    )
+
+
+@nusl.command("retry")
+@click.argument("code")
+@with_appcontext
+def retry(code):
+    """
+    Transforms and writes the records of harvester CODE that have been deferred because
+    of unavailable lookups, using the entries stored in the retry queue.
+    """
+    run_id = retry_deferred(code)
+    if run_id:
+        click.echo(f"Deferred records retried in run {run_id}")
+    else:
+        click.echo("No deferred records")
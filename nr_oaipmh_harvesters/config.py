@@ -1,5 +1,32 @@
 from nr_oaipmh_harvesters.nusl import NUSLTransformer
+from nr_oaipmh_harvesters.nusl.compiled import NUSLCompiledTransformer
+from nr_oaipmh_harvesters.nusl.marcxml import NUSLMarcXMLTransformer
+from nr_oaipmh_harvesters.nusl.retry_queue import RetryQueueReader
+from nr_oaipmh_harvesters.nusl.validation import NUSLValidationTransformer
+from nr_oaipmh_harvesters.readers.indexed_oai_dir import IndexedOAIDirReader
+from nr_oaipmh_harvesters.readers.oai_zstd import OAIZstdReader
+from nr_oaipmh_harvesters.writers.oai_zstd import OAIZstdWriter
+
+DATASTREAMS_READERS = {
+    "oai_dir_indexed": IndexedOAIDirReader,
+    "oai_zstd": OAIZstdReader,
+    "nusl_retry_queue": RetryQueueReader,
+}
 
 DATASTREAMS_TRANSFORMERS = {
     "nusl": NUSLTransformer,
+    "nusl_marcxml": NUSLMarcXMLTransformer,
+    "nusl_compiled": NUSLCompiledTransformer,
+    "nusl_validate": NUSLValidationTransformer,
+}
+
+DATASTREAMS_WRITERS = {
+    "oai_zstd": OAIZstdWriter,
 }
+
+# json file (or dict) with curated institution overrides, see nusl/institution_overrides.py
+NUSL_INSTITUTION_OVERRIDES = None
+
+# directory of the queues of deferred entries (absolute or relative to the instance path),
+# see nusl/retry_queue.py
+NUSL_RETRY_QUEUE_DIR = None
@@ -13,6 +13,16 @@ class NRDocsOAIHarvesterExt:
     def load_config(self, app):
         from . import config
 
+        app.config.setdefault("DATASTREAMS_READERS", {}).update(
+            config.DATASTREAMS_READERS
+        )
         app.config.setdefault("DATASTREAMS_TRANSFORMERS", {}).update(
             config.DATASTREAMS_TRANSFORMERS
         )
+        app.config.setdefault("DATASTREAMS_WRITERS", {}).update(
+            config.DATASTREAMS_WRITERS
+        )
+        app.config.setdefault(
+            "NUSL_INSTITUTION_OVERRIDES", config.NUSL_INSTITUTION_OVERRIDES
+        )
+        app.config.setdefault("NUSL_RETRY_QUEUE_DIR", config.NUSL_RETRY_QUEUE_DIR)
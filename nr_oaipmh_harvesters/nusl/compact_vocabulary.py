@@ -0,0 +1,86 @@
+import json
+import sys
+from array import array
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, Optional, Sequence
+
+
+class CompactVocabulary(Mapping):
+    """
+    Read-only mapping id -> vocabulary item (containing only the selected fields)
+    that is cheap to pickle into the cache and cheap to read from it.
+
+    All ids are kept in a single string and all items in a single json-encoded blob,
+    both sorted by id and addressed by offset tables. Unpickling thus does not create
+    an object per item, items are decoded only when they are accessed and membership
+    check is a binary search over the ids.
+    """
+
+    __slots__ = ("fields", "_ids", "_id_offsets", "_data", "_data_offsets")
+
+    def __init__(self, items: Iterable[Dict], fields: Sequence[str]):
+        self.fields = tuple(fields)
+        items = sorted(items, key=lambda x: x["id"])
+
+        self._ids = "".join(x["id"] for x in items)
+        self._id_offsets = array("L", [0])
+        for x in items:
+            self._id_offsets.append(self._id_offsets[-1] + len(x["id"]))
+
+        if self.fields == ("id",):
+            # the item is just {"id": ...}, no need to store it
+            self._data = None
+            self._data_offsets = None
+            return
+
+        data = []
+        self._data_offsets = array("L", [0])
+        for x in items:
+            encoded = json.dumps(
+                {k: v for k, v in x.items() if k in self.fields},
+                ensure_ascii=False,
+                separators=(",", ":"),
+            ).encode("utf-8")
+            data.append(encoded)
+            self._data_offsets.append(self._data_offsets[-1] + len(encoded))
+        self._data = b"".join(data)
+
+    def _id_at(self, idx: int) -> str:
+        return self._ids[self._id_offsets[idx] : self._id_offsets[idx + 1]]
+
+    def _index(self, key) -> Optional[int]:
+        if not isinstance(key, str):
+            return None
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._id_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self) and self._id_at(lo) == key:
+            return lo
+        return None
+
+    def __contains__(self, key) -> bool:
+        return self._index(key) is not None
+
+    def __getitem__(self, key) -> Dict:
+        idx = self._index(key)
+        if idx is None:
+            raise KeyError(key)
+        if self._data is None:
+            return {"id": sys.intern(key)}
+        return json.loads(
+            self._data[self._data_offsets[idx] : self._data_offsets[idx + 1]]
+        )
+
+    def __iter__(self) -> Iterator[str]:
+        for idx in range(len(self)):
+            yield sys.intern(self._id_at(idx))
+
+    def __len__(self) -> int:
+        return len(self._id_offsets) - 1
+
+    def __repr__(self):
+        return f"CompactVocabulary({len(self)} items, fields={self.fields})"
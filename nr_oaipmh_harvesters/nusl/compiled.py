@@ -0,0 +1,280 @@
+"""
+Compiles the declarative NUSL mapping (nusl.mapping) into a single python function.
+The value iteration of each rule is generated inline (no decorators are called per
+value) and the metadata containers are created by plain dict operations.
+"""
+
+import inspect
+import itertools
+from typing import Callable, Dict, List
+
+from oarepo_runtime.datastreams.types import StreamEntry, StreamEntryError
+
+from nr_oaipmh_harvesters.nusl import transformer
+from nr_oaipmh_harvesters.nusl.mapping import NUSL_MAPPING
+from nr_oaipmh_harvesters.nusl.rules import RuleError
+from nr_oaipmh_harvesters.nusl.transformer import NUSLTransformer, vocabulary_cache
+
+
+class NUSLCompiledTransformer(NUSLTransformer):
+    """
+    NUSL transformer applying the rules compiled from the declarative mapping,
+    produces the same output as NUSLTransformer.
+    """
+
+    def transform(self, entry: StreamEntry):
+        # rules are not timed separately here, the slow record log has just the lookups
+        state = self.begin_entry()
+        md = entry.transformed.setdefault("metadata", {})
+
+        entry.transformed.setdefault("files", {})["enabled"] = False
+
+        compiled_nusl_mapping(md, entry)
+
+        self.postprocess(md, entry)
+        self.end_entry(state, entry)
+        return True
+
+
+def rule_error(rule_name, tags, value, exc) -> StreamEntryError:
+    """The same error as NUSLTransformer.apply_rule records for a failed rule."""
+    if isinstance(exc, RuleError):
+        return exc.stream_error()
+    error = RuleError(rule_name, tags, value)
+    error.__cause__ = exc
+    return error.stream_error()
+
+
+def entry_rule_error(rule_name, exc) -> StreamEntryError:
+    return StreamEntryError.from_exception(
+        exc, location=rule_name, info={"rule": rule_name}
+    )
+
+
+def grouped_values(data, tags, group) -> List:
+    """Values of the tags combined the same way as rules.matches_grouped does."""
+    expected_length = None
+    for tag in tags:
+        if tag not in group:
+            val = data.get(tag)
+            if isinstance(val, (list, tuple)):
+                expected_length = len(val)
+                break
+            elif val is not None:
+                expected_length = 1
+                break
+
+    vals = []
+    for tag in tags:
+        val = data.get(tag)
+        if val is None:
+            val = []
+        elif tag in group and isinstance(val, tuple):
+            if expected_length is not None and len(val) != expected_length:
+                # single record with multiple values - keep together
+                val = [val]
+            else:
+                val = list(val)
+        elif isinstance(val, (list, tuple)):
+            val = list(val)
+        else:
+            val = [val]
+        vals.append(val)
+    return list(itertools.zip_longest(*vals))
+
+
+class _Source:
+    def __init__(self):
+        self.lines = []
+        self.indent = 1
+
+    def add(self, line):
+        self.lines.append("    " * self.indent + line)
+
+    def block(self, line):
+        self.add(line)
+        self.indent += 1
+
+    def end(self):
+        self.indent -= 1
+
+
+def _container(src: _Source, path: List[str], var="target"):
+    """Generates code making var the dict at the path (without the last element)."""
+    src.add(f"{var} = md")
+    for key in path[:-1]:
+        src.add(f"_c = {var}.get({key!r})")
+        src.block("if _c is None:")
+        src.add(f"_c = {var}[{key!r}] = {{}}")
+        src.end()
+        src.add(f"{var} = _c")
+
+
+def _list(src: _Source, path: List[str]):
+    _container(src, path)
+    src.add(f"_l = target.get({path[-1]!r})")
+    src.block("if _l is None:")
+    src.add(f"_l = target[{path[-1]!r}] = []")
+    src.end()
+
+
+def _body(src: _Source, rule: Dict, idx: int):
+    if "handler" in rule:
+        src.add(f"handler_{idx}(md, entry, value)")
+        return
+
+    path = rule["target"].split(".")
+    action = rule["action"]
+    optional = rule.get("optional")
+    if action == "append" and not optional:
+        # the list is created before the value is converted, as md.setdefault(...).append(convert(value)) does
+        _list(src, path)
+
+    converted = "value"
+    if rule.get("convert"):
+        src.add(f"converted = convert_{idx}(value)")
+        converted = "converted"
+    if optional:
+        src.block(f"if {converted} is None:")
+        src.add("continue")
+        src.end()
+    if rule.get("vocabulary"):
+        args = ", ".join(
+            repr(x) for x in [rule["vocabulary"], *rule.get("vocabulary_fields", [])]
+        )
+        src.add(f"converted = vocabulary_cache.by_id({args})[{converted}]")
+        converted = "converted"
+
+    if action == "set":
+        _container(src, path)
+        src.add(f"target[{path[-1]!r}] = {converted}")
+    elif action == "append":
+        if optional:
+            _list(src, path)
+        src.add(f"_l.append({converted})")
+    elif action == "extend":
+        _list(src, path)
+        src.add(f"_l.extend({converted})")
+    elif action == "append_each":
+        src.block(f"for item in {converted}:")
+        _list(src, path)
+        src.add("_l.append(item)")
+        src.end()
+    elif action == "update":
+        _container(src, path)
+        src.add(f"_d = target.get({path[-1]!r})")
+        src.block("if _d is None:")
+        src.add(f"_d = target[{path[-1]!r}] = {{}}")
+        src.end()
+        src.add(f"_d.update({converted})")
+    else:
+        raise ValueError(f"Unknown action {action} in rule {rule['name']}")
+
+
+def _rule(src: _Source, rule: Dict, idx: int):
+    tags = rule["tags"]
+    src.add(f"# {rule['name']}")
+
+    if rule.get("entry"):
+        src.block("try:")
+        src.add(f"handler_{idx}(md, entry)")
+        src.end()
+        src.block("except Exception as e:")
+        src.add(f"errors.append(entry_rule_error({rule['name']!r}, e))")
+        src.end()
+        return
+
+    src.add("value = None")
+    src.block("try:")
+    unique = rule.get("unique")
+    if unique:
+        src.add("items = set()")
+
+    if rule.get("group") or rule.get("paired"):
+        if rule.get("group"):
+            src.block(
+                f"for value in grouped_values(data, tags_{idx}, {rule['group']!r}):"
+            )
+        else:
+            for tag_idx, tag in enumerate(tags):
+                src.add(f"v{tag_idx} = data.get({tag!r})")
+                src.block(f"if v{tag_idx} is None:")
+                src.add(f"v{tag_idx} = ()")
+                src.end()
+                src.block(f"elif not isinstance(v{tag_idx}, (list, tuple)):")
+                src.add(f"v{tag_idx} = (v{tag_idx},)")
+                src.end()
+            args = ", ".join(f"v{tag_idx}" for tag_idx in range(len(tags)))
+            src.block(f"for value in zip_longest({args}):")
+        if unique:
+            src.block("if tuple(value) in items:")
+            src.add("continue")
+            src.end()
+            src.add("items.add(tuple(value))")
+        _body(src, rule, idx)
+        src.end()
+    else:
+        for tag in tags:
+            src.block(f"if {tag!r} in data:")
+            src.add(f"val = data[{tag!r}]")
+            src.block("for value in val if isinstance(val, (list, tuple)) else (val,):")
+            src.block('if value is None or value == "":')
+            src.add("continue")
+            src.end()
+            if unique:
+                src.block("if value in items:")
+                src.add("continue")
+                src.end()
+                src.add("items.add(value)")
+            _body(src, rule, idx)
+            src.end()
+            src.end()
+
+    src.end()
+    src.block("except Exception as e:")
+    src.add(f"errors.append(rule_error({rule['name']!r}, tags_{idx}, value, e))")
+    src.end()
+
+
+def compile_mapping(mapping: List[Dict]) -> Callable:
+    """
+    Generates source code of a function transform(md, entry) applying the rules
+    of the mapping and compiles it. The source is available as the "source" attribute.
+    """
+    namespace = {
+        "zip_longest": itertools.zip_longest,
+        "grouped_values": grouped_values,
+        "rule_error": rule_error,
+        "entry_rule_error": entry_rule_error,
+        "vocabulary_cache": vocabulary_cache,
+    }
+    all_tags = []
+    src = _Source()
+    for idx, rule in enumerate(mapping):
+        namespace[f"tags_{idx}"] = list(rule["tags"])
+        all_tags.extend(rule["tags"])
+        if "handler" in rule:
+            namespace[f"handler_{idx}"] = inspect.unwrap(
+                getattr(transformer, rule["handler"])
+            )
+        if rule.get("convert"):
+            namespace[f"convert_{idx}"] = rule["convert"]
+        _rule(src, rule, idx)
+    namespace["all_tags"] = tuple(dict.fromkeys(all_tags))
+
+    source = "\n".join(
+        [
+            "def transform(md, entry):",
+            "    data = entry.entry",
+            "    errors = entry.errors",
+            "    entry.processed.update(all_tags)",
+            *src.lines,
+        ]
+    )
+    exec(compile(source, "<nusl mapping>", "exec"), namespace)
+    ret = namespace["transform"]
+    ret.source = source
+    return ret
+
+
+compiled_nusl_mapping = compile_mapping(NUSL_MAPPING)
@@ -0,0 +1,267 @@
+"""
+Value converters of the NUSL rules. They are called both by the hand-written rules
+of NUSLTransformer and by the declarative mapping (nusl.mapping), so that the two
+transformers share a single implementation of each conversion.
+"""
+
+import re
+from datetime import datetime
+from typing import Dict, Optional
+
+import pycountry
+from oarepo_oaipmh_harvester.transformers.rule import make_array, make_dict
+
+from nr_oaipmh_harvesters.nusl.rules import split_keywords
+
+
+def get_alpha2_lang(lang):
+    py_lang = pycountry.languages.get(alpha_3=lang) or pycountry.languages.get(
+        bibliographic=lang
+    )
+    if not py_lang:
+        raise LookupError()
+    return py_lang.alpha_2
+
+
+def convert_to_date(value):
+    if not value:
+        return value
+    if value.startswith("["):
+        value = value[1:]
+    if value.endswith("]"):
+        value = value[:-1]
+    value = value.replace(" 00:00:00.0", "")
+    return value.strip()
+
+
+def _is_valid_date(date_str, date_format):
+    try:
+        datetime.strptime(date_str, date_format)
+        return True
+    except ValueError:
+        return False
+
+
+def date_issued(value):
+    if value.startswith("c"):
+        value = value[1:]
+
+    if len(value) == 8 and all(c.isdigit() for c in value):
+        # iso 8601 date formats, e. g., YYYY-MM-DD or DD-MM-YYYY
+        if _is_valid_date(value, "%Y%m%d"):
+            return value[:4]
+        if _is_valid_date(value, "%d%m%Y") or _is_valid_date(value, "%m%d%Y"):
+            return value[-4:]
+
+    return convert_to_date(value)
+
+
+def _create_identifier_object(scheme: str, identifier: str) -> Dict[str, str]:
+    return {"scheme": scheme, "identifier": identifier}
+
+
+def parse_issn(value, identifiers):
+    for vv in re.split("[,;]", value):
+        vv = vv.strip()
+        if vv.lower().startswith("issn:"):
+            vv = vv[5:].strip()
+        if vv.lower().startswith("issn"):
+            vv = vv[4:].strip()
+        vv = re.sub("[^a-zA-Z0-9-]", "", vv)
+        if not vv or vv == "N":
+            continue
+        identifiers.append(_create_identifier_object("ISSN", vv))
+
+
+def parse_isbn(value, identifiers):
+    for isbn in re.split("[,;]", value):
+        isbn = isbn.strip()
+        isbn = isbn.lower()
+        isbn = re.sub(r"\s*\([^)]*\)", "", isbn)
+        isbn = isbn.removeprefix("isbn:").removeprefix("isbn")
+        isbn = isbn.strip()
+
+        if isbn and isbn != "n":
+            identifiers.append(_create_identifier_object("ISBN", isbn))
+
+
+def nusl_identifier(value):
+    return _create_identifier_object("nusl", "http://www.nusl.cz/ntk/nusl-" + value)
+
+
+def isbn_identifier(value):
+    identifiers = []
+    parse_isbn(value, identifiers)
+    return identifiers[0]
+
+
+def issn_identifier(value):
+    identifiers = []
+    parse_issn(value, identifiers)
+    return identifiers[0]
+
+
+def original_record_oai_identifier(value):
+    return _create_identifier_object("originalRecordOAI", value)
+
+
+def catalogue_sysno_identifier(value):
+    return _create_identifier_object("catalogueSysNo", value)
+
+
+def translated_title(value):
+    return {"title": {"lang": "en", "value": value}, "titleType": "translatedTitle"}
+
+
+def english_subtitle(value):
+    return {"title": {"lang": "en", "value": value}, "titleType": "subtitle"}
+
+
+def series(value):
+    return make_dict("seriesTitle", value[0], "seriesVolume", value[1])
+
+
+def keywords(lang):
+    def convert(value):
+        # splitnout take na carce
+        return [
+            {"subjectScheme": "keyword", "subject": [{"lang": lang, "value": v}]}
+            for v in split_keywords(value)
+        ]
+
+    return convert
+
+
+english_keywords = keywords("en")
+czech_keywords = keywords("cs")
+
+
+def accessibility(value):
+    return make_array(
+        value[0],
+        {"lang": "cs", "value": value[0]},
+        value[1],
+        {"lang": "en", "value": value[1]},
+    )
+
+
+def language(value):
+    try:
+        return {"id": get_alpha2_lang(value)}
+    except LookupError:
+        raise Exception(f"Bad language {value} - no alpha2 equivalent")
+
+
+def certified_methodology(value):
+    return "certified-methodology"
+
+
+def study_fields(value):
+    value = [x.strip() for x in value.split("/")]
+    return [x for x in value if x]
+
+
+def abstract(value):
+    try:
+        lang = get_alpha2_lang(value[1])
+    except LookupError:
+        # marshmallow will take care of that
+        lang = value[1] or "cs"
+    return {"lang": lang, "value": value[0]}
+
+
+def subject(value) -> Optional[Dict]:
+    """Subject of 650 datafields, None if all the subfields are empty."""
+    if all(not v for v in value):
+        return None
+
+    purl = value[3] or ""
+    val_url = (
+        purl if purl.startswith("http://") or purl.startswith("https://") else None
+    )
+    class_code = value[4] if len(value) > 4 else None
+    if not class_code and not (
+        purl.startswith("http://") or purl.startswith("https://")
+    ):
+        class_code = purl
+
+    return make_dict(
+        "subjectScheme",
+        value[2],
+        "classificationCode",
+        class_code,
+        "valueURI",
+        val_url,
+        "subject",
+        make_array(
+            value[0],
+            lambda: {"lang": "cs", "value": value[0]},
+            value[1],
+            lambda: {"lang": "en", "value": value[1]},
+        ),
+    )
+
+
+def related_item(value):
+    item_year, item_volume, item_issue, item_pids_isbn, item_title, item_pids_issn = (
+        value
+    )
+
+    parsed = {
+        k: v
+        for k, v in {
+            "itemYear": item_year,
+            "itemVolume": item_volume,
+            "itemIssue": item_issue,
+        }.items()
+        if v
+    }
+
+    identifiers = []
+    if item_pids_isbn:
+        parse_isbn(item_pids_isbn, identifiers)
+    if item_pids_issn:
+        parse_issn(item_pids_issn, identifiers)
+
+    return {
+        **make_dict("itemTitle", item_title, "itemPIDs", identifiers),
+        **parsed,
+    }
+
+
+rights_dict = {
+    "Licence Creative Commons Uveďte autora 3.0 Česko": "CC-BY-CZ-3.0",
+    "Licence Creative Commons Uveďte autora-Neužívejte dílo komerčně 3.0 Česko": "CC-BY-NC-CZ-3.0",
+    "Licence Creative Commons Uveďte autora-Neužívejte dílo komerčně-Nezasahujte do díla 3.0 Česko": "CC-BY-NC-ND-CZ-3.0",
+    "Licence Creative Commons Uveďte autora-Neužívejte dílo komerčně-Zachovejte licenci 3.0 Česko": "CC-BY-NC-SA-CZ-3.0",
+    "Licence Creative Commons Uveďte autora-Nezasahujte do díla 3.0 Česko": "CC-BY-ND-CZ-3.0",
+    "Licence Creative Commons Uveďte autora-Zachovejte licenci 3.0 Česko": "CC-BY-SA-CZ-3.0",
+    "Licence Creative Commons Uveďte původ 4.0": "CC-BY-4.0",
+    "Licence Creative Commons Uveďte původ-Neužívejte komerčně-Nezpracovávejte 4.0": "CC-BY-NC-ND-4.0",
+    "Licence Creative Commons Uveďte původ-Neužívejte komerčně-Zachovejte licenci 4.0": "CC-BY-NC-SA-4.0",
+    "Licence Creative Commons Uveďte původ-Zachovejte licenci 4.0": "CC-BY-SA-4.0",
+    "Licence Creative Commons Uveďte původ-Nezpracovávejte 4.0": "CC-BY-ND-4.0",
+    "Licence Creative Commons Uveďte původ-Neužívejte komerčně 4.0": "CC-BY-NC-4.0",
+    "License: Creative Commons Attribution 4.0": "CC-BY-4.0",
+    "License: Creative Commons Attribution-NoDerivs 3.0 Czech Republic": "CC-BY-ND-CZ-3.0",
+    "License: Creative Commons Attribution-NoDerivs 4.0": "CC-BY-ND-4.0",
+    "License: Creative Commons Attribution-NonCommercial 3.0 Czech Republic": "CC-BY-NC-CZ-3.0",
+    "License: Creative Commons Attribution-NonCommercial 4.0": "CC-BY-NC-4.0",
+    "License: Creative Commons Attribution-NonCommercial-NoDerivs 3.0 Czech Republic": "CC-BY-NC-ND-CZ-3.0",
+    "License: Creative Commons Attribution-NonCommercial-NoDerivs 4.0": "CC-BY-NC-ND-4.0",
+    "License: Creative Commons Attribution-NonCommercial-ShareAlike 3.0 Czech Republic": "CC-BY-NC-SA-CZ-3.0",
+    "License: Creative Commons Attribution-NonCommercial-ShareAlike 4.0": "CC-BY-NC-SA-4.0",
+    "License: Creative Commons Attribution-ShareAlike 3.0 Czech Republic": "CC-BY-SA-CZ-3.0",
+    "License: Creative Commons Attribution-ShareAlike 4.0": "CC-BY-SA-4.0",
+}
+
+
+def rights_id(value) -> Optional[str]:
+    """Id in the rights vocabulary of the czech license text, None for other texts."""
+    if value[1] != "cze":
+        return None
+    return rights_dict.get(value[0])
+
+
+def defended(value) -> Optional[bool]:
+    return True if value == "obhájeno" else None
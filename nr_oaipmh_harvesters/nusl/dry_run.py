@@ -0,0 +1,134 @@
+"""
+Dry run of the NUSL transformer - every external lookup (vocabularies, institutions,
+names, awards, communities, affiliations) is replaced by a deterministic stub that records
+the key that would have been looked up. Measures the throughput of the mapping itself
+and collects the unique lookup keys of a dump, for example to warm the caches in bulk.
+"""
+
+import json
+import logging
+from collections import Counter
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from nr_oaipmh_harvesters.nusl.lookups import LookupHook
+
+log = logging.getLogger("oaipmh.harvester")
+
+
+class StubVocabulary(Mapping):
+    """
+    Vocabulary that contains any id. An id becomes an item of the vocabulary when it is
+    accessed, so the vocabulary iterates over (and its length counts) the ids accessed
+    so far. Accessed ids are recorded.
+    """
+
+    def __init__(self, lookups: "DryRunLookups", vocabulary_type: str):
+        self.lookups = lookups
+        self.kind = f"vocabulary:{vocabulary_type}"
+        # accessed ids in the order of their first access
+        self.ids: Dict[str, None] = {}
+
+    def __contains__(self, key) -> bool:
+        self.lookups.record(self.kind, key)
+        self.ids[key] = None
+        return True
+
+    def __getitem__(self, key) -> Dict:
+        self.lookups.record(self.kind, key)
+        self.ids[key] = None
+        return {"id": key}
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self.ids))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class DryRunLookups(LookupHook):
+    offline = True
+
+    def __init__(self, keys_path=None):
+        # looked up keys are appended to this file after each batch
+        self.keys_path = keys_path
+        # kind -> key -> number of lookups
+        self.keys: Dict[str, Counter] = {}
+        # (kind, key) already written to the keys file
+        self._written: Set[Tuple[str, str]] = set()
+        self._vocabularies: Dict[str, StubVocabulary] = {}
+
+    def record(self, kind: str, key) -> None:
+        self.keys.setdefault(kind, Counter())[str(key)] += 1
+
+    def vocabulary(self, vocabulary_type: str, resolve=None) -> StubVocabulary:
+        vocabulary = self._vocabularies.get(vocabulary_type)
+        if vocabulary is None:
+            vocabulary = self._vocabularies[vocabulary_type] = StubVocabulary(
+                self, vocabulary_type
+            )
+        return vocabulary
+
+    def contributor_role(self, role: str, resolve=None) -> str:
+        self.record("contributor-role", role)
+        return "other"
+
+    def institution(self, inst: str, vocab_type: str, resolve=None) -> Dict:
+        self.record(f"institution:{vocab_type}", inst)
+        return {"id": inst}
+
+    def creatibutor(
+        self, identifiers: List[Dict], resolve=None
+    ) -> Tuple[bool, Optional[Dict]]:
+        for idf in identifiers:
+            self.record("names", f"{idf['scheme']}:{idf['identifier']}")
+        # found, so that the creatibutor is marked as personal
+        return True, {}
+
+    def award(self, project_id: str, resolve=None) -> Dict:
+        self.record("awards", project_id)
+        return {
+            "id": project_id,
+            "number": project_id,
+            "title": {"en": project_id},
+            "funder": {"id": "dry-run", "name": "dry-run"},
+        }
+
+    def community(self, slug: str, resolve=None) -> Dict:
+        self.record("communities", slug)
+        return {"id": slug}
+
+    def affiliation(self, affiliation: str, resolve=None) -> Dict:
+        self.record("affiliations", affiliation)
+        return {"id": affiliation, "name": affiliation}
+
+    def batch_finished(self, last: bool) -> None:
+        if self.keys_path:
+            self.write_new_keys(self.keys_path)
+        if last:
+            log.info(f"Dry run lookups: {json.dumps(self.summary())}")
+
+    def write_new_keys(self, path) -> None:
+        """
+        Appends keys not written yet as json lines {"kind": ..., "key": ...}. Several workers
+        may append to the same file, so the keys are unique only within one process.
+        """
+        new_keys = [
+            (kind, key)
+            for kind, keys in self.keys.items()
+            for key in keys
+            if (kind, key) not in self._written
+        ]
+        if not new_keys:
+            return
+        with open(path, "a") as f:
+            for kind, key in new_keys:
+                f.write(json.dumps({"kind": kind, "key": key}, ensure_ascii=False))
+                f.write("\n")
+        self._written.update(new_keys)
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        return {
+            kind: {"lookups": sum(keys.values()), "unique": len(keys)}
+            for kind, keys in sorted(self.keys.items())
+        }
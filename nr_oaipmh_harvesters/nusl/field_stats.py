@@ -0,0 +1,202 @@
+"""
+Statistics of MARC tags used in a local dump (oai_dir or oai_zstd) - in how many
+records each tag is present, number of its values, their cardinality and the most
+common values. Used to decide which tags need a rule and which can be ignored.
+
+The summary is written as parquet (columnar, needs pyarrow) when the output ends
+with .parquet, as csv otherwise.
+"""
+
+import csv
+import json
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import tqdm
+
+from nr_oaipmh_harvesters.readers.indexed_oai_dir import load_dump_file
+from nr_oaipmh_harvesters.readers.oai_zstd import INDEX_FILE_NAME, OAIZstdReader
+
+# number of distinct values kept per tag, when exceeded the least common half
+# is dropped and the cardinality becomes a lower bound
+DEFAULT_MAX_DISTINCT_VALUES = 100000
+
+DEFAULT_TOP_VALUES = 10
+
+# oai_zstd reader of the worker process
+_zstd_readers = {}
+
+COLUMNS = [
+    "tag",
+    "records",
+    "records_ratio",
+    "values",
+    "distinct",
+    "distinct_exact",
+    "top_values",
+]
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(
+            "parquet output needs the pyarrow package, "
+            "please install nr-oaipmh-harvesters[parquet]"
+        )
+    return pyarrow
+
+
+class TagStats:
+    def __init__(self):
+        self.records = 0
+        self.values = 0
+        self.counter = Counter()
+        self.truncated = False
+
+    def add_record(self, value):
+        self.records += 1
+        for v in _flatten(value):
+            self.values += 1
+            self.counter[v] += 1
+
+    def merge(self, other: "TagStats", max_distinct=DEFAULT_MAX_DISTINCT_VALUES):
+        self.records += other.records
+        self.values += other.values
+        self.counter.update(other.counter)
+        self.truncated = self.truncated or other.truncated
+        if len(self.counter) > max_distinct:
+            self.counter = Counter(dict(self.counter.most_common(max_distinct // 2)))
+            self.truncated = True
+
+    def summary(self, top=DEFAULT_TOP_VALUES) -> Dict:
+        return {
+            "records": self.records,
+            "values": self.values,
+            "distinct": len(self.counter),
+            "distinct_exact": not self.truncated,
+            "top_values": json.dumps(self.counter.most_common(top), ensure_ascii=False),
+        }
+
+
+def _flatten(value):
+    if isinstance(value, (list, tuple)):
+        for v in value:
+            yield from _flatten(v)
+    elif value is not None and value != "":
+        yield str(value)
+
+
+def dump_units(source) -> List:
+    """Independently readable parts of the dump - files of oai_dir, chunks of oai_zstd."""
+    source = Path(source)
+    if (source / INDEX_FILE_NAME).exists():
+        reader = OAIZstdReader(source=str(source))
+        return [
+            ("zstd", str(source), start, chunk["count"])
+            for start, chunk in zip(reader.chunk_starts, reader.chunks)
+        ]
+    return [("yaml", str(fn)) for fn in sorted(source.glob("*.yaml.gz"))]
+
+
+def _unit_records(unit) -> Iterable[Dict]:
+    if unit[0] == "yaml":
+        return load_dump_file(unit[1])
+    _, source, start, count = unit
+    if source not in _zstd_readers:
+        _zstd_readers[source] = OAIZstdReader(source=source)
+    reader = _zstd_readers[source]
+    return (reader.read_record(pos) for pos in range(start, start + count))
+
+
+def unit_stats(unit, tag_filter: Optional[str] = None):
+    """Statistics of a single dump unit, returns (number of records, {tag: TagStats})."""
+    matcher = re.compile(tag_filter).match if tag_filter else None
+    stats: Dict[str, TagStats] = {}
+    count = 0
+    for record in _unit_records(unit):
+        count += 1
+        for tag, value in (record.get("entry") or {}).items():
+            if matcher and not matcher(tag):
+                continue
+            if tag not in stats:
+                stats[tag] = TagStats()
+            stats[tag].add_record(value)
+    return count, stats
+
+
+def field_stats(
+    source,
+    output,
+    processes=None,
+    tag_filter=None,
+    top=DEFAULT_TOP_VALUES,
+    max_distinct=DEFAULT_MAX_DISTINCT_VALUES,
+):
+    """
+    Computes statistics of the dump on a pool of processes and writes them
+    with one row per tag, as parquet or csv depending on the output suffix.
+    """
+    units = dump_units(source)
+    with ProcessPoolExecutor(processes) as executor, tqdm.tqdm(
+        total=len(units), unit="file"
+    ) as progress:
+        records, total = merge_stats(
+            executor.map(unit_stats, units, [tag_filter] * len(units)),
+            max_distinct,
+            progress,
+        )
+
+    rows = summary_rows(total, records, top)
+    if str(output).endswith(".parquet"):
+        write_parquet(rows, output)
+    else:
+        write_csv(rows, output)
+
+
+def merge_stats(
+    results: Iterable, max_distinct=DEFAULT_MAX_DISTINCT_VALUES, progress=None
+) -> Tuple[int, Dict[str, TagStats]]:
+    """Merges the (number of records, {tag: TagStats}) results of the workers."""
+    total: Dict[str, TagStats] = {}
+    records = 0
+    for count, stats in results:
+        records += count
+        for tag, tag_stats in stats.items():
+            total.setdefault(tag, TagStats()).merge(tag_stats, max_distinct)
+        if progress is not None:
+            progress.update(1)
+            progress.set_postfix(records=records)
+    return records, total
+
+
+def summary_rows(total: Dict[str, TagStats], records, top=DEFAULT_TOP_VALUES):
+    rows = []
+    for tag in sorted(total):
+        summary = total[tag].summary(top)
+        rows.append(
+            {
+                "tag": tag,
+                "records_ratio": round(summary["records"] / records, 6),
+                **summary,
+            }
+        )
+    return rows
+
+
+def write_csv(rows: List[Dict], output):
+    with open(output, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def write_parquet(rows: List[Dict], output):
+    pyarrow = _pyarrow()
+    table = pyarrow.table({column: [row[column] for row in rows] for column in COLUMNS})
+    pyarrow.parquet.write_table(table, output)
@@ -0,0 +1,236 @@
+"""
+Timeouts and circuit breakers of the external lookups. A lookup that times out or fails
+on a transient search engine error raises LookupUnavailable, after repeated failures
+the circuit breaker of the lookup type opens and further lookups of that type fail
+immediately until it is reset. Entries failed by LookupUnavailable (or by a vocabulary
+that has not been loaded yet) are deferred by the transformer instead of blocking
+the harvest and, if enabled, queued for a retry (see nusl.retry_queue).
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, Optional, Union
+
+log = logging.getLogger("oaipmh.harvester")
+
+# seconds, lookup types (see LookupHook, "vocabulary-version" is the version check
+# of the cached vocabularies) without a timeout are not limited
+DEFAULT_LOOKUP_TIMEOUTS = {
+    "vocabulary-version": 5,
+    "institution": 10,
+    "creatibutor": 5,
+    "affiliation": 5,
+    "award": 5,
+    "community": 5,
+}
+
+# number of consecutive failures that opens the circuit breaker
+DEFAULT_BREAKER_FAILURES = 5
+
+# seconds after which an open circuit breaker lets a trial lookup through
+DEFAULT_BREAKER_RESET = 60
+
+# threads running the lookups with a timeout - a timed out lookup can not be interrupted,
+# it keeps its thread busy until the search engine answers. When all the threads are busy,
+# further lookups fail immediately instead of waiting for a free thread.
+DEFAULT_GUARD_WORKERS = 8
+
+
+class LookupUnavailable(Exception):
+    """The lookup timed out, failed on the search engine or its circuit breaker is open."""
+
+
+class VocabularyNotLoaded(KeyError):
+    """The vocabulary has no items (yet), entries using it are deferred."""
+
+
+def is_transient_error(e: Exception) -> bool:
+    """True for errors of the search engine itself, not of the looked up data."""
+    from invenio_search.engine import search
+
+    if isinstance(e, (TimeoutError, search.exceptions.ConnectionError)):
+        return True
+    return isinstance(e, search.exceptions.TransportError) and e.status_code in (
+        429,
+        502,
+        503,
+        504,
+    )
+
+
+class _WorkersBusy(Exception):
+    pass
+
+
+# marks the worker threads of the guards, lookups called by a lookup that already
+# runs on a worker (e.g. the version check of the institutions vocabulary within
+# an institution lookup) run directly in that thread, within the outer timeout
+_worker = threading.local()
+
+
+def _mark_worker():
+    _worker.active = True
+
+
+def in_guard_worker() -> bool:
+    return getattr(_worker, "active", False)
+
+
+class CircuitBreaker:
+    def __init__(
+        self, name, failures=DEFAULT_BREAKER_FAILURES, reset_after=DEFAULT_BREAKER_RESET
+    ):
+        self.name = name
+        self.failures = failures
+        self.reset_after = reset_after
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        """False if the breaker is open, after reset_after seconds a single trial is allowed."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_after:
+                # half open - the next failure opens the breaker again for reset_after
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def success(self) -> None:
+        with self._lock:
+            if self.opened_at is not None:
+                log.info(f"Circuit breaker of {self.name} lookups closed")
+            self.consecutive_failures = 0
+            self.opened_at = None
+
+    def failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.opened_at is None and self.consecutive_failures >= self.failures:
+                log.warning(
+                    f"Circuit breaker of {self.name} lookups opened after "
+                    f"{self.consecutive_failures} failures"
+                )
+                self.opened_at = time.monotonic()
+
+
+class LookupGuard:
+    def __init__(
+        self,
+        timeouts: Dict[str, float],
+        failures=DEFAULT_BREAKER_FAILURES,
+        reset_after=DEFAULT_BREAKER_RESET,
+        workers=DEFAULT_GUARD_WORKERS,
+    ):
+        self.timeouts = timeouts
+        self.breakers = {
+            lookup_type: CircuitBreaker(lookup_type, failures, reset_after)
+            for lookup_type in timeouts
+        }
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(
+            workers, thread_name_prefix="nusl-lookup", initializer=_mark_worker
+        )
+        # lookups submitted to the executor that have not finished yet
+        self._running = 0
+        self._running_lock = threading.Lock()
+
+    def call(self, lookup_type: str, resolve: Callable):
+        breaker = self.breakers.get(lookup_type)
+        if breaker is None:
+            return resolve()
+        if not breaker.allow():
+            raise LookupUnavailable(
+                f"{lookup_type} lookups are unavailable, the circuit breaker is open"
+            )
+        timeout = self.timeouts[lookup_type]
+        try:
+            ret = self._run(resolve, timeout)
+        except _WorkersBusy:
+            breaker.failure()
+            raise LookupUnavailable(
+                f"{lookup_type} lookup not started, all {self.workers} lookup "
+                f"threads are busy with timed out lookups"
+            )
+        except FutureTimeoutError:
+            breaker.failure()
+            raise LookupUnavailable(f"{lookup_type} lookup timed out after {timeout}s")
+        except Exception as e:
+            if is_transient_error(e):
+                breaker.failure()
+                raise LookupUnavailable(f"{lookup_type} lookup failed: {e}") from e
+            # the search engine has answered, just the data are wrong
+            breaker.success()
+            raise
+        breaker.success()
+        return ret
+
+    def _run(self, resolve: Callable, timeout):
+        if not timeout or in_guard_worker():
+            return resolve()
+        from flask import current_app
+
+        app = current_app._get_current_object() if current_app else None
+
+        def run():
+            try:
+                if app is None:
+                    return resolve()
+                with app.app_context():
+                    return resolve()
+            finally:
+                with self._running_lock:
+                    self._running -= 1
+
+        with self._running_lock:
+            if self._running >= self.workers:
+                raise _WorkersBusy()
+            self._running += 1
+        # the worker sees the lookup context of the caller
+        context = contextvars.copy_context()
+        return self._executor.submit(context.run, run).result(timeout)
+
+
+def parse_lookup_timeouts(timeouts: Union[None, str, Dict]) -> Dict[str, float]:
+    """
+    DEFAULT_LOOKUP_TIMEOUTS updated by a dict or a string "institution=10,award=3",
+    0 disables the timeout and the breaker of the lookup type.
+    """
+    if isinstance(timeouts, str):
+        timeouts = dict(
+            (k.strip(), v)
+            for k, v in (x.split("=", 1) for x in timeouts.split(",") if x.strip())
+        )
+    ret = {**DEFAULT_LOOKUP_TIMEOUTS, **(timeouts or {})}
+    return {k: float(v) for k, v in ret.items() if float(v) > 0}
+
+
+# guards are shared by transformers with the same configuration, so that the state
+# of the breakers survives batches and the threads are not created for each batch
+_guards: Dict[tuple, LookupGuard] = {}
+
+
+def get_lookup_guard(timeouts, failures, reset_after) -> LookupGuard:
+    key = (tuple(sorted(timeouts.items())), failures, reset_after)
+    if key not in _guards:
+        _guards[key] = LookupGuard(timeouts, failures, reset_after)
+    return _guards[key]
+
+
+# codes (see StreamEntryError.from_exception) of the errors that defer the entry
+DEFERRED_ERROR_CODES = (LookupUnavailable.__name__, VocabularyNotLoaded.__name__)
+
+
+def is_deferred(entry) -> bool:
+    """True if the entry failed because a lookup was unavailable, it should be retried later."""
+    return any(error.code in DEFERRED_ERROR_CODES for error in entry.errors)
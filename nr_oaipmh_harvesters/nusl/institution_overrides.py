@@ -0,0 +1,76 @@
+"""
+Curated exact-match overrides of institution resolution. The table maps normalized
+institution names to ids per vocabulary type:
+
+    {"degree-grantors": {"mendelova univerzita, agronomická fakulta": "...", ...}}
+
+and is consulted before any search in the vocabulary. It is generated from logged
+institution lookups (the "oaipmh.harvester" logger on the debug level) by
+"invenio nusl institution-overrides".
+"""
+
+import json
+import re
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Union
+
+INSTITUTION_LOOKUP_LOG_PREFIX = "Institution lookup: "
+
+
+def normalize_institution(inst: str) -> str:
+    return re.sub(r"\s+", " ", inst).strip(" .,;'").casefold()
+
+
+def load_institution_overrides(
+    overrides: Optional[Union[str, Path, Dict]],
+) -> Dict[str, Dict[str, str]]:
+    """Loads the table from a json file (or takes an already loaded dict) and normalizes its keys."""
+    if not overrides:
+        return {}
+    if not isinstance(overrides, dict):
+        overrides = json.loads(Path(overrides).read_text())
+    return {
+        vocab_type: {normalize_institution(k): v for k, v in table.items()}
+        for vocab_type, table in overrides.items()
+    }
+
+
+def institution_lookup_log_message(inst, vocab_type, resolved) -> str:
+    return INSTITUTION_LOOKUP_LOG_PREFIX + json.dumps(
+        {
+            "inst": inst,
+            "vocab_type": vocab_type,
+            "id": resolved["id"] if resolved else None,
+        },
+        ensure_ascii=False,
+    )
+
+
+def generate_institution_overrides(
+    log_lines: Iterable[str], min_count=10
+) -> Dict[str, Dict[str, str]]:
+    """
+    Creates the override table from log lines of institution lookups. A name is included
+    if it has been looked up at least min_count times and always resolved to the same id.
+    """
+    resolutions = defaultdict(Counter)
+    for line in log_lines:
+        idx = line.find(INSTITUTION_LOOKUP_LOG_PREFIX)
+        if idx < 0:
+            continue
+        try:
+            lookup = json.loads(line[idx + len(INSTITUTION_LOOKUP_LOG_PREFIX) :])
+        except ValueError:
+            continue
+        key = (lookup["vocab_type"], normalize_institution(lookup["inst"]))
+        resolutions[key][lookup["id"]] += 1
+
+    ret = defaultdict(dict)
+    for (vocab_type, inst), ids in sorted(resolutions.items()):
+        if len(ids) != 1:
+            continue
+        inst_id, count = next(iter(ids.items()))
+        if inst_id and count >= min_count:
+            ret[vocab_type][inst] = inst_id
+    return dict(ret)
@@ -0,0 +1,191 @@
+"""
+Instrumentation of the transformation of a single entry - time spent in the rules,
+number of vocabulary lookups and institution names that needed a fuzzy resolution.
+Entries that take longer than a threshold are logged as slow records.
+
+The same calls are summed up over a batch into BatchStats, which are merged into
+the end-of-harvest report (see nusl.report). Both are kept by the Instrumentation
+of the transformer.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from nr_oaipmh_harvesters.nusl.guard import is_deferred
+
+log = logging.getLogger("oaipmh.harvester")
+
+
+class EntryProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.rules: Dict[str, float] = {}
+        self.lookups = Counter()
+        self.fuzzy = []
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def report(self, entry) -> Dict:
+        oai = entry.context.get("oai") or {}
+        return {
+            "identifier": oai.get("identifier"),
+            "seconds": round(self.elapsed, 4),
+            "rules": {
+                rule: round(seconds, 4)
+                for rule, seconds in sorted(self.rules.items(), key=lambda x: -x[1])
+                if seconds >= 0.001
+            },
+            "lookups": dict(self.lookups),
+            "fuzzy": self.fuzzy,
+        }
+
+
+class BatchStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.lookups = Counter()
+        self.cache_hits = Counter()
+        self.searches = Counter()
+        self.fuzzy = 0
+        self.unresolved = Counter()
+
+    def report(self, entries) -> Dict:
+        errors = Counter()
+        for entry in entries:
+            for error in entry.errors:
+                errors[
+                    (error.info or {}).get("rule") or error.location or "unknown"
+                ] += 1
+        return {
+            "records": len(entries),
+            "deferred": sum(1 for entry in entries if is_deferred(entry)),
+            "seconds": time.perf_counter() - self.started,
+            "lookups": dict(self.lookups),
+            "cache_hits": dict(self.cache_hits),
+            "searches": dict(self.searches),
+            "fuzzy_resolutions": self.fuzzy,
+            "unresolved": dict(self.unresolved),
+            "errors": dict(errors),
+        }
+
+
+class Instrumentation:
+    """
+    Profile of the entry and statistics of the batch that are being transformed by
+    a transformer. The transformer activates its instrumentation while it transforms
+    a batch, the count_* and record_* calls of the rules and lookups find it through
+    a context variable. Guard workers run the lookups in a copy of the context and
+    update the same instance, so the counters are updated under a lock.
+    """
+
+    def __init__(self, slow_threshold: Optional[float] = None):
+        # None disables the slow record log
+        self.slow_threshold = slow_threshold
+        self.profile: Optional[EntryProfile] = None
+        self.stats: Optional[BatchStats] = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def active(self):
+        token = _current_instrumentation.set(self)
+        try:
+            yield self
+        finally:
+            _current_instrumentation.reset(token)
+
+    @contextmanager
+    def batch_stats(self):
+        """Collects the statistics of the batch transformed within the block."""
+        self.stats = BatchStats()
+        try:
+            yield self.stats
+        finally:
+            self.stats = None
+
+    def begin_entry(self) -> EntryProfile:
+        self.profile = EntryProfile()
+        return self.profile
+
+    def end_entry(self, profile: EntryProfile, entry) -> None:
+        self.profile = None
+        if self.slow_threshold is not None and profile.elapsed >= self.slow_threshold:
+            log.warning(
+                f"Slow record: {json.dumps(profile.report(entry), ensure_ascii=False)}"
+            )
+
+
+_current_instrumentation: ContextVar[Optional[Instrumentation]] = ContextVar(
+    "nusl_instrumentation", default=None
+)
+
+
+def record_rule_time(rule_name: str, seconds: float) -> None:
+    instrumentation = _current_instrumentation.get()
+    if instrumentation is None or instrumentation.profile is None:
+        return
+    with instrumentation._lock:
+        rules = instrumentation.profile.rules
+        rules[rule_name] = rules.get(rule_name, 0.0) + seconds
+
+
+def count_lookup(kind: str) -> None:
+    instrumentation = _current_instrumentation.get()
+    if instrumentation is None:
+        return
+    with instrumentation._lock:
+        if instrumentation.profile is not None:
+            instrumentation.profile.lookups[kind] += 1
+        if instrumentation.stats is not None:
+            instrumentation.stats.lookups[kind] += 1
+
+
+def _count_batch(counter: str, key: str) -> None:
+    instrumentation = _current_instrumentation.get()
+    if instrumentation is None:
+        return
+    with instrumentation._lock:
+        if instrumentation.stats is not None:
+            getattr(instrumentation.stats, counter)[key] += 1
+
+
+def count_cache_hit(kind: str) -> None:
+    """The lookup of the kind was served from a cache."""
+    _count_batch("cache_hits", kind)
+
+
+def count_search(kind: str) -> None:
+    """A search request was sent to the search engine."""
+    _count_batch("searches", kind)
+
+
+def count_fuzzy_resolution() -> None:
+    """An institution name was resolved by the fuzzy matching."""
+    instrumentation = _current_instrumentation.get()
+    if instrumentation is None:
+        return
+    with instrumentation._lock:
+        if instrumentation.stats is not None:
+            instrumentation.stats.fuzzy += 1
+
+
+def record_unresolved_institution(inst: str, vocab_type: str) -> None:
+    _count_batch("unresolved", f"{vocab_type}: {inst}")
+
+
+def record_fuzzy_resolution(inst: str, vocab_type: str, seconds: float) -> None:
+    instrumentation = _current_instrumentation.get()
+    if instrumentation is None:
+        return
+    with instrumentation._lock:
+        if instrumentation.profile is not None:
+            instrumentation.profile.fuzzy.append(
+                {"inst": inst, "vocab_type": vocab_type, "seconds": round(seconds, 4)}
+            )
@@ -0,0 +1,123 @@
+"""
+Hook for the external lookups of the NUSL transformer (vocabularies, institutions, names,
+awards, communities and affiliations). While a hook is active, each lookup is passed
+to it together with a callable doing the real lookup. The hook can call it (and record
+the result, see nusl.replay) or replace it (see nusl.dry_run). The real lookup
+can be further limited by a guard (timeouts and circuit breakers, see nusl.guard).
+"""
+
+import functools
+from collections.abc import Mapping
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class LookupHook:
+    # True if the hook never does the real lookups, the batch prefetch is skipped then
+    offline = False
+
+    def vocabulary(
+        self, vocabulary_type: str, resolve: Callable[[], Mapping]
+    ) -> Mapping:
+        return resolve()
+
+    def contributor_role(self, role: str, resolve: Callable[[], str]) -> str:
+        return resolve()
+
+    def institution(
+        self, inst: str, vocab_type: str, resolve: Callable[[], Optional[Dict]]
+    ) -> Optional[Dict]:
+        return resolve()
+
+    def creatibutor(
+        self,
+        identifiers: List[Dict],
+        resolve: Callable[[], Tuple[bool, Optional[Dict]]],
+    ) -> Tuple[bool, Optional[Dict]]:
+        return resolve()
+
+    def award(self, project_id: str, resolve: Callable[[], Dict]) -> Dict:
+        return resolve()
+
+    def community(
+        self, slug: str, resolve: Callable[[], Optional[Dict]]
+    ) -> Optional[Dict]:
+        return resolve()
+
+    def affiliation(self, affiliation: str, resolve: Callable[[], Dict]) -> Dict:
+        return resolve()
+
+    def batch_finished(self, last: bool) -> None:
+        """Called after each batch transformed with the hook active."""
+
+
+class LookupContext:
+    """
+    Hook and guard of the lookups of a transformer. The transformer activates its context
+    while it transforms a batch, the lookups called by the rules find it by
+    current_lookup_context(). The context is a context variable, so transformers running
+    in other threads do not see it, and the guard passes it to its worker threads
+    with the lookup.
+    """
+
+    def __init__(self, hook: Optional[LookupHook] = None, guard=None):
+        self.hook = hook
+        # nusl.guard.LookupGuard of the real lookups
+        self.guard = guard
+
+    @contextmanager
+    def active(self):
+        token = _current_context.set(self)
+        try:
+            yield self
+        finally:
+            _current_context.reset(token)
+
+    @contextmanager
+    def batch(self, batch):
+        """Active while the batch is transformed, the hook is told when it is finished."""
+        try:
+            with self.active():
+                yield self
+        finally:
+            if self.hook is not None:
+                self.hook.batch_finished(batch.last)
+
+
+_current_context: ContextVar[Optional[LookupContext]] = ContextVar(
+    "nusl_lookup_context", default=None
+)
+
+
+def current_lookup_context() -> Optional[LookupContext]:
+    return _current_context.get()
+
+
+def current_lookups() -> Optional[LookupHook]:
+    context = _current_context.get()
+    return context.hook if context is not None else None
+
+
+def guarded(method: str, resolve: Callable):
+    """Calls resolve() limited by the guard of the current context, if there is one."""
+    context = _current_context.get()
+    if context is None or context.guard is None:
+        return resolve()
+    return context.guard.call(method, resolve)
+
+
+def lookup(method: str, *args, resolve: Callable, in_process=False):
+    """
+    Does the lookup by resolve() or passes it to the method of the hook of the current
+    context (called with args and resolve). In-process lookups (e.g. in a table of the
+    module) are not limited by the guard.
+    """
+    context = _current_context.get()
+    if context is None:
+        return resolve()
+    if context.guard is not None and not in_process:
+        resolve = functools.partial(context.guard.call, method, resolve)
+    if context.hook is None:
+        return resolve()
+    return getattr(context.hook, method)(*args, resolve)
@@ -0,0 +1,341 @@
+"""
+Declarative specification of the NUSL mapping, compiled into a single transform
+function by nusl.compiled. The rules are applied in the order in which they are
+listed and produce the same output as the rules of NUSLTransformer.
+
+Each rule is a dict with:
+
+* name - name of the rule, used as the location of errors
+* tags - MARC keys the rule reads
+* paired, unique, group - how the values of the tags are combined, the same as in
+  rules.matches / rules.matches_grouped (rules with "group" are grouped)
+* entry - the rule does not read any tags, handler(md, entry) is called once
+
+and either a declarative target:
+
+* target - dotted path in the metadata, intermediary dicts are created as needed
+* action - "set" the value, "append" it to a list, "append_each" item of the value
+  to a list (the list is created only if there is an item), "extend" a list or
+  "update" a dict with the value
+* convert - function converting the value, called before the vocabulary lookup;
+  the converters live in nusl.converters and are shared with the rules of NUSLTransformer
+* optional - the converted value None is left out, the target is not created for it
+* vocabulary - the converted value is an id in this vocabulary, the vocabulary item is used;
+  vocabulary_fields are passed to VocabularyCache.by_id
+
+or
+
+* handler - name of a rule in nusl.transformer, its undecorated function
+  handler(md, entry, value) is called for each value
+
+Handlers are left for the rules that look up other records (creators, awards,
+institutions, communities), read other fields of the entry or the metadata
+transformed so far, or write to more than one target.
+"""
+
+from nr_oaipmh_harvesters.nusl.converters import (
+    abstract,
+    accessibility,
+    catalogue_sysno_identifier,
+    certified_methodology,
+    convert_to_date,
+    czech_keywords,
+    date_issued,
+    defended,
+    english_keywords,
+    english_subtitle,
+    isbn_identifier,
+    issn_identifier,
+    language,
+    nusl_identifier,
+    original_record_oai_identifier,
+    related_item,
+    rights_id,
+    series,
+    study_fields,
+    subject,
+    translated_title,
+)
+
+NUSL_MAPPING = [
+    {
+        "name": "transform_001_control_number",
+        "tags": ["001"],
+        "target": "systemIdentifiers",
+        "action": "append",
+        "convert": nusl_identifier,
+    },
+    {
+        "name": "transform_020_isbn",
+        "tags": ["020__a"],
+        "target": "objectIdentifiers",
+        "action": "append",
+        "convert": isbn_identifier,
+    },
+    {
+        "name": "transform_022_issn",
+        "tags": ["022__a"],
+        "target": "objectIdentifiers",
+        "action": "append",
+        "convert": issn_identifier,
+    },
+    {
+        "name": "transform_035_original_record_oai",
+        "tags": ["035__a"],
+        "target": "systemIdentifiers",
+        "action": "append",
+        "convert": original_record_oai_identifier,
+    },
+    {
+        "name": "transform_046_date_modified",
+        "tags": ["046__j"],
+        "target": "dateModified",
+        "action": "set",
+        "convert": convert_to_date,
+    },
+    {
+        "name": "transform_046_date_issued",
+        "tags": ["046__k"],
+        "target": "dateIssued",
+        "action": "set",
+        "convert": date_issued,
+    },
+    {
+        "name": "transform_245_title",
+        "tags": ["24500a"],
+        "target": "title",
+        "action": "set",
+    },
+    {
+        "name": "transform_245_translated_title",
+        "tags": ["24500b"],
+        "target": "additionalTitles",
+        "action": "append",
+        "convert": translated_title,
+    },
+    {
+        "name": "transform_246_title_alternate",
+        "tags": ["24630n", "24630p"],
+        "handler": "transform_246_title_alternate",
+    },
+    {
+        "name": "transform_24633a_subtitle",
+        "tags": ["24633a"],
+        "handler": "transform_24633a_subtitle",
+    },
+    {
+        "name": "transform_24633b_subtitle",
+        "tags": ["24633b"],
+        "target": "additionalTitles",
+        "action": "append",
+        "convert": english_subtitle,
+    },
+    {
+        "name": "transform_260_publisher",
+        "tags": ["260__b"],
+        "target": "publishers",
+        "action": "append",
+    },
+    {
+        "name": "transform_490_series",
+        "tags": ["4900_a", "4900_v"],
+        "paired": True,
+        "target": "series",
+        "action": "append",
+        "convert": series,
+    },
+    {
+        "name": "transform_520_abstract",
+        "tags": ["520__a", "520__9"],
+        "paired": True,
+        "target": "abstract",
+        "action": "append",
+        "convert": abstract,
+    },
+    {
+        "name": "transform_598_note",
+        "tags": ["598__a"],
+        "target": "notes",
+        "action": "append",
+    },
+    {
+        "name": "transform_65007_subject",
+        "tags": ["65007a", "65007j", "650072", "650070"],
+        "paired": True,
+        "target": "subjects",
+        "action": "append",
+        "convert": subject,
+        "optional": True,
+    },
+    {
+        "name": "transform_65017_subject",
+        "tags": ["65017a", "65017j", "650172", "650170"],
+        "paired": True,
+        "target": "subjects",
+        "action": "append",
+        "convert": subject,
+        "optional": True,
+    },
+    {
+        "name": "transform_650_7_subject",
+        "tags": ["650_7a", "650_7j", "650_72", "650_70", "650_77"],
+        "paired": True,
+        "target": "subjects",
+        "action": "append",
+        "convert": subject,
+        "optional": True,
+    },
+    {
+        "name": "transform_6530_en_keywords",
+        "tags": ["6530_a"],
+        "target": "subjects",
+        "action": "append_each",
+        "convert": english_keywords,
+    },
+    {
+        "name": "transform_653_cs_keywords",
+        "tags": ["653__a"],
+        "target": "subjects",
+        "action": "append_each",
+        "convert": czech_keywords,
+    },
+    {
+        "name": "transform_7112_event",
+        "tags": ["7112_a", "7112_c", "7112_d", "7112_g"],
+        "paired": True,
+        "handler": "transform_7112_event",
+    },
+    {
+        "name": "transform_720_creator",
+        "tags": ["720__a", "720__5", "720__6"],
+        "unique": True,
+        "group": ["720__5", "720__6"],
+        "handler": "transform_720_creator",
+    },
+    {
+        "name": "transform_720_contributor",
+        "tags": ["720__i", "720__e", "720__5", "720__6"],
+        "unique": True,
+        "group": ["720__5", "720__6"],
+        "handler": "transform_720_contributor",
+    },
+    {
+        "name": "transform_7731_related_item",
+        "tags": ["7731_e", "7731_f", "7731_g", "7731_z", "7731_t", "7731_x"],
+        "paired": True,
+        "target": "relatedItems",
+        "action": "append",
+        "convert": related_item,
+    },
+    {
+        "name": "transform_85640_original_record_url",
+        "tags": ["85640u", "85640z"],
+        "paired": True,
+        "handler": "transform_85640_original_record_url",
+    },
+    {
+        "name": "transform_85642_external_location",
+        "tags": ["85642u"],
+        "handler": "transform_85642_external_location",
+    },
+    {
+        "name": "transform_970_catalogue_sysno",
+        "tags": ["970__a"],
+        "target": "systemIdentifiers",
+        "action": "append",
+        "convert": catalogue_sysno_identifier,
+    },
+    {
+        "name": "transform_980_resource_type",
+        "tags": ["980__a"],
+        "handler": "transform_980_resource_type",
+    },
+    {
+        "name": "transform_996_accessibility",
+        "tags": ["996__a", "996__b", "996__9"],
+        "paired": True,
+        "target": "accessibility",
+        "action": "set",
+        "convert": accessibility,
+    },
+    {
+        "name": "transform_999C1_funding_reference",
+        "tags": ["999C1a", "999C1b"],
+        "paired": True,
+        "handler": "transform_999C1_funding_reference",
+    },
+    {
+        "name": "transform_04107_language",
+        "tags": ["04107a", "04107b"],
+        "target": "languages",
+        "action": "append",
+        "convert": language,
+    },
+    {
+        "name": "transform_336_certifikovana_metodika",
+        "tags": ["336__a"],
+        "target": "resourceType",
+        "action": "set",
+        "convert": certified_methodology,
+        "vocabulary": "resource-types",
+    },
+    {
+        "name": "transform_540_rights",
+        "tags": ["540__a", "540__9"],
+        "paired": True,
+        "target": "rights",
+        "action": "update",
+        "convert": rights_id,
+        "optional": True,
+        "vocabulary": "rights",
+        "vocabulary_fields": ["id"],
+    },
+    {
+        "name": "transform_oai_identifier",
+        "tags": [],
+        "entry": True,
+        "handler": "transform_oai_identifier",
+    },
+    {
+        "name": "transform_502_degree_grantor",
+        "tags": ["502__c"],
+        "handler": "transform_502_degree_grantor",
+    },
+    {
+        "name": "transform_7102_degree_grantor",
+        "tags": ["7102_a", "7102_b", "7102_g", "7102_9"],
+        "paired": True,
+        "handler": "transform_7102_degree_grantor",
+    },
+    {
+        "name": "transform_502_date_defended",
+        "tags": ["502__a"],
+        "handler": "transform_502_date_defended",
+    },
+    {
+        "name": "transform_586_defended",
+        "tags": ["586__a"],
+        "target": "thesis.defended",
+        "action": "set",
+        "convert": defended,
+        "optional": True,
+    },
+    {
+        "name": "transform_656_study_field",
+        "tags": ["656_7a"],
+        "target": "thesis.studyFields",
+        "action": "extend",
+        "convert": study_fields,
+    },
+    {
+        "name": "transform_998_collection",
+        "tags": ["998__a"],
+        "handler": "transform_998_collection",
+    },
+    {
+        "name": "transform_856_attachments",
+        "tags": ["8564_u", "8564_z", "8564_y"],
+        "paired": True,
+        "handler": "transform_856_attachments",
+    },
+]
@@ -0,0 +1,108 @@
+from io import BytesIO
+from typing import Dict, List, Tuple, Union
+
+from lxml import etree
+from oarepo_runtime.datastreams.types import StreamBatch, StreamEntryError
+
+from nr_oaipmh_harvesters.nusl.transformer import NUSLTransformer
+
+MARC_ELEMENTS = ("{*}leader", "{*}controlfield", "{*}datafield")
+
+
+class NUSLMarcXMLTransformer(NUSLTransformer):
+    """
+    Parses MARCXML of the entries and transforms them to NUSL records within a single
+    stage, replaces the "--transformer marcxml --transformer nusl" pipeline.
+
+    The output of the parsing is the same as the one of the generic marcxml transformer,
+    but the record is parsed incrementally, each element is released as soon as it has
+    been processed and no intermediary dojson record is created.
+    """
+
+    def apply(self, batch: StreamBatch, *args, **kwargs) -> StreamBatch:
+        for entry in batch.entries:
+            if not isinstance(entry.entry, (str, bytes)):
+                continue
+            try:
+                entry.entry = parse_marcxml(entry.entry)
+            except Exception as e:
+                entry.entry = {}
+                entry.errors.append(StreamEntryError.from_exception(e))
+            entry.context["marcxml_parsed"] = entry.entry
+        return super().apply(batch, *args, **kwargs)
+
+
+def parse_marcxml(xml: Union[str, bytes]) -> Dict:
+    """
+    Parses MARCXML record to a dictionary of "tag + indicators + subfield code" keys.
+    Repeated datafields give tuples with values for each occurrence (None if the subfield
+    is not present in the occurrence), repeated subfields within a datafield give tuples.
+    """
+    if isinstance(xml, str):
+        xml = xml.encode("utf-8")
+
+    leader: Dict[str, List[str]] = {}
+    controlfields: Dict[str, List[str]] = {}
+    datafields: Dict[str, List[List[Tuple[str, str]]]] = {}
+
+    for _, el in etree.iterparse(
+        BytesIO(xml), events=("end",), tag=MARC_ELEMENTS, recover=True
+    ):
+        localname = etree.QName(el).localname
+        if localname == "leader":
+            leader.setdefault("leader", []).append(el.text or "")
+        elif localname == "controlfield":
+            tag = el.get("tag", "!")
+            controlfields.setdefault(tag, []).append(el.text or "")
+        else:
+            key = el.get("tag", "!") + _indicator(el, "ind1") + _indicator(el, "ind2")
+            datafields.setdefault(key, []).append(
+                [
+                    (sf.get("code", "!").lower(), sf.text or "")
+                    for sf in el.iterchildren("{*}subfield")
+                ]
+            )
+        # release the element and everything that has been already processed
+        el.clear()
+        parent = el.getparent()
+        if parent is not None:
+            while el.getprevious() is not None:
+                del parent[0]
+
+    ret = {}
+    for fields in (leader, controlfields):
+        for key, values in fields.items():
+            ret[key] = values[0] if len(values) == 1 else tuple(values)
+
+    for key, occurrences in datafields.items():
+        if len(occurrences) == 1:
+            for code, value in _group_subfields(occurrences[0]).items():
+                ret[key + code] = value
+            continue
+        grouped = {}
+        for idx, occurrence in enumerate(occurrences):
+            for code, value in _group_subfields(occurrence).items():
+                grouped.setdefault(key + code, [None] * idx).append(value)
+            for values in grouped.values():
+                if len(values) <= idx:
+                    values.append(None)
+        ret.update({k: tuple(v) for k, v in grouped.items()})
+
+    return ret
+
+
+def _indicator(el, name):
+    ind = el.get(name, "!")
+    if ind in ("", "#"):
+        return "_"
+    return ind.replace(" ", "_")
+
+
+def _group_subfields(subfields):
+    grouped = {}
+    for code, value in subfields:
+        grouped.setdefault(code, []).append(value)
+    return {
+        code: values[0] if len(values) == 1 else tuple(values)
+        for code, values in grouped.items()
+    }
@@ -0,0 +1,89 @@
+"""
+Memory growth tracking of long running harvest workers. Between batches a tracemalloc
+snapshot is taken and compared with the previous one, the sites with the largest growth
+are logged together with the sizes of the in-process caches of the transformer.
+"""
+
+import logging
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+log = logging.getLogger("oaipmh.harvester")
+
+# number of stack frames stored with each traced allocation
+DEFAULT_TRACEMALLOC_FRAMES = 5
+
+# number of growth sites in the report
+DEFAULT_MEMORY_TOP = 10
+
+# snapshots are per process, transformers might be created for each batch
+_previous_snapshot: Optional[tracemalloc.Snapshot] = None
+
+
+class MemoryTracker:
+    def __init__(
+        self,
+        every=1,
+        top=DEFAULT_MEMORY_TOP,
+        limit_mb: Optional[float] = None,
+        cache_limit: Optional[int] = None,
+    ):
+        # snapshot after every n-th batch
+        self.every = every
+        self.top = top
+        self.limit_mb = limit_mb
+        self.cache_limit = cache_limit
+
+    @contextmanager
+    def batch(self, seq: int, cache_sizes: Callable[[], Dict[str, int]]):
+        """Checks the memory after every n-th batch, cache_sizes are taken at the end of the block."""
+        try:
+            yield
+        finally:
+            if seq % self.every == 0:
+                self.check(cache_sizes(), f"after batch {seq}")
+
+    def check(self, cache_sizes: Dict[str, int], label="") -> None:
+        """
+        Takes a snapshot and logs the growth since the previous one and the cache sizes.
+        Tracing is started on the first call, so the first call just records the baseline.
+        """
+        global _previous_snapshot
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(DEFAULT_TRACEMALLOC_FRAMES)
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            )
+        )
+        previous, _previous_snapshot = _previous_snapshot, snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        log.info(
+            f"Memory {label}: traced {current / 2**20:.1f} MB (peak {peak / 2**20:.1f} MB), "
+            f"caches {cache_sizes}"
+        )
+
+        if previous is not None:
+            growth = [
+                stat
+                for stat in snapshot.compare_to(previous, "lineno")
+                if stat.size_diff > 0
+            ][: self.top]
+            for stat in growth:
+                log.info(
+                    f"Memory growth {label}: {stat.size_diff / 1024:+.1f} kB "
+                    f"({stat.count_diff:+d} blocks) at {stat.traceback[0].filename}:{stat.traceback[0].lineno}"
+                )
+
+        if self.limit_mb is not None and current > self.limit_mb * 2**20:
+            log.warning(
+                f"Memory {label}: traced {current / 2**20:.1f} MB exceeds the limit of {self.limit_mb} MB"
+            )
+        if self.cache_limit is not None:
+            for cache, size in cache_sizes.items():
+                if size > self.cache_limit:
+                    log.warning(
+                        f"Memory {label}: cache {cache} has {size} items, the limit is {self.cache_limit}"
+                    )
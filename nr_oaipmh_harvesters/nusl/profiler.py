@@ -0,0 +1,166 @@
+"""
+Low-overhead sampling profiler for profiling harvests in production. A background
+thread periodically records the stack of the profiled thread while sampling is active,
+the samples are written in the folded format (input of flamegraph.pl, speedscope, ...)
+together with a report of the top functions.
+"""
+
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+log = logging.getLogger("oaipmh.harvester")
+
+# seconds between two samples
+DEFAULT_PROFILE_INTERVAL = 0.005
+
+# number of functions in the top functions report
+DEFAULT_PROFILE_TOP = 30
+
+
+class SamplingProfiler:
+    def __init__(self, interval=DEFAULT_PROFILE_INTERVAL):
+        self.interval = interval
+        self._samples = Counter()
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        self._target = None
+        self._thread = None
+
+    @property
+    def active(self) -> bool:
+        return self._active.is_set()
+
+    def start(self):
+        """Starts sampling of the calling thread."""
+        self._target = threading.get_ident()
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="nusl-sampling-profiler", daemon=True
+            )
+            self._thread.start()
+        self._active.set()
+
+    def stop(self):
+        self._active.clear()
+
+    def take_samples(self) -> Counter:
+        """Returns samples (folded stack -> count) collected so far and resets them."""
+        with self._lock:
+            samples, self._samples = self._samples, Counter()
+        return samples
+
+    def _run(self):
+        while True:
+            # sleeps without any overhead while not sampling
+            self._active.wait()
+            time.sleep(self.interval)
+            if not self._active.is_set():
+                continue
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            if stack:
+                with self._lock:
+                    self._samples[";".join(reversed(stack))] += 1
+
+
+def top_functions(samples: Counter, top=DEFAULT_PROFILE_TOP) -> str:
+    """Report of functions with the most samples - on the top of the stack (self) and anywhere (total)."""
+    total_samples = sum(samples.values())
+    own = Counter()
+    inclusive = Counter()
+    for stack, count in samples.items():
+        frames = stack.split(";")
+        own[frames[-1]] += count
+        for frame in set(frames):
+            inclusive[frame] += count
+
+    lines = [f"{total_samples} samples", "", f"{'self':>14} {'total':>14}  function"]
+    for function, _ in own.most_common(top):
+        lines.append(
+            f"{own[function]:7d} {own[function] / total_samples:6.1%} "
+            f"{inclusive[function]:7d} {inclusive[function] / total_samples:6.1%}  {function}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def write_profile(samples: Counter, directory, name, top=DEFAULT_PROFILE_TOP):
+    """Writes <name>.folded and <name>.top.txt files to the directory."""
+    if not samples:
+        return
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / f"{name}.folded", "w") as f:
+        for stack, count in samples.items():
+            f.write(f"{stack} {count}\n")
+    (directory / f"{name}.top.txt").write_text(top_functions(samples, top))
+    log.info(
+        f"Profile with {sum(samples.values())} samples written to {directory / name}"
+    )
+
+
+sampling_profiler = SamplingProfiler()
+
+
+class BatchProfiler:
+    """
+    Sampling of a transformer - every n-th batch and/or a percentage of records.
+    Samples of each batch are written to <directory>/batch-<seq>.
+    """
+
+    def __init__(
+        self,
+        directory,
+        every: Optional[int] = None,
+        records: Optional[float] = None,
+        top=DEFAULT_PROFILE_TOP,
+    ):
+        self.directory = directory
+        self.every = every
+        self.records = records
+        self.top = top
+
+    @contextmanager
+    def batch(self, seq: int):
+        profiled = bool(self.every) and seq % self.every == 0
+        if profiled:
+            sampling_profiler.start()
+        try:
+            yield
+        finally:
+            if profiled:
+                sampling_profiler.stop()
+            write_profile(
+                sampling_profiler.take_samples(),
+                self.directory,
+                f"batch-{seq:06d}",
+                top=self.top,
+            )
+
+    def begin_entry(self) -> bool:
+        """Samples a percentage of records, returns True if this one is sampled."""
+        sampled = (
+            bool(self.records)
+            and not sampling_profiler.active
+            and random.random() * 100 < self.records
+        )
+        if sampled:
+            sampling_profiler.start()
+        return sampled
+
+    def end_entry(self, sampled: bool) -> None:
+        if sampled:
+            sampling_profiler.stop()
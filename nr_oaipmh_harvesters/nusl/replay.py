@@ -0,0 +1,280 @@
+"""
+Record and replay of the external lookups of the NUSL transformer. While recording,
+the key, the result (or the error) and the latency of each lookup are appended after
+each batch to a gzipped json lines file. Replaying serves the results from the file
+without any search engine, optionally sleeping for the recorded latencies, so that
+a production workload can be rerun on a laptop or in CI.
+
+Each line of the file is {"kind": ..., "key": ..., "latencies": [...]} with "result"
+or "error" ([fully qualified exception class, its args]) the first time the key is written.
+"""
+
+import builtins
+import copy
+import gzip
+import importlib
+import json
+import logging
+import time
+from collections import Counter
+from collections.abc import Mapping
+from typing import Dict, Iterator, Tuple
+
+from nr_oaipmh_harvesters.nusl.lookups import LookupHook
+
+log = logging.getLogger("oaipmh.harvester")
+
+
+def lookup_key(key) -> str:
+    if isinstance(key, str):
+        return key
+    return json.dumps(key, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def error_class_name(error: Exception) -> str:
+    cls = type(error)
+    if cls.__module__ == "builtins":
+        return cls.__qualname__
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+def import_error_class(name: str) -> type:
+    """Class of a recorded error, Exception if it can not be imported."""
+    if "." in name:
+        ret = _import_qualified(name)
+    else:
+        # builtins, also recordings made before the module was recorded
+        ret = getattr(builtins, name, None)
+    if isinstance(ret, type) and issubclass(ret, Exception):
+        return ret
+    log.warning(f"Recorded error class {name} can not be imported, using Exception")
+    return Exception
+
+
+def _import_qualified(name: str):
+    # the longest importable prefix is the module, the rest is the qualname
+    parts = name.split(".")
+    for idx in range(len(parts) - 1, 0, -1):
+        try:
+            ret = importlib.import_module(".".join(parts[:idx]))
+        except ImportError:
+            continue
+        try:
+            for part in parts[idx:]:
+                ret = getattr(ret, part)
+        except AttributeError:
+            return None
+        return ret
+    return None
+
+
+def make_error(error_class: type, args) -> Exception:
+    try:
+        return error_class(*args)
+    except Exception:
+        # the constructor does not take its args back, they are set directly
+        error = error_class.__new__(error_class)
+        error.args = tuple(args)
+        return error
+
+
+def _json_copy(value):
+    # the result might be modified by the rules later, so it is serialized right away
+    return json.loads(json.dumps(value, ensure_ascii=False, default=str))
+
+
+class RecordingVocabulary(Mapping):
+    """Vocabulary whose accessed ids are recorded with the item (None if missing)."""
+
+    def __init__(self, hook: "RecordingLookups", kind: str, vocabulary: Mapping):
+        self.hook = hook
+        self.kind = kind
+        self.vocabulary = vocabulary
+
+    def __contains__(self, key) -> bool:
+        return (
+            self.hook.call(
+                self.kind,
+                key,
+                lambda: self.vocabulary[key] if key in self.vocabulary else None,
+            )
+            is not None
+        )
+
+    def __getitem__(self, key) -> Dict:
+        return self.hook.call(self.kind, key, lambda: self.vocabulary[key])
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.vocabulary)
+
+    def __len__(self) -> int:
+        return len(self.vocabulary)
+
+
+class RecordingLookups(LookupHook):
+    def __init__(self, path):
+        self.path = path
+        # (kind, key) whose result has already been written
+        self._written = set()
+        # (kind, key) -> line of the current batch
+        self._batch: Dict[Tuple[str, str], Dict] = {}
+
+    def call(self, kind, key, resolve):
+        key = lookup_key(key)
+        start = time.perf_counter()
+        try:
+            result = resolve()
+        except Exception as e:
+            self._add(kind, key, time.perf_counter() - start, error=e)
+            raise
+        self._add(kind, key, time.perf_counter() - start, result=result)
+        return result
+
+    def _add(self, kind, key, latency, result=None, error=None):
+        line = self._batch.get((kind, key))
+        if line is None:
+            line = self._batch[(kind, key)] = {"kind": kind, "key": key}
+            if (kind, key) not in self._written:
+                if error is not None:
+                    line["error"] = [error_class_name(error), _json_copy(error.args)]
+                else:
+                    line["result"] = _json_copy(result)
+            line["latencies"] = []
+        line["latencies"].append(round(latency, 5))
+
+    def vocabulary(self, vocabulary_type, resolve):
+        start = time.perf_counter()
+        vocabulary = resolve()
+        # loading of the vocabulary is replayed just as a latency
+        self._add("vocabulary-load", vocabulary_type, time.perf_counter() - start)
+        return RecordingVocabulary(self, f"vocabulary:{vocabulary_type}", vocabulary)
+
+    def contributor_role(self, role, resolve):
+        return self.call("contributor-role", role, resolve)
+
+    def institution(self, inst, vocab_type, resolve):
+        return self.call(f"institution:{vocab_type}", inst, resolve)
+
+    def creatibutor(self, identifiers, resolve):
+        return self.call("names", identifiers, resolve)
+
+    def award(self, project_id, resolve):
+        return self.call("awards", project_id, resolve)
+
+    def community(self, slug, resolve):
+        return self.call("communities", slug, resolve)
+
+    def affiliation(self, affiliation, resolve):
+        return self.call("affiliations", affiliation, resolve)
+
+    def batch_finished(self, last: bool) -> None:
+        if not self._batch:
+            return
+        # gzip members can be appended, the file is read as a single stream
+        with gzip.open(self.path, "at") as f:
+            for line in self._batch.values():
+                f.write(json.dumps(line, ensure_ascii=False))
+                f.write("\n")
+        self._written.update(self._batch)
+        self._batch = {}
+
+
+class ReplayVocabulary(Mapping):
+    def __init__(self, hook: "ReplayLookups", kind: str):
+        self.hook = hook
+        self.kind = kind
+
+    def __contains__(self, key) -> bool:
+        try:
+            return self.hook.replay(self.kind, key) is not None
+        except KeyError:
+            return False
+
+    def __getitem__(self, key) -> Dict:
+        ret = self.hook.replay(self.kind, key)
+        if ret is None:
+            raise KeyError(key)
+        return ret
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.hook.keys(self.kind))
+
+    def __len__(self) -> int:
+        return len(self.hook.keys(self.kind))
+
+
+class ReplayLookups(LookupHook):
+    offline = True
+
+    def __init__(self, path, latency=False):
+        # if set, each replayed lookup sleeps for its recorded latency
+        self.latency = latency
+        # (kind, key) -> result or error line
+        self.results: Dict[Tuple[str, str], Dict] = {}
+        # (kind, key) -> recorded latencies, replayed in order
+        self.latencies: Dict[Tuple[str, str], list] = {}
+        self._replayed = Counter()
+        self.missing = Counter()
+        # recorded class name -> imported exception class
+        self._error_classes = {}
+        with gzip.open(path, "rt") as f:
+            for line in f:
+                line = json.loads(line)
+                key = (line["kind"], line["key"])
+                if "result" in line or "error" in line:
+                    self.results.setdefault(key, line)
+                self.latencies.setdefault(key, []).extend(line["latencies"])
+        log.info(f"Replaying {len(self.results)} recorded lookups from {path}")
+
+    def keys(self, kind):
+        return [key for k, key in self.results if k == kind]
+
+    def _error_class(self, name):
+        if name not in self._error_classes:
+            self._error_classes[name] = import_error_class(name)
+        return self._error_classes[name]
+
+    def _sleep(self, key):
+        latencies = self.latencies.get(key)
+        if self.latency and latencies:
+            time.sleep(latencies[self._replayed[key] % len(latencies)])
+        self._replayed[key] += 1
+
+    def replay(self, kind, key):
+        key = (kind, lookup_key(key))
+        line = self.results.get(key)
+        if line is None:
+            self.missing[kind] += 1
+            raise KeyError(f"Lookup {kind} {key[1]} has not been recorded")
+        self._sleep(key)
+        if "error" in line:
+            error_class, args = line["error"]
+            raise make_error(self._error_class(error_class), args)
+        return copy.deepcopy(line["result"])
+
+    def vocabulary(self, vocabulary_type, resolve=None):
+        self._sleep(("vocabulary-load", vocabulary_type))
+        return ReplayVocabulary(self, f"vocabulary:{vocabulary_type}")
+
+    def contributor_role(self, role, resolve=None):
+        return self.replay("contributor-role", role)
+
+    def institution(self, inst, vocab_type, resolve=None):
+        return self.replay(f"institution:{vocab_type}", inst)
+
+    def creatibutor(self, identifiers, resolve=None):
+        found, result = self.replay("names", identifiers)
+        return found, result
+
+    def award(self, project_id, resolve=None):
+        return self.replay("awards", project_id)
+
+    def community(self, slug, resolve=None):
+        return self.replay("communities", slug)
+
+    def affiliation(self, affiliation, resolve=None):
+        return self.replay("affiliations", affiliation)
+
+    def batch_finished(self, last: bool) -> None:
+        if last and self.missing:
+            log.warning(f"Lookups not found in the recording: {dict(self.missing)}")
@@ -0,0 +1,113 @@
+"""
+End-of-harvest performance report of the NUSL transformer. Statistics of each batch
+(see instrumentation.BatchStats) are merged into the report kept by the transformer,
+after the last batch the report is written to a json file and logged. Nothing is written
+to the database, so the report does not interfere with the session of the harvest.
+"""
+
+import json
+import logging
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+
+log = logging.getLogger("oaipmh.harvester")
+
+# reports are written to <dir>/<harvester code>/<run id>.json
+DEFAULT_REPORT_DIR = f"{tempfile.gettempdir()}/nusl-reports"
+
+# number of unresolved institution names in the report
+DEFAULT_REPORT_TOP_UNRESOLVED = 20
+
+# number of unresolved institution names kept for merging reports of further batches
+DEFAULT_REPORT_UNRESOLVED_KEPT = 1000
+
+_COUNTERS = ("lookups", "cache_hits", "searches", "unresolved", "errors")
+
+
+def merge_reports(report: Optional[Dict], batch_report: Dict) -> Dict:
+    """Adds the statistics of a batch to the report, returns a new report."""
+    report = report or {}
+    merged = {
+        "records": report.get("records", 0) + batch_report["records"],
+        "deferred": report.get("deferred", 0) + batch_report.get("deferred", 0),
+        "seconds": report.get("seconds", 0.0) + batch_report["seconds"],
+        "fuzzy_resolutions": report.get("fuzzy_resolutions", 0)
+        + batch_report["fuzzy_resolutions"],
+    }
+    for counter in _COUNTERS:
+        merged[counter] = dict(
+            Counter(report.get(counter) or {}) + Counter(batch_report[counter])
+        )
+    merged["unresolved"] = dict(
+        Counter(merged["unresolved"]).most_common(DEFAULT_REPORT_UNRESOLVED_KEPT)
+    )
+
+    # derived values
+    merged["records_per_second"] = (
+        round(merged["records"] / merged["seconds"], 2) if merged["seconds"] else None
+    )
+    merged["hit_ratios"] = {
+        kind: round(merged["cache_hits"].get(kind, 0) / count, 4)
+        for kind, count in sorted(merged["lookups"].items())
+        if count
+    }
+    merged["top_unresolved"] = Counter(merged["unresolved"]).most_common(
+        DEFAULT_REPORT_TOP_UNRESOLVED
+    )
+    return merged
+
+
+def write_report(report: Dict, directory, name) -> Path:
+    path = Path(directory) / f"{name}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return path
+
+
+class HarvestReport:
+    """
+    Report of a transformer. The statistics of each batch are merged into it, after the
+    last batch it is written to <directory>/<run id>.json and logged.
+    """
+
+    def __init__(self, directory, run_id=None):
+        self.directory = directory
+        self.run_id = run_id
+        self.report: Optional[Dict] = None
+        self._started = None
+
+    @contextmanager
+    def batch(self, batch, instrumentation):
+        """Collects the statistics of the batch transformed within the block."""
+        if self._started is None:
+            self._started = time.monotonic()
+        stats = None
+        try:
+            with instrumentation.batch_stats() as stats:
+                yield
+        finally:
+            if stats is not None:
+                self.add(batch, stats.report(batch.entries))
+
+    def add(self, batch, batch_report: Dict):
+        self.report = merge_reports(self.report, batch_report)
+        if not batch.last:
+            return
+        wall_seconds = time.monotonic() - self._started
+        self.report["wall_seconds"] = round(wall_seconds, 2)
+        self.report["wall_records_per_second"] = (
+            round(self.report["records"] / wall_seconds, 2)
+            if wall_seconds > 0
+            else None
+        )
+        log.info(f"Harvest report: {json.dumps(self.report, ensure_ascii=False)}")
+        run_id = batch.context.get("run_id") or self.run_id or "unknown"
+        try:
+            write_report(self.report, self.directory, run_id)
+        except Exception as e:
+            log.error(f"Could not write the harvest report of run {run_id}: {e}")
@@ -0,0 +1,235 @@
+"""
+Persistent queue of entries deferred by the NUSL transformer because a lookup was
+unavailable (see guard.is_deferred). The entries are appended with their raw data
+(as received by the NUSL transformer) and context to a json lines file per harvester,
+`invenio nusl retry <code>` later feeds just these entries to the NUSL transformer
+and the rest of the harvester's pipeline, so that a partial outage does not need
+a full re-harvest.
+"""
+
+import datetime
+import fcntl
+import json
+import logging
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from oarepo_runtime.datastreams import BaseReader, StreamEntry
+
+from nr_oaipmh_harvesters.readers.oai_zstd import decode_record, encode_record
+
+log = logging.getLogger("oaipmh.harvester")
+
+# directory of the queues if NUSL_RETRY_QUEUE_DIR is not set, relative to the instance path
+DEFAULT_RETRY_QUEUE_DIR = "nusl-retry-queue"
+
+# context key with the number of times the entry has been deferred
+RETRY_ATTEMPTS_KEY = "nusl_retry_attempts"
+
+# entries deferred more times are not queued again
+DEFAULT_RETRY_MAX_ATTEMPTS = 5
+
+# context key with the original data of the queued entry - the retry run sets original_data
+# from the queued (already parsed) entry, the NUSL transformer puts this one back
+RETRY_ORIGINAL_DATA_KEY = "nusl_retry_original_data"
+
+
+def retry_queue_dir() -> Path:
+    from flask import current_app
+
+    return Path(current_app.instance_path) / (
+        current_app.config.get("NUSL_RETRY_QUEUE_DIR") or DEFAULT_RETRY_QUEUE_DIR
+    )
+
+
+class RetryQueue:
+    """
+    Queue of a harvester. Entries taken for a retry are moved to a separate file
+    and removed only after the retry has finished, entries deferred again
+    during the retry are appended to the queue.
+    """
+
+    def __init__(self, directory, harvester_code):
+        self.directory = Path(directory)
+        self.path = self.directory / f"{harvester_code}.jsonl"
+        self.taken_path = self.directory / f"{harvester_code}.retrying.jsonl"
+        self.lock_path = self.directory / f"{harvester_code}.lock"
+
+    @contextmanager
+    def _locked(self):
+        # the queue is shared by all workers of the harvest
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def push(self, items: List[Dict]) -> None:
+        if not items:
+            return
+        with self._locked(), open(self.path, "a") as f:
+            for item in items:
+                f.write(encode_record(item))
+                f.write("\n")
+
+    def take(self) -> Optional[Path]:
+        """Moves the queued entries to the taken file and returns it, None if it is empty."""
+        with self._locked():
+            if self.path.exists():
+                if self.taken_path.exists():
+                    # the previous retry has not finished, its entries are retried as well
+                    with open(self.taken_path, "a") as taken, open(self.path) as queued:
+                        shutil.copyfileobj(queued, taken)
+                    self.path.unlink()
+                else:
+                    self.path.rename(self.taken_path)
+        return self.taken_path if self.taken_path.exists() else None
+
+    def done(self) -> None:
+        """Removes the taken entries after a finished retry."""
+        with self._locked():
+            if self.taken_path.exists():
+                self.taken_path.unlink()
+
+    def __len__(self) -> int:
+        if not self.path.exists():
+            return 0
+        with open(self.path) as f:
+            return sum(1 for _ in f)
+
+
+def deferred_item(entry: StreamEntry, raw, harvester_code, run_id) -> Dict:
+    """Queue item of an entry deferred by the NUSL transformer, raw is its input data."""
+    # marcxml_parsed is the raw data itself, it is not stored twice
+    context = {
+        k: v
+        for k, v in entry.context.items()
+        if v is not raw and k not in ("original_data", RETRY_ORIGINAL_DATA_KEY)
+    }
+    original_data = entry.context.get("original_data")
+    if original_data is not None:
+        context[RETRY_ORIGINAL_DATA_KEY] = original_data
+    attempts = context.get(RETRY_ATTEMPTS_KEY, 0) + 1
+    return {
+        "id": entry.id,
+        "harvester": harvester_code,
+        "run_id": run_id,
+        "deferred": datetime.datetime.utcnow().isoformat(),
+        "attempts": attempts,
+        "errors": [error.json for error in entry.errors],
+        "entry": raw,
+        "context": {**context, RETRY_ATTEMPTS_KEY: attempts},
+    }
+
+
+class RetryQueueReader(BaseReader):
+    """Reads the entries taken from the queue, used by retry_deferred as the loader."""
+
+    def __init__(
+        self,
+        *,
+        path=None,
+        oai_run=None,
+        oai_harvester_id=None,
+        manual=False,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.path = path
+        self.oai_run = oai_run
+        self.oai_harvester_id = oai_harvester_id
+        self.manual = manual
+
+    def __iter__(self) -> Iterator[StreamEntry]:
+        with open(self.path) as f:
+            for line in f:
+                item = decode_record(line)
+                yield StreamEntry(
+                    item["entry"],
+                    id=item.get("id"),
+                    context={
+                        **item["context"],
+                        "oai_run": self.oai_run,
+                        "oai_harvester_id": self.oai_harvester_id,
+                        "manual": self.manual,
+                    },
+                )
+
+
+def _get_harvester(harvester_code) -> Dict:
+    from invenio_access.permissions import system_identity
+    from oarepo_oaipmh_harvester.oai_harvester.proxies import current_service
+
+    harvesters = list(
+        current_service.scan(
+            system_identity, params={"facets": {"code": [harvester_code]}}
+        )
+    )
+    if not harvesters:
+        raise KeyError(f"Harvester '{harvester_code}' has not been found")
+    harvester = harvesters[0]
+    return dict(harvester.data if hasattr(harvester, "data") else harvester)
+
+
+def _nusl_transformers(transformers: List[str]) -> List[str]:
+    """The NUSL transformer of the pipeline and the transformers after it."""
+    from flask import current_app
+
+    from nr_oaipmh_harvesters.nusl.transformer import NUSLTransformer
+
+    registered = current_app.config["DATASTREAMS_TRANSFORMERS"]
+    for idx, transformer in enumerate(transformers):
+        transformer_class = registered.get(transformer.split("{", 1)[0])
+        if isinstance(transformer_class, type) and issubclass(
+            transformer_class, NUSLTransformer
+        ):
+            return transformers[idx:]
+    raise ValueError("The harvester does not use a NUSL transformer")
+
+
+def restore_original_data(entry: StreamEntry) -> None:
+    """Puts back the original data of an entry read from the retry queue."""
+    if RETRY_ORIGINAL_DATA_KEY in entry.context:
+        entry.context["original_data"] = entry.context.pop(RETRY_ORIGINAL_DATA_KEY)
+
+
+def retry_deferred(harvester_code) -> Optional[str]:
+    """
+    Runs the queued entries of the harvester through its NUSL transformer, the following
+    transformers and the writers as a manual harvest run. The entries are removed from
+    the queue when the run has finished, returns the id of the run.
+    """
+    from oarepo_oaipmh_harvester.harvester import harvest
+    from oarepo_oaipmh_harvester.models import OAIHarvesterRun
+
+    harvester = _get_harvester(harvester_code)
+    transformers = _nusl_transformers(harvester["transformers"])
+
+    queue = RetryQueue(retry_queue_dir(), harvester_code)
+    path = queue.take()
+    if path is None:
+        log.info(f"No deferred entries of harvester {harvester_code}")
+        return None
+
+    run_id = harvest(
+        {
+            **harvester,
+            "loader": f"nusl_retry_queue{{path={json.dumps(str(path))}}}",
+            "transformers": transformers,
+        },
+        manual=True,
+        title="Retry of deferred records",
+    )
+    run = OAIHarvesterRun.query.get(run_id)
+    if run.status == "failed":
+        log.error(
+            f"Retry run {run_id} of harvester {harvester_code} failed, "
+            f"the deferred entries are kept in {path}"
+        )
+    else:
+        queue.done()
+    return str(run_id)
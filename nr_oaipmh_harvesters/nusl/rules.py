@@ -0,0 +1,107 @@
+import functools
+from typing import Any, Dict, Hashable, List, Sequence
+
+from oarepo_oaipmh_harvester.transformers import rule
+from oarepo_runtime.datastreams.types import StreamEntryError
+
+
+class RuleError(Exception):
+    """
+    Failure of a rule on a single value of the entry. The original exception
+    is kept as the cause.
+    """
+
+    def __init__(self, rule_name: str, tags: Sequence[str], value: Any):
+        super().__init__(f"Rule {rule_name} failed on {tags}: {value!r}")
+        self.rule_name = rule_name
+        self.tags = list(tags)
+        self.value = value
+
+    @property
+    def info(self) -> Dict[str, Any]:
+        return {
+            "rule": self.rule_name,
+            "tags": self.tags,
+            "value": _json_value(self.value),
+        }
+
+    def stream_error(self) -> StreamEntryError:
+        return StreamEntryError.from_exception(
+            self.__cause__, location=self.rule_name, info=self.info
+        )
+
+
+def matches(*tags, **kwargs):
+    """The same as rule.matches, a failure of the rule is raised as RuleError."""
+
+    def wrapper(f):
+        return rule.matches(*tags, **kwargs)(_raise_rule_error(f, tags))
+
+    return wrapper
+
+
+def matches_grouped(*tags, **kwargs):
+    """The same as rule.matches_grouped, a failure of the rule is raised as RuleError."""
+
+    def wrapper(f):
+        return rule.matches_grouped(*tags, **kwargs)(_raise_rule_error(f, tags))
+
+    return wrapper
+
+
+def _raise_rule_error(f, tags):
+    @functools.wraps(f)
+    def wrapped(md, entry, value):
+        try:
+            return f(md, entry, value)
+        except RuleError:
+            raise
+        except Exception as e:
+            raise RuleError(f.__name__, tags, value) from e
+
+    return wrapped
+
+
+def deduplicate(md: Dict[str, Any], what: str):
+    """
+    Removes duplicates from the list md[what] in place, the first occurrence is kept.
+    Items are compared as by the generic rule.deduplicate (by their json), but by
+    a hashable key instead of comparing every pair of the serialized items.
+    """
+    items = md.get(what)
+    if not items:
+        return
+    seen = set()
+    unique = []
+    for item in items:
+        key = hashable_key(item)
+        if key not in seen:
+            seen.add(key)
+            unique.append(item)
+    if len(unique) != len(items):
+        items[:] = unique
+
+
+def hashable_key(value) -> Hashable:
+    """Key of a json-like value, equal for values with the same json serialization."""
+    if isinstance(value, dict):
+        return (dict, frozenset((k, hashable_key(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return (list, tuple(hashable_key(x) for x in value))
+    if isinstance(value, str):
+        return value
+    # 1, 1.0 and True are equal in python, but not in json
+    return (type(value), value)
+
+
+def split_keywords(value: str) -> List[str]:
+    """Keywords separated by "|", empty and repeated keywords are left out."""
+    return list(dict.fromkeys(v for v in (x.strip() for x in value.split("|")) if v))
+
+
+def _json_value(value):
+    if isinstance(value, (list, tuple)):
+        return [_json_value(x) for x in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
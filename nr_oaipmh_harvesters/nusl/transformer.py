@@ -1,99 +1,418 @@
+import copy
 import itertools
 import logging
 import re
-from datetime import datetime
+import tempfile
+import threading
+import time
+from contextlib import ExitStack, contextmanager
 from typing import Dict, List, Optional, Tuple
 from urllib.parse import unquote
 
 import Levenshtein
-import pycountry
 import sqlalchemy
+from flask import current_app
 from invenio_cache.proxies import current_cache
 from invenio_search.engine import dsl
-from oarepo_oaipmh_harvester.transformers.rule import (
-    OAIRuleTransformer,
+from oarepo_oaipmh_harvester.transformers.rule import OAIRuleTransformer, ignore
+from oarepo_runtime.datastreams.types import (
+    StreamBatch,
+    StreamEntry,
+    StreamEntryError,
+    StreamEntryFile,
+)
+
+from nr_oaipmh_harvesters.nusl.bloom import BloomFilter
+from nr_oaipmh_harvesters.nusl.compact_vocabulary import CompactVocabulary
+from nr_oaipmh_harvesters.nusl.converters import (
+    _create_identifier_object,
+    abstract,
+    accessibility,
+    catalogue_sysno_identifier,
+    certified_methodology,
+    convert_to_date,
+    czech_keywords,
+    date_issued,
+    defended,
+    english_keywords,
+    english_subtitle,
+    get_alpha2_lang,
+    isbn_identifier,
+    issn_identifier,
+    language,
+    nusl_identifier,
+    original_record_oai_identifier,
+    related_item,
+    rights_id,
+    series,
+    study_fields,
+    subject,
+    translated_title,
+)
+from nr_oaipmh_harvesters.nusl.dry_run import DryRunLookups
+from nr_oaipmh_harvesters.nusl.guard import (
+    DEFAULT_BREAKER_FAILURES,
+    DEFAULT_BREAKER_RESET,
+    LookupUnavailable,
+    VocabularyNotLoaded,
+    get_lookup_guard,
+    is_deferred,
+    is_transient_error,
+    parse_lookup_timeouts,
+)
+from nr_oaipmh_harvesters.nusl.institution_overrides import (
+    institution_lookup_log_message,
+    load_institution_overrides,
+    normalize_institution,
+)
+from nr_oaipmh_harvesters.nusl.instrumentation import (
+    Instrumentation,
+    count_cache_hit,
+    count_fuzzy_resolution,
+    count_lookup,
+    count_search,
+    record_fuzzy_resolution,
+    record_rule_time,
+    record_unresolved_institution,
+)
+from nr_oaipmh_harvesters.nusl.lookups import (
+    LookupContext,
+    LookupHook,
+    current_lookups,
+    guarded,
+    lookup,
+)
+from nr_oaipmh_harvesters.nusl.memo import BoundedMemo
+from nr_oaipmh_harvesters.nusl.memory import DEFAULT_MEMORY_TOP, MemoryTracker
+from nr_oaipmh_harvesters.nusl.profiler import DEFAULT_PROFILE_TOP, BatchProfiler
+from nr_oaipmh_harvesters.nusl.replay import RecordingLookups, ReplayLookups
+from nr_oaipmh_harvesters.nusl.report import DEFAULT_REPORT_DIR, HarvestReport
+from nr_oaipmh_harvesters.nusl.retry_queue import (
+    DEFAULT_RETRY_MAX_ATTEMPTS,
+    RetryQueue,
+    deferred_item,
+    restore_original_data,
+    retry_queue_dir,
+)
+from nr_oaipmh_harvesters.nusl.rules import (
+    RuleError,
     deduplicate,
-    ignore,
-    make_array,
-    make_dict,
     matches,
     matches_grouped,
 )
-from oarepo_runtime.datastreams.types import StreamEntry, StreamEntryFile
-
 from nr_oaipmh_harvesters.nusl.temp_institutions import TEMP_INSTITUTIONS
 
 log = logging.getLogger("oaipmh.harvester")
 
-# will increase this in production
-DEFAULT_VOCABULARY_CACHE_TTL = 3600
+# cached vocabularies are invalidated by their version fingerprint, the ttl is just a safety net
+DEFAULT_VOCABULARY_CACHE_TTL = 7 * 24 * 3600
+
+# institutions that could not be resolved are cached just for a short time, so that they
+# are resolved again soon after e.g. a fix of the fuzzy matching, not after a week
+DEFAULT_UNRESOLVED_INSTITUTION_TTL = 3600
+
+# how often (in seconds) the version fingerprint of a vocabulary is checked
+DEFAULT_VOCABULARY_VERSION_CHECK_INTERVAL = 300
 
+# max number of resolved creators/contributors remembered within a batch
+DEFAULT_CREATIBUTOR_MEMO_SIZE = 10000
 
-def get_alpha2_lang(lang):
-    py_lang = pycountry.languages.get(alpha_3=lang) or pycountry.languages.get(
-        bibliographic=lang
+# the names bloom filter is sized for twice the number of names, but at least this number
+DEFAULT_NAMES_FILTER_MIN_CAPACITY = 100000
+
+# seconds after a failed build of the names filter before it is built again,
+# the names are searched without the filter in between
+DEFAULT_NAMES_FILTER_RETRY = 300
+
+# records whose transformation takes longer (in seconds) are logged with a cost breakdown
+DEFAULT_SLOW_RECORD_THRESHOLD = 5
+
+# profiles are written to <dir>/<harvester code>/<run id>/
+DEFAULT_PROFILE_DIR = f"{tempfile.gettempdir()}/nusl-profiles"
+
+
+def _flag(value) -> bool:
+    """Boolean option of the transformer, given as a string in the harvester config."""
+    return value not in (False, None, "false", "0")
+
+
+def _lookup_hook(
+    dry_run, dry_run_keys, record_lookups, replay_lookups, replay_latency
+) -> Optional[LookupHook]:
+    """Hook of the external lookups - dry run stubs, recording or replay."""
+    dry_run = _flag(dry_run)
+    if sum(bool(x) for x in (dry_run, record_lookups, replay_lookups)) > 1:
+        raise ValueError(
+            "Only one of dry_run, record_lookups and replay_lookups can be set"
+        )
+    if dry_run:
+        return DryRunLookups(keys_path=dry_run_keys)
+    if record_lookups:
+        return RecordingLookups(record_lookups)
+    if replay_lookups:
+        return ReplayLookups(replay_lookups, latency=_flag(replay_latency))
+    return None
+
+
+def _institution_ttl(resolved) -> int:
+    return (
+        DEFAULT_VOCABULARY_CACHE_TTL if resolved else DEFAULT_UNRESOLVED_INSTITUTION_TTL
     )
-    if not py_lang:
-        raise LookupError()
-    return py_lang.alpha_2
+
+
+def per_batch_cache_sizes() -> Dict[str, int]:
+    return {**vocabulary_cache.sizes(), "creatibutor_memo": len(creatibutor_memo)}
+
+
+@contextmanager
+def per_batch_caches():
+    """Clears the caches that are valid just for the batch transformed within the block."""
+    try:
+        yield
+    finally:
+        vocabulary_cache.clear_prefetched_institutions()
+        log.debug(f"Creator/contributor memo: {creatibutor_memo.stats()}")
+        creatibutor_memo.clear()
 
 
 class NUSLTransformer(OAIRuleTransformer):
+    def __init__(
+        self,
+        *args,
+        slow_record_threshold=DEFAULT_SLOW_RECORD_THRESHOLD,
+        profile_every=None,
+        profile_records=None,
+        profile_dir=DEFAULT_PROFILE_DIR,
+        profile_top=DEFAULT_PROFILE_TOP,
+        memory_every=None,
+        memory_top=DEFAULT_MEMORY_TOP,
+        memory_limit=None,
+        cache_limit=None,
+        harvest_report=False,
+        report_dir=DEFAULT_REPORT_DIR,
+        dry_run=False,
+        dry_run_keys=None,
+        record_lookups=None,
+        replay_lookups=None,
+        replay_latency=False,
+        guard_lookups=False,
+        lookup_timeouts=None,
+        breaker_failures=DEFAULT_BREAKER_FAILURES,
+        breaker_reset=DEFAULT_BREAKER_RESET,
+        retry_queue=False,
+        retry_max_attempts=DEFAULT_RETRY_MAX_ATTEMPTS,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.harvester_code = (kwargs.get("oai_config") or {}).get("code", "unknown")
+        self.run_id = kwargs.get("oai_run")
+        # per-entry profiles (slow record log) and per-batch statistics
+        self.instrumentation = Instrumentation(
+            float(slow_record_threshold) if slow_record_threshold is not None else None
+        )
+        # sampling profiler - every n-th batch and/or a percentage of records
+        self.profiler = None
+        if profile_every or profile_records:
+            self.profiler = BatchProfiler(
+                f"{profile_dir}/{self.harvester_code}/{self.run_id or 'unknown'}",
+                every=int(profile_every) if profile_every else None,
+                records=float(profile_records) if profile_records else None,
+                top=int(profile_top),
+            )
+        # memory growth tracking - tracemalloc snapshot after every n-th batch
+        self.memory_tracker = None
+        if memory_every:
+            self.memory_tracker = MemoryTracker(
+                every=int(memory_every),
+                top=int(memory_top),
+                limit_mb=float(memory_limit) if memory_limit else None,
+                cache_limit=int(cache_limit) if cache_limit else None,
+            )
+        # end-of-harvest report, merged from the statistics of the batches
+        self.report = None
+        if _flag(harvest_report):
+            self.report = HarvestReport(
+                f"{report_dir}/{self.harvester_code}", self.run_id
+            )
+        self.lookups = _lookup_hook(
+            dry_run, dry_run_keys, record_lookups, replay_lookups, replay_latency
+        )
+        # degraded mode - lookups limited by timeouts and circuit breakers, entries
+        # whose lookups are unavailable are deferred
+        self.guard = None
+        if _flag(guard_lookups):
+            self.guard = get_lookup_guard(
+                parse_lookup_timeouts(lookup_timeouts),
+                int(breaker_failures),
+                float(breaker_reset),
+            )
+        # the rules find the hook and the guard through the context while a batch is transformed
+        self.lookup_context = LookupContext(self.lookups, self.guard)
+        # deferred entries are queued for `invenio nusl retry`, off by default
+        self.retry_queue = _flag(retry_queue)
+        self.retry_max_attempts = int(retry_max_attempts)
+        self._retry_queue = None
+
+    def apply(self, batch: StreamBatch, *args, **kwargs) -> StreamBatch:
+        # exited in the reverse order - the profile is written and the memory checked
+        # before the per-batch caches are cleared, the batch statistics include all of it
+        with ExitStack() as stack:
+            stack.enter_context(self.lookup_context.batch(batch))
+            stack.enter_context(self.instrumentation.active())
+            if self.report is not None:
+                stack.enter_context(self.report.batch(batch, self.instrumentation))
+            stack.enter_context(per_batch_caches())
+            if self.memory_tracker is not None:
+                stack.enter_context(
+                    self.memory_tracker.batch(batch.seq, per_batch_cache_sizes)
+                )
+            if self.profiler is not None:
+                stack.enter_context(self.profiler.batch(batch.seq))
+            return self.transform_batch(batch, *args, **kwargs)
+
+    def transform_batch(self, batch: StreamBatch, *args, **kwargs) -> StreamBatch:
+        for entry in batch.entries:
+            restore_original_data(entry)
+        if not (self.lookups and self.lookups.offline):
+            vocabulary_cache.warm_up()
+        try:
+            vocabulary_cache.prefetch_institutions(
+                _degree_grantor_names(batch.entries), vocab_type="degree-grantors"
+            )
+        except Exception as e:
+            # the institutions are looked up (and their entries deferred) one by one
+            log.warning(f"Could not prefetch institutions of the batch: {e}")
+        # entry.entry is replaced by the transformed record
+        raw_entries = [(entry, entry.entry) for entry in batch.entries]
+        batch = super().apply(batch, *args, **kwargs)
+        deferred = [(entry, raw) for entry, raw in raw_entries if is_deferred(entry)]
+        for entry, raw in deferred:
+            self.defer_entry(entry)
+        if deferred and self.retry_queue:
+            self.queue_deferred(deferred)
+        return batch
+
+    def defer_entry(self, entry: StreamEntry):
+        """
+        Called for entries that failed because a lookup was unavailable. The entry keeps
+        its errors, so it is not written.
+        """
+        oai = entry.context.get("oai") or {}
+        log.warning(
+            f"Entry {oai.get('identifier') or entry.id} deferred, lookup unavailable"
+        )
+
+    def queue_deferred(self, deferred: List[Tuple[StreamEntry, Dict]]):
+        """Appends the deferred entries with their raw data to the retry queue."""
+        items = []
+        for entry, raw in deferred:
+            item = deferred_item(entry, raw, self.harvester_code, self.run_id)
+            if item["attempts"] > self.retry_max_attempts:
+                oai = entry.context.get("oai") or {}
+                log.error(
+                    f"Entry {oai.get('identifier') or entry.id} deferred "
+                    f"{item['attempts']} times, not queued for a retry again"
+                )
+                continue
+            items.append(item)
+        try:
+            if self._retry_queue is None:
+                self._retry_queue = RetryQueue(retry_queue_dir(), self.harvester_code)
+            self._retry_queue.push(items)
+        except Exception as e:
+            log.error(f"Could not queue {len(items)} deferred entries: {e}")
+
+    def begin_entry(self):
+        """Starts instrumentation of an entry, the returned state is passed to end_entry."""
+        sampled = self.profiler.begin_entry() if self.profiler is not None else False
+        return self.instrumentation.begin_entry(), sampled
+
+    def end_entry(self, state, entry: StreamEntry):
+        profile, sampled = state
+        if self.profiler is not None:
+            self.profiler.end_entry(sampled)
+        self.instrumentation.end_entry(profile, entry)
+
+    def apply_rule(self, rule, md, entry: StreamEntry):
+        """
+        Applies the rule, its failure is recorded as an error of the entry (located by
+        the rule name, with the MARC tags and the value in the info) and the next rules
+        are applied. Whatever the rule wrote to md before the failure is kept - the entry
+        is not written because of the error, but later rules and postprocess see it.
+        """
+        start = time.perf_counter()
+        try:
+            rule(md, entry)
+        except RuleError as e:
+            log.debug(f"Entry {entry.id}: {e}")
+            entry.errors.append(e.stream_error())
+        except Exception as e:
+            entry.errors.append(
+                StreamEntryError.from_exception(
+                    e, location=rule.__name__, info={"rule": rule.__name__}
+                )
+            )
+        finally:
+            record_rule_time(rule.__name__, time.perf_counter() - start)
+
     def transform(self, entry: StreamEntry):
+        state = self.begin_entry()
         md = entry.transformed.setdefault("metadata", {})
 
         entry.transformed.setdefault("files", {})["enabled"] = False
 
-        transform_001_control_number(md, entry)
-        transform_020_isbn(md, entry)
-        transform_022_issn(md, entry)
-        transform_035_original_record_oai(md, entry)
-        transform_046_date_modified(md, entry)
-        transform_046_date_issued(md, entry)
-        transform_245_title(md, entry)
-        transform_245_translated_title(md, entry)
-        transform_246_title_alternate(md, entry)
-        transform_24633a_subtitle(md, entry)
-        transform_24633b_subtitle(md, entry)
-        transform_260_publisher(md, entry)
-        transform_490_series(md, entry)
-        transform_520_abstract(md, entry)
-        transform_598_note(md, entry)
-        transform_65007_subject(md, entry)
-        transform_65017_subject(md, entry)
-        transform_650_7_subject(md, entry)
-        transform_6530_en_keywords(md, entry)
-        transform_653_cs_keywords(md, entry)
-        transform_7112_event(md, entry)
-        transform_720_creator(md, entry)
-        transform_720_contributor(md, entry)
-        transform_7731_related_item(md, entry)
-        transform_85640_original_record_url(md, entry)
-        transform_85642_external_location(md, entry)
-        transform_970_catalogue_sysno(md, entry)
-        transform_980_resource_type(md, entry)
-        transform_996_accessibility(md, entry)
-        transform_999C1_funding_reference(md, entry)
-
-        transform_04107_language(md, entry)
-        transform_336_certifikovana_metodika(md, entry)
-
-        transform_540_rights(md, entry)
-
-        transform_oai_identifier(md, entry)
-
-        transform_502_degree_grantor(md, entry)
-        transform_7102_degree_grantor(md, entry)  # a a 9='cze'
-
-        transform_502_date_defended(md, entry)
-
-        transform_586_defended(md, entry)  # obhajeno == true
-        transform_656_study_field(md, entry)
-
-        transform_998_collection(md, entry)
-
-        transform_856_attachments(md, entry)
+        # a failing rule marks just this entry as failed, other rules and entries continue
+        for rule in (
+            transform_001_control_number,
+            transform_020_isbn,
+            transform_022_issn,
+            transform_035_original_record_oai,
+            transform_046_date_modified,
+            transform_046_date_issued,
+            transform_245_title,
+            transform_245_translated_title,
+            transform_246_title_alternate,
+            transform_24633a_subtitle,
+            transform_24633b_subtitle,
+            transform_260_publisher,
+            transform_490_series,
+            transform_520_abstract,
+            transform_598_note,
+            transform_65007_subject,
+            transform_65017_subject,
+            transform_650_7_subject,
+            transform_6530_en_keywords,
+            transform_653_cs_keywords,
+            transform_7112_event,
+            transform_720_creator,
+            transform_720_contributor,
+            transform_7731_related_item,
+            transform_85640_original_record_url,
+            transform_85642_external_location,
+            transform_970_catalogue_sysno,
+            transform_980_resource_type,
+            transform_996_accessibility,
+            transform_999C1_funding_reference,
+            transform_04107_language,
+            transform_336_certifikovana_metodika,
+            transform_540_rights,
+            transform_oai_identifier,
+            transform_502_degree_grantor,
+            transform_7102_degree_grantor,  # a a 9='cze'
+            transform_502_date_defended,
+            transform_586_defended,  # obhajeno == true
+            transform_656_study_field,
+            transform_998_collection,
+            transform_856_attachments,
+        ):
+            self.apply_rule(rule, md, entry)
+
+        self.postprocess(md, entry)
+        self.end_entry(state, entry)
+        return True
 
+    def postprocess(self, md, entry: StreamEntry):
+        """Called after all rules have been applied to the entry."""
         deduplicate(md, "languages")
         deduplicate(md, "contributors")
         deduplicate(md, "subjects")
@@ -161,37 +480,25 @@ class NUSLTransformer(OAIRuleTransformer):
         #
         # ignore(entry, "24630a")  # "ročník 8, číslo 1",
 
-        return True
-
 
 @matches("001")
 def transform_001_control_number(md, entry, value):
-    md.setdefault("systemIdentifiers", []).append(
-        _create_identifier_object("nusl", "http://www.nusl.cz/ntk/nusl-" + value)
-    )
+    md.setdefault("systemIdentifiers", []).append(nusl_identifier(value))
 
 
 @matches("020__a")
 def transform_020_isbn(md, entry, value):
-    identifiers = []
-    parse_isbn(value, identifiers)
-
-    md.setdefault("objectIdentifiers", []).append(identifiers[0])
+    md.setdefault("objectIdentifiers", []).append(isbn_identifier(value))
 
 
 @matches("022__a")
 def transform_022_issn(md, entry, value):
-    identifiers = []
-    parse_issn(value, identifiers)
-
-    md.setdefault("objectIdentifiers", []).append(identifiers[0])
+    md.setdefault("objectIdentifiers", []).append(issn_identifier(value))
 
 
 @matches("035__a")
 def transform_035_original_record_oai(md, entry, value):
-    md.setdefault("systemIdentifiers", []).append(
-        _create_identifier_object("originalRecordOAI", value)
-    )
+    md.setdefault("systemIdentifiers", []).append(original_record_oai_identifier(value))
 
 
 @matches("046__j")
@@ -201,28 +508,7 @@ def transform_046_date_modified(md, entry, value):
 
 @matches("046__k")
 def transform_046_date_issued(md, entry, value):
-    if value.startswith("c"):
-        value = value[1:]
-
-    if len(value) == 8 and all(c.isdigit() for c in value):
-        # iso 8601 date formats, e. g., YYYY-MM-DD or DD-MM-YYYY
-        def is_valid_date(date_str, date_format):
-            try:
-                datetime.strptime(date_str, date_format)
-                return True
-            except ValueError:
-                return False
-
-        if is_valid_date(value, "%Y%m%d"):
-            md["dateIssued"] = value[:4]
-            return
-
-        if is_valid_date(value, "%d%m%Y") or is_valid_date(value, "%m%d%Y"):
-            md["dateIssued"] = value[-4:]
-            return
-
-    date_issued = convert_to_date(value)
-    md["dateIssued"] = date_issued
+    md["dateIssued"] = date_issued(value)
 
 
 @matches("24500a")
@@ -232,9 +518,7 @@ def transform_245_title(md, entry, value):
 
 @matches("24500b")
 def transform_245_translated_title(md, entry, value):
-    md.setdefault("additionalTitles", []).append(
-        {"title": {"lang": "en", "value": value}, "titleType": "translatedTitle"}
-    )
+    md.setdefault("additionalTitles", []).append(translated_title(value))
 
 
 @matches("24630n", "24630p")
@@ -249,9 +533,7 @@ def transform_24633a_subtitle(md, entry, val):
 
 @matches("24633b")
 def transform_24633b_subtitle(md, entry, val):
-    md.setdefault("additionalTitles", []).append(
-        {"title": {"lang": "en", "value": val}, "titleType": "subtitle"}
-    )
+    md.setdefault("additionalTitles", []).append(english_subtitle(val))
 
 
 @matches("260__b")
@@ -261,24 +543,12 @@ def transform_260_publisher(md, entry, val):
 
 @matches("4900_a", "4900_v", paired=True)
 def transform_490_series(md, entry, value):
-    md.setdefault("series", []).append(
-        make_dict("seriesTitle", value[0], "seriesVolume", value[1])
-    )
+    md.setdefault("series", []).append(series(value))
 
 
 @matches("520__a", "520__9", paired=True)
 def transform_520_abstract(md, entry, value):
-    try:
-        md.setdefault("abstract", []).append(
-            {"lang": get_alpha2_lang(value[1]), "value": value[0]}
-        )
-    except LookupError:
-        md.setdefault("abstract", []).append(
-            {
-                "lang": value[1] or "cs",
-                "value": value[0],
-            }  # marshmallow will take care of that
-        )
+    md.setdefault("abstract", []).append(abstract(value))
 
 
 @matches("598__a")
@@ -302,60 +572,21 @@ def transform_650_7_subject(md, entry, value):
 
 
 def transform_subject(md, value):
-    if all(not v for v in value):
-        return
-
-    purl = value[3] or ""
-    val_url = (
-        purl if purl.startswith("http://") or purl.startswith("https://") else None
-    )
-    class_code = value[4] if len(value) > 4 else None
-    if not class_code and not (
-        purl.startswith("http://") or purl.startswith("https://")
-    ):
-        class_code = purl
-
-    md.setdefault("subjects", []).append(
-        make_dict(
-            "subjectScheme",
-            value[2],
-            "classificationCode",
-            class_code,
-            "valueURI",
-            val_url,
-            "subject",
-            make_array(
-                value[0],
-                lambda: {"lang": "cs", "value": value[0]},
-                value[1],
-                lambda: {"lang": "en", "value": value[1]},
-            ),
-        )
-    )
+    converted = subject(value)
+    if converted is not None:
+        md.setdefault("subjects", []).append(converted)
 
 
 @matches("6530_a")
 def transform_6530_en_keywords(md, entry, value):
-    # splitnout take na carce
-    for v in value.split("|"):
-        v = v.strip()
-        if not v:
-            continue
-        md.setdefault("subjects", []).append(
-            {"subjectScheme": "keyword", "subject": [{"lang": "en", "value": v}]}
-        )
+    for subject in english_keywords(value):
+        md.setdefault("subjects", []).append(subject)
 
 
 @matches("653__a")
 def transform_653_cs_keywords(md, entry, value):
-    # splitnout take na carce
-    for v in value.split("|"):
-        v = v.strip()
-        if not v:
-            continue
-        md.setdefault("subjects", []).append(
-            {"subjectScheme": "keyword", "subject": [{"lang": "cs", "value": v}]}
-        )
+    for subject in czech_keywords(value):
+        md.setdefault("subjects", []).append(subject)
 
 
 @matches("7112_a", "7112_c", "7112_d", "7112_g", paired=True)
@@ -418,67 +649,20 @@ def transform_720_creator(md: Dict, entry: Dict, value: Tuple) -> None:
 
     name, affiliations, identifiers = value
 
-    name_type = None
-    processed_affiliations = []
-    authority_identifiers = []
-
     if affiliations:
         affiliations = [affiliations] if isinstance(affiliations, str) else affiliations
         affiliations = [aff for aff in affiliations if aff]
-        processed_affiliations = _process_affiliations_temp(affiliations)
     if identifiers:
         identifiers = [identifiers] if isinstance(identifiers, str) else identifiers
         identifiers = [idf for idf in identifiers if idf]
-        authority_identifiers = [
-            _create_identifier_object(*_parse_identifier(idf))
-            for idf in identifiers
-            if idf
-        ]
 
-    ror = [] if not identifiers else [idf for idf in identifiers if "ror" in idf]
-    ico = (
-        []
-        if not identifiers
-        else [idf.split(" ")[-1] for idf in identifiers if "ico" in idf.lower()]
+    processed_affiliations, person_or_org = _resolve_creatibutor(
+        name, affiliations, identifiers, value
     )
-    institution_was_found, institution = _find_institution_in_temp(
-        name, None if not ror else ror[0], None if not ico else ico[0]
-    )
-    if institution_was_found:
-        name_type = "organizational"
-        name = institution["name"]
-    elif not ror:
-        creatibutor_was_found, _ = _find_creatibutor(authority_identifiers)
-        if creatibutor_was_found:
-            name_type = "personal"
-
-    if not name_type and identifiers:
-        raise ValueError(
-            f"Can not automatically decide 'personal'/'organizational': {value}. Add to vocabulary then."
-        )
-
-    if not name_type and not identifiers:
-        # Should be marked as deprecated and inserted into its particular vocabulary.
-        # Currently we do not have tags in vocabularies so just add without insertion.
-        log.warning(f"{value[0]} marked as personal")
-        name_type = "personal"
-
     creator = {
         "affiliations": processed_affiliations,
-        "person_or_org": {
-            "name": name,
-            "type": name_type,
-            "identifiers": authority_identifiers,
-        },
+        "person_or_org": person_or_org,
     }
-    if name_type == "personal":
-        given_name, family_name = _parse_personal_name(name)
-        creator["person_or_org"].update(
-            {
-                "given_name": given_name,
-                "family_name": family_name,
-            }
-        )
 
     md.setdefault("creators", []).append(creator)
 
@@ -492,29 +676,51 @@ def transform_720_contributor(md: Dict, entry: Dict, value: Tuple) -> None:
 
     name, role, affiliations, identifiers = value
 
+    role_from_vocab = {"id": vocabulary_cache.contributor_role(role)}
+
+    if affiliations:
+        affiliations = [affiliations] if isinstance(affiliations, str) else affiliations
+    if identifiers:
+        identifiers = [identifiers] if isinstance(identifiers, str) else identifiers
+
+    processed_affiliations, person_or_org = _resolve_creatibutor(
+        name, affiliations, identifiers, value
+    )
+    contributor = {
+        "role": role_from_vocab,
+        "affiliations": processed_affiliations,
+        "person_or_org": person_or_org,
+    }
+
+    md.setdefault("contributors", []).append(contributor)
+
+
+def _resolve_creatibutor(name, affiliations, identifiers, value):
+    """
+    Returns (affiliations, person_or_org) of a creator/contributor. The same person with
+    the same affiliations and identifiers repeats a lot within a batch (supervisors, referees),
+    so the result is memoized in creatibutor_memo, which is cleared for each batch.
+    """
+    key = (name, tuple(affiliations or ()), tuple(identifiers or ()))
+    count_lookup("creatibutor")
+    found, resolved = creatibutor_memo.get(key)
+    if found:
+        count_cache_hit("creatibutor")
+    else:
+        resolved = _do_resolve_creatibutor(name, affiliations, identifiers, value)
+        creatibutor_memo.set(key, resolved)
+    # records must not share the same instances
+    return copy.deepcopy(resolved)
+
+
+def _do_resolve_creatibutor(name, affiliations, identifiers, value):
     name_type = None
     processed_affiliations = []
     authority_identifiers = []
 
-    contributor_types = vocabulary_cache.by_id("contributor-types", "id", "title")
-    role_from_vocab = {"id": contributor_types["other"]["id"]}
-
-    if role:
-        for contributor_type in contributor_types.values():
-            if role in (
-                contributor_type["title"]["cs"],
-                contributor_type["title"]["en"],
-            ):
-                role_from_vocab["id"] = contributor_types[
-                    contributor_type["title"]["en"]
-                ]["id"]
-                break
-
     if affiliations:
-        affiliations = [affiliations] if isinstance(affiliations, str) else affiliations
         processed_affiliations = _process_affiliations_temp(affiliations)
     if identifiers:
-        identifiers = [identifiers] if isinstance(identifiers, str) else identifiers
         authority_identifiers = [
             _create_identifier_object(*_parse_identifier(idf))
             for idf in identifiers
@@ -549,81 +755,25 @@ def transform_720_contributor(md: Dict, entry: Dict, value: Tuple) -> None:
         log.warning(f"{value[0]} marked as personal")
         name_type = "personal"
 
-    contributor = {
-        "role": role_from_vocab,
-        "affiliations": processed_affiliations,
-        "person_or_org": {
-            "name": name,
-            "type": name_type,
-            "identifiers": authority_identifiers,
-        },
+    person_or_org = {
+        "name": name,
+        "type": name_type,
+        "identifiers": authority_identifiers,
     }
-
     if name_type == "personal":
         given_name, family_name = _parse_personal_name(name)
-        contributor["person_or_org"].update(
+        person_or_org.update(
             {
                 "given_name": given_name,
                 "family_name": family_name,
             }
         )
-
-    md.setdefault("contributors", []).append(contributor)
+    return processed_affiliations, person_or_org
 
 
 @matches("7731_e", "7731_f", "7731_g", "7731_z", "7731_t", "7731_x", paired=True)
 def transform_7731_related_item(md, entry, value):
-    item_year, item_volume, item_issue, item_pids_isbn, item_title, item_pids_issn = (
-        value
-    )
-
-    parsed = {
-        k: v
-        for k, v in {
-            "itemYear": item_year,
-            "itemVolume": item_volume,
-            "itemIssue": item_issue,
-        }.items()
-        if v
-    }
-
-    identifiers = []
-    if item_pids_isbn:
-        parse_isbn(item_pids_isbn, identifiers)
-    if item_pids_issn:
-        parse_issn(item_pids_issn, identifiers)
-
-    md.setdefault("relatedItems", []).append(
-        {
-            **make_dict("itemTitle", item_title, "itemPIDs", identifiers),
-            **parsed,
-        }
-    )
-
-
-def parse_issn(value, identifiers):
-    for vv in re.split("[,;]", value):
-        vv = vv.strip()
-        if vv.lower().startswith("issn:"):
-            vv = vv[5:].strip()
-        if vv.lower().startswith("issn"):
-            vv = vv[4:].strip()
-        vv = re.sub("[^a-zA-Z0-9-]", "", vv)
-        if not vv or vv == "N":
-            continue
-        identifiers.append(_create_identifier_object("ISSN", vv))
-
-
-def parse_isbn(value, identifiers):
-    for isbn in re.split("[,;]", value):
-        isbn = isbn.strip()
-        isbn = isbn.lower()
-        isbn = re.sub(r"\s*\([^)]*\)", "", isbn)
-        isbn = isbn.removeprefix("isbn:").removeprefix("isbn")
-        isbn = isbn.strip()
-
-        if isbn and isbn != "n":
-            identifiers.append(_create_identifier_object("ISBN", isbn))
+    md.setdefault("relatedItems", []).append(related_item(value))
 
 
 @matches("85640u", "85640z", paired=True)
@@ -654,9 +804,7 @@ def transform_85642_external_location(md, entry, value):
 
 @matches("970__a")
 def transform_970_catalogue_sysno(md, entry, value):
-    md.setdefault("systemIdentifiers", []).append(
-        _create_identifier_object("catalogueSysNo", value)
-    )
+    md.setdefault("systemIdentifiers", []).append(catalogue_sysno_identifier(value))
 
 
 @matches("980__a")
@@ -710,29 +858,37 @@ def transform_980_resource_type(md, entry, value):
 
 @matches("996__a", "996__b", "996__9", paired=True)
 def transform_996_accessibility(md, entry, value):
-    md["accessibility"] = make_array(
-        value[0],
-        {"lang": "cs", "value": value[0]},
-        value[1],
-        {"lang": "en", "value": value[1]},
+    md["accessibility"] = accessibility(value)
+
+
+def _search_award(project_id):
+    """Returns the award with the project id, raises IndexError if there is none."""
+    return lookup("award", project_id, resolve=lambda: _do_search_award(project_id))
+
+
+def _do_search_award(project_id):
+    from invenio_access.permissions import system_identity
+    from invenio_vocabularies.proxies import current_service
+
+    count_search("awards")
+    resp = current_service.search(
+        system_identity,
+        type="awards",
+        extra_filter=dsl.Q("term", number=project_id),
     )
+    return list(resp)[0]
 
 
 @matches("999C1a", "999C1b", paired=True)
 def transform_999C1_funding_reference(md, entry, val):
     project_id, funder = val
     if project_id:
-        from invenio_access.permissions import system_identity
-        from invenio_vocabularies.proxies import current_service
-
         matched_award = None
+        count_lookup("awards")
         try:
-            resp = current_service.search(
-                system_identity,
-                type="awards",
-                extra_filter=dsl.Q("term", number=project_id),
-            )
-            matched_award = list(resp)[0]
+            matched_award = _search_award(project_id)
+        except LookupUnavailable:
+            raise
         except Exception as e:
             if not funder:
                 raise KeyError(f"Project ID: '{project_id}' has not been found") from e
@@ -772,63 +928,24 @@ def transform_999C1_funding_reference(md, entry, val):
 
 @matches("04107a", "04107b")
 def transform_04107_language(md, entry, value):
-    try:
-        md.setdefault("languages", []).append({"id": get_alpha2_lang(value)})
-    except LookupError:
-        raise Exception(f"Bad language {value} - no alpha2 equivalent")
+    md.setdefault("languages", []).append(language(value))
 
 
 @matches("336__a")
 def transform_336_certifikovana_metodika(md, entry, value):
     md["resourceType"] = vocabulary_cache.by_id("resource-types")[
-        "certified-methodology"
+        certified_methodology(value)
     ]
 
 
 @matches("540__a", "540__9", paired=True)
 def transform_540_rights(md, entry, value):
-    if value[1] != "cze":
-        return
-    rights = value[0]
-    rights = parse_rights(value[0])
-    if rights:
+    right = rights_id(value)
+    if right:
+        rights = vocabulary_cache.by_id("rights", "id")[right]
         md.setdefault("rights", {}).update(rights)
 
 
-rights_dict = {
-    "Licence Creative Commons Uveďte autora 3.0 Česko": "CC-BY-CZ-3.0",
-    "Licence Creative Commons Uveďte autora-Neužívejte dílo komerčně 3.0 Česko": "CC-BY-NC-CZ-3.0",
-    "Licence Creative Commons Uveďte autora-Neužívejte dílo komerčně-Nezasahujte do díla 3.0 Česko": "CC-BY-NC-ND-CZ-3.0",
-    "Licence Creative Commons Uveďte autora-Neužívejte dílo komerčně-Zachovejte licenci 3.0 Česko": "CC-BY-NC-SA-CZ-3.0",
-    "Licence Creative Commons Uveďte autora-Nezasahujte do díla 3.0 Česko": "CC-BY-ND-CZ-3.0",
-    "Licence Creative Commons Uveďte autora-Zachovejte licenci 3.0 Česko": "CC-BY-SA-CZ-3.0",
-    "Licence Creative Commons Uveďte původ 4.0": "CC-BY-4.0",
-    "Licence Creative Commons Uveďte původ-Neužívejte komerčně-Nezpracovávejte 4.0": "CC-BY-NC-ND-4.0",
-    "Licence Creative Commons Uveďte původ-Neužívejte komerčně-Zachovejte licenci 4.0": "CC-BY-NC-SA-4.0",
-    "Licence Creative Commons Uveďte původ-Zachovejte licenci 4.0": "CC-BY-SA-4.0",
-    "Licence Creative Commons Uveďte původ-Nezpracovávejte 4.0": "CC-BY-ND-4.0",
-    "Licence Creative Commons Uveďte původ-Neužívejte komerčně 4.0": "CC-BY-NC-4.0",
-    "License: Creative Commons Attribution 4.0": "CC-BY-4.0",
-    "License: Creative Commons Attribution-NoDerivs 3.0 Czech Republic": "CC-BY-ND-CZ-3.0",
-    "License: Creative Commons Attribution-NoDerivs 4.0": "CC-BY-ND-4.0",
-    "License: Creative Commons Attribution-NonCommercial 3.0 Czech Republic": "CC-BY-NC-CZ-3.0",
-    "License: Creative Commons Attribution-NonCommercial 4.0": "CC-BY-NC-4.0",
-    "License: Creative Commons Attribution-NonCommercial-NoDerivs 3.0 Czech Republic": "CC-BY-NC-ND-CZ-3.0",
-    "License: Creative Commons Attribution-NonCommercial-NoDerivs 4.0": "CC-BY-NC-ND-4.0",
-    "License: Creative Commons Attribution-NonCommercial-ShareAlike 3.0 Czech Republic": "CC-BY-NC-SA-CZ-3.0",
-    "License: Creative Commons Attribution-NonCommercial-ShareAlike 4.0": "CC-BY-NC-SA-4.0",
-    "License: Creative Commons Attribution-ShareAlike 3.0 Czech Republic": "CC-BY-SA-CZ-3.0",
-    "License: Creative Commons Attribution-ShareAlike 4.0": "CC-BY-SA-4.0",
-}
-
-
-def parse_rights(text):
-    right = rights_dict.get(text)
-    if not right:
-        return None
-    return vocabulary_cache.by_id("rights", "id")[right]
-
-
 def transform_oai_identifier(md, entry):
     md.setdefault("systemIdentifiers", []).append(
         _create_identifier_object("nuslOAI", entry.context["oai"]["identifier"])
@@ -850,21 +967,14 @@ def transform_502_degree_grantor(md, entry, value):
 def transform_7102_degree_grantor(md, entry, value):
     if value[3] != "cze":
         return
-    degree_grantor = []
-    if value[0]:
-        degree_grantor.append(value[0])
-    if value[1]:
-        if value[1].startswith("Program "):
-            md.setdefault("thesis", {}).setdefault("studyFields", []).extend(
-                value[1][len("Program ") :]
-            )
-        else:
-            degree_grantor.append(value[1])
-    if value[2]:
-        degree_grantor.append(value[2])
+    if value[1] and value[1].startswith("Program "):
+        md.setdefault("thesis", {}).setdefault("studyFields", []).extend(
+            value[1][len("Program ") :]
+        )
+    degree_grantor = _7102_degree_grantor_name(value)
     if degree_grantor:
         degree_grantor = vocabulary_cache.get_institution(
-            ", ".join(degree_grantor), vocab_type="degree-grantors"
+            degree_grantor, vocab_type="degree-grantors"
         )
         if degree_grantor:
             md.setdefault("thesis", {}).setdefault("degreeGrantors", []).append(
@@ -872,17 +982,60 @@ def transform_7102_degree_grantor(md, entry, value):
             )
 
 
+def _7102_degree_grantor_name(value):
+    if value[3] != "cze":
+        return None
+    degree_grantor = []
+    if value[0]:
+        degree_grantor.append(value[0])
+    if value[1] and not value[1].startswith("Program "):
+        degree_grantor.append(value[1])
+    if value[2]:
+        degree_grantor.append(value[2])
+    return ", ".join(degree_grantor)
+
+
+def _degree_grantor_names(entries):
+    """
+    Names of all degree grantors within the entries, as looked up by
+    transform_502_degree_grantor and transform_7102_degree_grantor.
+    """
+    for entry in entries:
+        data = entry.entry
+        if not isinstance(data, dict):
+            continue
+        yield from _field_values(data, "502__c")
+        for value in itertools.zip_longest(
+            *(
+                _field_values(data, tag)
+                for tag in ("7102_a", "7102_b", "7102_g", "7102_9")
+            )
+        ):
+            name = _7102_degree_grantor_name(value)
+            if name:
+                yield name
+
+
+def _field_values(data, tag):
+    val = data.get(tag)
+    if val is None:
+        return []
+    if isinstance(val, (list, tuple)):
+        return list(val)
+    return [val]
+
+
 @matches("586__a")
 def transform_586_defended(md, entry, value):
-    if value == "obhájeno":
+    if defended(value):
         md.setdefault("thesis", {})["defended"] = True
 
 
 @matches("656_7a")
 def transform_656_study_field(md, entry, value):
-    value = [x.strip() for x in value.split("/")]
-    value = [x for x in value if x]
-    md.setdefault("thesis", {}).setdefault("studyFields", []).extend(value)
+    md.setdefault("thesis", {}).setdefault("studyFields", []).extend(
+        study_fields(value)
+    )
 
 
 @matches("8564_u", "8564_z", "8564_y", paired=True)
@@ -919,9 +1072,6 @@ def transform_856_attachments(md, entry, value):
 
 @matches("998__a")
 def transform_998_collection(md, entry, value):
-    from invenio_access.permissions import system_identity
-    from invenio_communities.proxies import current_communities
-
     nusl_id_to_slug_mapping = {
         "agritec": "7emz",
         "agrotest_fyto": "22g4",
@@ -1089,18 +1239,32 @@ def transform_998_collection(md, entry, value):
     if value not in nusl_id_to_slug_mapping:
         raise ValueError(f"{value} is not a valid slug for any community.")
 
-    slug_filter = dsl.Q("term", **{"slug": nusl_id_to_slug_mapping[value]})
-    results = current_communities.service.search(
-        system_identity, extra_filter=slug_filter
-    )
-    if not results:
+    count_lookup("communities")
+    community = _search_community(nusl_id_to_slug_mapping[value])
+    if not community:
         raise ValueError(f"{value} is not a valid slug for any community.")
-    community = list(results)[0]
     entry.transformed.setdefault("parent", {}).setdefault("communities", {})[
         "default"
     ] = community["id"]
 
 
+def _search_community(slug):
+    return lookup("community", slug, resolve=lambda: _do_search_community(slug))
+
+
+def _do_search_community(slug):
+    from invenio_access.permissions import system_identity
+    from invenio_communities.proxies import current_communities
+
+    count_search("communities")
+    results = current_communities.service.search(
+        system_identity, extra_filter=dsl.Q("term", slug=slug)
+    )
+    if not results:
+        return None
+    return list(results)[0]
+
+
 @matches("502__a")
 def transform_502_date_defended(md, entry, value):
     date_defended = convert_to_date(value)
@@ -1112,13 +1276,169 @@ def transform_502_date_defended(md, entry, value):
 
 
 class VocabularyCache:
+    def __init__(self):
+        # vocabulary type -> (time of the last check, version fingerprint)
+        self._versions = {}
+        # vocabulary type -> (version fingerprint, CompactVocabulary)
+        self._vocabularies = {}
+        # (vocabulary type, institution name) -> resolved institution for the current batch
+        self._prefetched_institutions = {}
+        # (vocabulary type, institution name) -> seconds spent by resolving it while prefetching
+        self._prefetch_resolution_times = {}
+        # (version fingerprint, role -> id, normalized role -> id, id of "other")
+        self._contributor_roles = None
+        # (version fingerprint, last updated timestamp, BloomFilter)
+        self._names_filter = None
+        # the filter is built by a single thread, monotonic time of the last failed build
+        self._names_filter_lock = threading.Lock()
+        self._names_filter_failed_at = None
+        # vocabulary type -> normalized institution name -> id, loaded on the first use
+        self._institution_overrides = None
+
+    def version(self, vocabulary_type):
+        """
+        Returns a cheap fingerprint of the vocabulary - number of its items and the timestamp
+        of the latest update. The fingerprint is checked at most once per
+        DEFAULT_VOCABULARY_VERSION_CHECK_INTERVAL seconds, in between the last known one is returned.
+        """
+        now = time.monotonic()
+        checked = self._versions.get(vocabulary_type)
+        if checked and now - checked[0] < DEFAULT_VOCABULARY_VERSION_CHECK_INTERVAL:
+            return checked[1]
+
+        from invenio_access.permissions import system_identity
+        from invenio_vocabularies.proxies import current_service
+
+        search = current_service.create_search(
+            system_identity,
+            current_service.record_cls,
+            current_service.config.search,
+            extra_filter=dsl.Q("term", type__id=vocabulary_type),
+        ).extra(size=0, track_total_hits=True)
+        search.aggs.metric("updated", "max", field="updated")
+        try:
+            resp = guarded("vocabulary-version", search.execute)
+        except LookupUnavailable:
+            if not checked:
+                raise
+            # the last known version is used until the next check
+            log.debug(f"Version check of {vocabulary_type} unavailable")
+            self._versions[vocabulary_type] = (now, *checked[1:])
+            return checked[1]
+        last_updated = resp.aggregations.updated.value
+        version = f"{resp.hits.total.value}-{last_updated}"
+
+        if checked and checked[1] != version:
+            log.info(f"Vocabulary {vocabulary_type} has changed, version {version}")
+        self._versions[vocabulary_type] = (now, version, last_updated)
+        return version
+
+    def warm_up(self):
+        """
+        Called before each batch, outside of the guarded lookups. Builds (or updates)
+        the names filter, so that the lookups of the batch just use it.
+        """
+        self.build_names_filter()
+
+    def names_filter(self) -> Optional[BloomFilter]:
+        """
+        Returns the bloom filter of all (scheme, identifier) pairs within the names vocabulary
+        built by build_names_filter (see _names_filter_key), None if it has not been built.
+        """
+        return self._names_filter[2] if self._names_filter else None
+
+    def build_names_filter(self) -> Optional[BloomFilter]:
+        """
+        Builds the names filter if it is missing or the names vocabulary has changed. The filter
+        is shared with other workers through the cache, when the vocabulary changes only
+        the names updated since the last build are added to it. If the build fails, the filter
+        is dropped and not built again for DEFAULT_NAMES_FILTER_RETRY seconds.
+        """
+        if (
+            self._names_filter_failed_at is not None
+            and time.monotonic() - self._names_filter_failed_at
+            < DEFAULT_NAMES_FILTER_RETRY
+        ):
+            return None
+        with self._names_filter_lock:
+            try:
+                return self._build_names_filter()
+            except Exception as e:
+                log.error(
+                    f"Could not build names filter, names are searched without it "
+                    f"for {DEFAULT_NAMES_FILTER_RETRY}s: {e}"
+                )
+                self._names_filter = None
+                self._names_filter_failed_at = time.monotonic()
+                return None
+
+    def _build_names_filter(self) -> BloomFilter:
+        version = self.version("names")
+        if self._names_filter and self._names_filter[0] == version:
+            return self._names_filter[2]
+
+        cache_key = "vocabulary-names-filter"
+        cached = self._names_filter or current_cache.get(cache_key)
+        if cached and cached[0] == version:
+            self._names_filter = cached
+            return cached[2]
+
+        last_updated = self._versions["names"][2]
+        if cached and not cached[2].full:
+            _, since, names_filter = cached
+            log.info(f"Updating names filter with names updated since {since}")
+            self._add_names_to_filter(names_filter, since)
+        else:
+            count = int(version.split("-")[0])
+            log.info(f"Building names filter for {count} names")
+            names_filter = BloomFilter(
+                max(2 * count, DEFAULT_NAMES_FILTER_MIN_CAPACITY)
+            )
+            self._add_names_to_filter(names_filter, None)
+
+        self._names_filter = (version, last_updated, names_filter)
+        self._names_filter_failed_at = None
+        current_cache.set(
+            cache_key, self._names_filter, timeout=DEFAULT_VOCABULARY_CACHE_TTL
+        )
+        return names_filter
+
+    def _add_names_to_filter(self, names_filter, since):
+        from invenio_access.permissions import system_identity
+        from invenio_vocabularies.proxies import current_service
+
+        extra_filter = dsl.Q("term", type__id="names")
+        if since:
+            extra_filter &= dsl.Q(
+                "range", updated={"gte": since, "format": "epoch_millis"}
+            )
+        for name in current_service.scan(system_identity, extra_filter=extra_filter):
+            for idf in name.get("identifiers") or []:
+                if idf.get("scheme") and idf.get("identifier"):
+                    names_filter.add(_names_filter_key(idf))
+
     def by_id(self, vocabulary_type, *fields):
+        count_lookup(f"vocabulary:{vocabulary_type}")
+        return lookup(
+            "vocabulary",
+            vocabulary_type,
+            resolve=lambda: self._by_id(vocabulary_type, *fields),
+        )
+
+    def _by_id(self, vocabulary_type, *fields):
         if not fields:
             fields = ["id"]
         key = f"vocabulary-cache-{vocabulary_type}"
-        ret = current_cache.get(key)
-        if ret:
-            return ret
+        version = self.version(vocabulary_type)
+        cached = self._vocabularies.get(vocabulary_type)
+        if cached and cached[0] == version:
+            count_cache_hit(f"vocabulary:{vocabulary_type}")
+            return cached[1]
+        cached = current_cache.get(key)
+        if isinstance(cached, tuple) and cached[0] == version:
+            count_cache_hit(f"vocabulary:{vocabulary_type}")
+            self._vocabularies[vocabulary_type] = cached
+            return cached[1]
 
         from invenio_access.permissions import system_identity
         from invenio_vocabularies.proxies import current_service
@@ -1129,26 +1449,198 @@ class VocabularyCache:
                 extra_filter=dsl.Q("term", type__id=vocabulary_type),
             )
         except sqlalchemy.exc.NoResultFound:
-            raise KeyError(f"Vocabulary '{vocabulary_type}' has not been found")
-        ret = {
-            x["id"]: {k: v for k, v in x.items() if k in fields}
-            for x in list(vocabulary_data)
-        }
-        log.info(
-            f"Caching {vocabulary_type} for {DEFAULT_VOCABULARY_CACHE_TTL} seconds"
-        )
-        current_cache.set(key, ret, timeout=DEFAULT_VOCABULARY_CACHE_TTL)
+            raise VocabularyNotLoaded(
+                f"Vocabulary '{vocabulary_type}' has not been found"
+            )
+        vocabulary_data = list(vocabulary_data)
+        if not vocabulary_data:
+            # not loaded yet, not cached so that it is scanned again by the retry
+            raise VocabularyNotLoaded(f"Vocabulary '{vocabulary_type}' is empty")
+        ret = CompactVocabulary(vocabulary_data, fields)
+        log.info(f"Caching {vocabulary_type} version {version}")
+        current_cache.set(key, (version, ret), timeout=DEFAULT_VOCABULARY_CACHE_TTL)
+        self._vocabularies[vocabulary_type] = (version, ret)
         return ret
 
+    def contributor_role(self, role):
+        """
+        Returns id of the contributor type whose czech or english title is the role,
+        falls back to case and whitespace insensitive match and then to "other".
+        """
+        count_lookup("contributor-role")
+        return lookup(
+            "contributor_role", role, resolve=lambda: self._contributor_role(role)
+        )
+
+    def _contributor_role(self, role):
+        vocabulary_type = "contributor-types"
+        version = self.version(vocabulary_type)
+        if self._contributor_roles and self._contributor_roles[0] == version:
+            count_cache_hit("contributor-role")
+        else:
+            contributor_types = self._by_id(vocabulary_type, "id", "title")
+            roles = {}
+            normalized_roles = {}
+            for contributor_type in contributor_types.values():
+                title = contributor_type["title"]
+                role_id = contributor_type["id"]
+                if title.get("en") in contributor_types:
+                    role_id = contributor_types[title["en"]]["id"]
+                for role_title in (title.get("cs"), title.get("en")):
+                    if role_title:
+                        roles.setdefault(role_title, role_id)
+                        normalized_roles.setdefault(
+                            _normalize_role(role_title), role_id
+                        )
+            self._contributor_roles = (
+                version,
+                roles,
+                normalized_roles,
+                contributor_types["other"]["id"],
+            )
+
+        _, roles, normalized_roles, other = self._contributor_roles
+        if not role:
+            return other
+        if role in roles:
+            return roles[role]
+        return normalized_roles.get(_normalize_role(role), other)
+
+    def _institution_cache_key(self, inst, vocab_type):
+        # the version is a part of the key, so that lookups are re-done when the vocabulary changes
+        return f"{vocab_type}-vocabulary-lookup-{self.version(vocab_type)}-{inst}"
+
+    def institution_override(self, inst, vocab_type):
+        """Returns the institution from the curated table of overrides or None."""
+        if self._institution_overrides is None:
+            self._institution_overrides = load_institution_overrides(
+                current_app.config.get("NUSL_INSTITUTION_OVERRIDES")
+            )
+        table = self._institution_overrides.get(vocab_type)
+        if not table:
+            return None
+        inst_id = table.get(normalize_institution(inst))
+        return {"id": inst_id} if inst_id else None
+
     def get_institution(self, inst, vocab_type="institutions"):
         inst = (inst or "").strip()
         if not inst:
             return None
-        cache_key = f"{vocab_type}-vocabulary-lookup-{inst}"
+        ret = self._get_institution(inst, vocab_type)
+        if ret is None:
+            record_unresolved_institution(inst, vocab_type)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(institution_lookup_log_message(inst, vocab_type, ret))
+        return ret
+
+    def _get_institution(self, inst, vocab_type):
+        count_lookup(f"institution:{vocab_type}")
+        return lookup(
+            "institution",
+            inst,
+            vocab_type,
+            resolve=lambda: self._lookup_institution(inst, vocab_type),
+        )
+
+    def _lookup_institution(self, inst, vocab_type):
+        override = self.institution_override(inst, vocab_type)
+        if override:
+            count_cache_hit(f"institution:{vocab_type}")
+            return override
+        if (vocab_type, inst) in self._prefetched_institutions:
+            if (vocab_type, inst) in self._prefetch_resolution_times:
+                record_fuzzy_resolution(
+                    inst,
+                    vocab_type,
+                    self._prefetch_resolution_times[(vocab_type, inst)],
+                )
+            else:
+                count_cache_hit(f"institution:{vocab_type}")
+            ret = self._prefetched_institutions[(vocab_type, inst)]
+            # do not share the same dict between records
+            return dict(ret) if ret else None
+
+        cache_key = self._institution_cache_key(inst, vocab_type)
         resolved = current_cache.get(cache_key)
-        if resolved:
-            return resolved
+        if resolved is not None:
+            # False marks an institution that could not be resolved
+            count_cache_hit(f"institution:{vocab_type}")
+            return resolved or None
+
+        start = time.perf_counter()
+        ret = self._resolve_institution(inst, vocab_type)
+        count_fuzzy_resolution()
+        record_fuzzy_resolution(inst, vocab_type, time.perf_counter() - start)
+        current_cache.set(cache_key, ret or False, timeout=_institution_ttl(ret))
+        return ret
 
+    def prefetch_institutions(self, insts, vocab_type="institutions"):
+        """
+        Resolves institution names of a whole batch at once - all of them are fetched
+        from the cache in a single call, only the missing ones are resolved and the results
+        are written back in a single call. get_institution then serves the prefetched
+        names until clear_prefetched_institutions is called.
+        """
+        lookups = current_lookups()
+        if lookups is not None and lookups.offline:
+            return
+        insts = [
+            inst
+            for inst in dict.fromkeys(x.strip() for x in insts if x and x.strip())
+            if not self.institution_override(inst, vocab_type)
+        ]
+        if not insts:
+            return
+        cache_keys = [self._institution_cache_key(inst, vocab_type) for inst in insts]
+        resolved = current_cache.get_many(*cache_keys)
+
+        to_cache = {True: {}, False: {}}
+        for inst, cache_key, ret in zip(insts, cache_keys, resolved):
+            if ret is None:
+                start = time.perf_counter()
+                try:
+                    ret = guarded(
+                        "institution",
+                        lambda: self._resolve_institution(inst, vocab_type),
+                    )
+                except Exception as e:
+                    # let the rule raise the error for its own entry
+                    log.debug(f"Could not prefetch institution {inst}: {e}")
+                    continue
+                self._prefetch_resolution_times[(vocab_type, inst)] = (
+                    time.perf_counter() - start
+                )
+                count_fuzzy_resolution()
+                to_cache[bool(ret)][cache_key] = ret or False
+            self._prefetched_institutions[(vocab_type, inst)] = ret or None
+
+        for resolved_ok, items in to_cache.items():
+            if items:
+                current_cache.set_many(items, timeout=_institution_ttl(resolved_ok))
+
+    def clear_prefetched_institutions(self):
+        self._prefetched_institutions.clear()
+        self._prefetch_resolution_times.clear()
+
+    def sizes(self) -> Dict[str, int]:
+        """Number of items in the in-process caches, for memory tracking."""
+        sizes = {
+            f"vocabulary:{vocabulary_type}": len(vocabulary)
+            for vocabulary_type, (_, vocabulary) in self._vocabularies.items()
+        }
+        sizes["prefetched_institutions"] = len(self._prefetched_institutions)
+        sizes["contributor_roles"] = (
+            len(self._contributor_roles[1]) if self._contributor_roles else 0
+        )
+        sizes["names_filter"] = self._names_filter[2].count if self._names_filter else 0
+        sizes["institution_overrides"] = (
+            sum(len(x) for x in self._institution_overrides.values())
+            if self._institution_overrides
+            else 0
+        )
+        return sizes
+
+    def _resolve_institution(self, inst, vocab_type):
         # Step 1: split the institution on dots or commas and generate query to institutions vocabulary
         inst_pieces = re.split("([.,'])", inst)
         # Step 2: get all candidates
@@ -1172,6 +1664,7 @@ class VocabularyCache:
         from invenio_access.permissions import system_identity
         from invenio_vocabularies.proxies import current_service
 
+        count_search(f"institution:{vocab_type}")
         resp = current_service.search(system_identity, type=vocab_type, params={"q": q})
         candidates = {r["id"]: r for r in list(resp)}
         if not candidates:
@@ -1201,8 +1694,6 @@ class VocabularyCache:
         ret = None
         if scored_candidates[0][0] > 0.8:
             ret = {"id": scored_candidates[0][1]["id"]}
-
-        current_cache.set(cache_key, ret, timeout=DEFAULT_VOCABULARY_CACHE_TTL)
         return ret
 
     def _get_institution_score(self, inst_string, candidate, ancestors):
@@ -1269,23 +1760,18 @@ class VocabularyCache:
         return sum(distances) / len(distances), matched_tested, alternative_parts
 
 
-def lucene_escape(str):
-    return "".join(f"\\{x}" if x in LUCENE_ESCAPE_CHARS else x for x in str)
+def _normalize_role(role):
+    return " ".join(role.split()).casefold()
 
 
-def convert_to_date(value):
-    if not value:
-        return value
-    if value.startswith("["):
-        value = value[1:]
-    if value.endswith("]"):
-        value = value[:-1]
-    value = value.replace(" 00:00:00.0", "")
-    return value.strip()
+def lucene_escape(str):
+    return "".join(f"\\{x}" if x in LUCENE_ESCAPE_CHARS else x for x in str)
 
 
 vocabulary_cache = VocabularyCache()
 
+creatibutor_memo = BoundedMemo(DEFAULT_CREATIBUTOR_MEMO_SIZE)
+
 
 def _parse_identifier(identifier: str) -> Tuple[str, str]:
     normalized_identifier = identifier.lower()
@@ -1303,10 +1789,6 @@ def _parse_identifier(identifier: str) -> Tuple[str, str]:
         raise ValueError(f"Undefined scheme for the identifier: {identifier}")
 
 
-def _create_identifier_object(scheme: str, identifier: str) -> Dict[str, str]:
-    return {"scheme": scheme, "identifier": identifier}
-
-
 def _process_affiliations(affiliations: List[str]) -> List[Dict[str, str]]:
     from invenio_access.permissions import system_identity
     from invenio_vocabularies.proxies import current_service
@@ -1328,9 +1810,9 @@ def _process_affiliations(affiliations: List[str]) -> List[Dict[str, str]]:
                 [f'{candidate}:"{escaped_name}"' for candidate in candidates]
             )
 
-    vocabulary_affiliations = []
-    for affiliation in affiliations:
+    def _search_affiliation(affiliation: str):
         query = _prepare_affiliation_query(affiliation)
+        count_search("affiliations")
         resp = current_service.search(
             system_identity, type="institutions", params={"q": query}
         )
@@ -1347,37 +1829,58 @@ def _process_affiliations(affiliations: List[str]) -> List[Dict[str, str]]:
                     f"Affiliation: '{affiliation}' does not have a valid title."
                 )
 
-            result = {"id": result["id"], "name": title}
-            vocabulary_affiliations.append(result)
+            return {"id": result["id"], "name": title}
         except IndexError:
             raise ValueError(
                 f"Affiliation: '{affiliation}' not found in the institution vocabulary."
             )
 
+    vocabulary_affiliations = []
+    for affiliation in affiliations:
+        count_lookup("affiliations")
+        vocabulary_affiliations.append(
+            lookup(
+                "affiliation",
+                affiliation,
+                resolve=lambda: _search_affiliation(affiliation),
+            )
+        )
+
     return vocabulary_affiliations
 
 
 def _process_affiliations_temp(affiliations: List[str]) -> List[Dict[str, str]]:
     vocabulary_affiliations = []
     for affiliation in affiliations:
-        if "ror" in affiliation.lower():
-            found, found_inst = _find_institution_in_temp("", affiliation)
-        elif "ico" in affiliation.lower():
-            ico = affiliation.split(": ")[-1]
-            found, found_inst = _find_institution_in_temp("", None, ico)
-        else:
-            found, found_inst = _find_institution_in_temp(affiliation)
-
-        if not found:
-            raise ValueError(
-                f"Affiliation: '{affiliation}' not found in the temporary institution vocabulary."
+        count_lookup("affiliations")
+        vocabulary_affiliations.append(
+            lookup(
+                "affiliation",
+                affiliation,
+                resolve=lambda: _find_affiliation_in_temp(affiliation),
+                in_process=True,
             )
-
-        vocabulary_affiliations.append(found_inst)
+        )
 
     return vocabulary_affiliations
 
 
+def _find_affiliation_in_temp(affiliation: str) -> Dict[str, str]:
+    if "ror" in affiliation.lower():
+        found, found_inst = _find_institution_in_temp("", affiliation)
+    elif "ico" in affiliation.lower():
+        ico = affiliation.split(": ")[-1]
+        found, found_inst = _find_institution_in_temp("", None, ico)
+    else:
+        found, found_inst = _find_institution_in_temp(affiliation)
+
+    if not found:
+        raise ValueError(
+            f"Affiliation: '{affiliation}' not found in the temporary institution vocabulary."
+        )
+    return found_inst
+
+
 def _parse_personal_name(name: str) -> Tuple[str, str]:
     names = name.split(",")
     family_name = names[0].strip()
@@ -1436,6 +1939,7 @@ def _find_institution(
         query += f' OR props.ICO:"{ico}"'
 
     try:
+        count_search("affiliations")
         resp = current_service.search(
             system_identity, type="institutions", params={"q": query}
         )
@@ -1527,6 +2031,23 @@ def _find_creatibutor(identifiers: List[str]) -> Tuple[bool, Optional[Dict]]:
     if not identifiers:
         return False, None
 
+    return lookup(
+        "creatibutor", identifiers, resolve=lambda: _search_creatibutor(identifiers)
+    )
+
+
+def _search_creatibutor(identifiers: List[str]) -> Tuple[bool, Optional[Dict]]:
+    # most of the identifiers are not in the vocabulary, skip the search if they are surely not,
+    # the filter is built by VocabularyCache.warm_up before the batch
+    names_filter = vocabulary_cache.names_filter()
+    if names_filter is not None and not any(
+        _names_filter_key(idf) in names_filter for idf in identifiers
+    ):
+        count_cache_hit("names-filter")
+        return False, None
+
+    count_lookup("names")
+
     from invenio_access.permissions import system_identity
     from invenio_vocabularies.proxies import current_service
 
@@ -1540,6 +2061,7 @@ def _find_creatibutor(identifiers: List[str]) -> Tuple[bool, Optional[Dict]]:
     query = " OR ".join(f"({q})" for q in identifier_queries)
 
     try:
+        count_search("names")
         resp = current_service.search(
             system_identity, type="names", params={"q": query}
         )
@@ -1548,10 +2070,18 @@ def _find_creatibutor(identifiers: List[str]) -> Tuple[bool, Optional[Dict]]:
     except IndexError:
         return False, None
     except Exception as e:
+        if is_transient_error(e):
+            # not a missing name, the lookup can be retried
+            raise
         log.error(f"Failed to search in names vocabulary with {identifiers=}: {e}")
         return False, None
 
 
+def _names_filter_key(identifier: Dict[str, str]) -> str:
+    # case insensitive, so that a different case in the harvested data is not a false negative
+    return f"{identifier['scheme']}:{identifier['identifier']}".casefold()
+
+
 LANGUAGES_IN_INSTITUTIONS = [
     "cs",
     "da",
@@ -0,0 +1,120 @@
+"""
+Parallel transformation and validation of a local dump (oai_dir or oai_zstd),
+used to find records that can not be transformed or are not valid.
+"""
+
+import json
+import multiprocessing
+from pathlib import Path
+
+import tqdm
+from oarepo_runtime.datastreams.types import StreamBatch
+
+from nr_oaipmh_harvesters.nusl.validation import (
+    DEFAULT_SCHEMA,
+    entry_error_report,
+    get_schema,
+    validate_entry,
+)
+from nr_oaipmh_harvesters.readers import open_dump
+
+BATCH_SIZE = 100
+
+# state of the worker process - application, reader, transformer and schema
+# are created just once per process in _init_worker
+_worker = {}
+
+
+def _init_worker(source, schema_class):
+    from invenio_access.permissions import system_identity
+    from invenio_app.factory import create_app
+
+    from nr_oaipmh_harvesters.nusl.transformer import NUSLTransformer
+
+    app = create_app()
+    app_context = app.app_context()
+    app_context.push()
+    _worker.update(
+        app=app,
+        app_context=app_context,
+        reader=open_dump(source),
+        transformer=NUSLTransformer(identity=system_identity),
+        schema=get_schema(schema_class),
+    )
+
+
+def _process_range(positions):
+    start, end = positions
+    reader = _worker["reader"]
+    transformer = _worker["transformer"]
+    schema = _worker["schema"]
+
+    errors = []
+    for batch_start in range(start, end, BATCH_SIZE):
+        entries = [
+            reader[position]
+            for position in range(batch_start, min(batch_start + BATCH_SIZE, end))
+        ]
+        batch = StreamBatch(entries=entries)
+        transformer.apply(batch)
+        for entry in entries:
+            if entry.deleted:
+                continue
+            entry.errors.extend(batch.errors)
+            if not entry.errors:
+                validate_entry(schema, entry)
+            if entry.errors:
+                errors.append(entry_error_report(entry))
+    return start, end - start, errors
+
+
+def validate_dump(
+    source,
+    errors_path,
+    checkpoint_path=None,
+    processes=None,
+    chunk_size=1000,
+    schema_class=DEFAULT_SCHEMA,
+):
+    """
+    Transforms and validates the dump in chunks of chunk_size records on a pool of processes.
+    Errors are appended to errors_path as json lines with the position of the record
+    within the dump, finished chunks are recorded in the checkpoint file so that
+    the next run continues where the previous one has stopped.
+    """
+    checkpoint_path = Path(checkpoint_path or f"{errors_path}.checkpoint")
+    done = set()
+    if checkpoint_path.exists():
+        done = {int(x) for x in checkpoint_path.read_text().split()}
+
+    total = len(open_dump(source))
+    chunks = [
+        (start, min(start + chunk_size, total))
+        for start in range(0, total, chunk_size)
+        if start not in done
+    ]
+
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(
+        processes, initializer=_init_worker, initargs=(source, schema_class)
+    ) as pool, open(errors_path, "a") as errors_file, open(
+        checkpoint_path, "a"
+    ) as checkpoint_file, tqdm.tqdm(
+        total=total,
+        initial=total - sum(end - start for start, end in chunks),
+        unit="rec",
+        smoothing=0.1,
+    ) as progress:
+        failed = 0
+        for start, count, errors in pool.imap_unordered(_process_range, chunks):
+            for error in errors:
+                errors_file.write(
+                    json.dumps(error, ensure_ascii=False, default=str) + "\n"
+                )
+            errors_file.flush()
+            # written after the errors, so that no error is lost when interrupted
+            checkpoint_file.write(f"{start}\n")
+            checkpoint_file.flush()
+            failed += len(errors)
+            progress.update(count)
+            progress.set_postfix(failed=failed)
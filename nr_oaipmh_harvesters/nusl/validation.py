@@ -0,0 +1,77 @@
+import logging
+from typing import Dict, List, Optional
+
+from invenio_base.utils import obj_or_import_string
+from marshmallow import ValidationError
+from oarepo_runtime.datastreams.transformers import BaseTransformer
+from oarepo_runtime.datastreams.types import StreamBatch, StreamEntry, StreamEntryError
+
+log = logging.getLogger("oaipmh.harvester")
+
+DEFAULT_SCHEMA = "nr_metadata.documents.services.records.schema:NRDocumentRecordSchema"
+
+# schema instances by their import string, shared by all transformers in the process
+_schemas = {}
+
+
+def get_schema(schema_class=DEFAULT_SCHEMA):
+    """Returns schema instance of the class, created once per process."""
+    if schema_class not in _schemas:
+        _schemas[schema_class] = obj_or_import_string(schema_class)()
+    return _schemas[schema_class]
+
+
+class NUSLValidationTransformer(BaseTransformer):
+    """
+    Validates transformed entries with the metadata schema and marks the invalid ones
+    with a "validation" error, so that they are skipped by the writer and the rest
+    of the batch is written. Use it as the last transformer after nusl / nusl_marcxml.
+    """
+
+    def __init__(self, schema=DEFAULT_SCHEMA, **kwargs):
+        super().__init__(**kwargs)
+        self.schema = get_schema(schema)
+
+    def apply(self, batch: StreamBatch, *args, **kwargs) -> StreamBatch:
+        if batch.errors:
+            return batch
+        invalid = 0
+        for entry in batch.entries:
+            if entry.deleted or entry.filtered or entry.errors:
+                continue
+            if validate_entry(self.schema, entry):
+                invalid += 1
+        if invalid:
+            log.warning(
+                f"{invalid} of {len(batch.entries)} entries in batch {batch.seq} are not valid"
+            )
+        return batch
+
+
+def validate_entry(schema, entry: StreamEntry) -> Optional[StreamEntryError]:
+    """
+    Validates the transformed entry with the marshmallow schema, returns the error
+    (that is also appended to the entry errors) or None if the entry is valid.
+    """
+    try:
+        schema.load(entry.entry)
+    except ValidationError as e:
+        error = StreamEntryError(
+            code="validation",
+            message=f"Record is not valid: {e.messages}",
+            info={"messages": e.messages},
+        )
+        entry.errors.append(error)
+        return error
+    return None
+
+
+def entry_error_report(entry: StreamEntry) -> Dict:
+    """Json-serializable report of the errors of the entry."""
+    oai = entry.context.get("oai") or {}
+    errors: List[Dict] = [error.json for error in entry.errors]
+    return {
+        "position": entry.context.get("dump_position"),
+        "identifier": oai.get("identifier"),
+        "errors": errors,
+    }
@@ -0,0 +1,13 @@
+from pathlib import Path
+
+from .indexed_oai_dir import IndexedOAIDirReader
+from .oai_zstd import INDEX_FILE_NAME as OAI_ZSTD_INDEX_FILE_NAME
+from .oai_zstd import OAIZstdReader
+from .random_access import RandomAccessReader
+
+
+def open_dump(source, **kwargs) -> RandomAccessReader:
+    """Opens a local oai_zstd or oai_dir dump for random access."""
+    if (Path(source) / OAI_ZSTD_INDEX_FILE_NAME).exists():
+        return OAIZstdReader(source=source, **kwargs)
+    return IndexedOAIDirReader(source=source, **kwargs)
@@ -0,0 +1,121 @@
+import gzip
+import logging
+import sqlite3
+from pathlib import Path
+from typing import Dict
+
+import yaml
+
+from nr_oaipmh_harvesters.readers.random_access import RandomAccessReader
+
+log = logging.getLogger("oaipmh.harvester")
+
+INDEX_FILE_NAME = ".oai_dir_index.sqlite"
+
+YAMLLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+class OAIDirIndex:
+    """
+    Index of a directory with *.yaml.gz dumps written by the oai_dir writer. For each
+    record it keeps its position within the whole dump, the file and the position within
+    the file and its OAI identifier. The index is stored in the dumped directory and is
+    rebuilt whenever the set of dumped files changes.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.db = sqlite3.connect(str(self.directory / INDEX_FILE_NAME))
+        if self._is_stale():
+            self.build()
+
+    def _dump_files(self):
+        return [
+            (f.name, f.stat().st_size) for f in sorted(self.directory.glob("*.yaml.gz"))
+        ]
+
+    def _is_stale(self):
+        try:
+            indexed = self.db.execute(
+                "SELECT name, size FROM files ORDER BY name"
+            ).fetchall()
+        except sqlite3.OperationalError:
+            return True
+        return [tuple(x) for x in indexed] != self._dump_files()
+
+    def build(self):
+        log.info(f"Building index of {self.directory}")
+        with self.db:
+            self.db.execute("DROP TABLE IF EXISTS files")
+            self.db.execute("DROP TABLE IF EXISTS records")
+            self.db.execute("CREATE TABLE files (name TEXT PRIMARY KEY, size INTEGER)")
+            self.db.execute(
+                "CREATE TABLE records (position INTEGER PRIMARY KEY, file TEXT, "
+                "file_position INTEGER, identifier TEXT)"
+            )
+            position = 0
+            for name, size in self._dump_files():
+                records = load_dump_file(self.directory / name)
+                self.db.executemany(
+                    "INSERT INTO records VALUES (?, ?, ?, ?)",
+                    (
+                        (position + idx, name, idx, record["oai"].get("identifier"))
+                        for idx, record in enumerate(records)
+                    ),
+                )
+                position += len(records)
+                self.db.execute("INSERT INTO files VALUES (?, ?)", (name, size))
+            self.db.execute("CREATE INDEX records_identifier ON records (identifier)")
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def location(self, position):
+        """Returns (file name, position within the file) of the record at the position."""
+        row = self.db.execute(
+            "SELECT file, file_position FROM records WHERE position = ?", (position,)
+        ).fetchone()
+        if not row:
+            raise IndexError(f"No record at position {position} in {self.directory}")
+        return row
+
+    def position(self, identifier) -> int:
+        row = self.db.execute(
+            "SELECT position FROM records WHERE identifier = ? ORDER BY position DESC",
+            (identifier,),
+        ).fetchone()
+        if not row:
+            raise KeyError(f"OAI identifier {identifier} not found in {self.directory}")
+        return row[0]
+
+
+class IndexedOAIDirReader(RandomAccessReader):
+    """
+    Reader of oai_dir dumps with random access, see RandomAccessReader.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.index = OAIDirIndex(self.source)
+        self._cached_file = (None, None)
+
+    def __len__(self):
+        return len(self.index)
+
+    def position(self, identifier) -> int:
+        return self.index.position(identifier)
+
+    def read_record(self, position) -> Dict:
+        file_name, file_position = self.index.location(position)
+        # records are usually read in order, so keep the last loaded file
+        if self._cached_file[0] != file_name:
+            self._cached_file = (
+                file_name,
+                load_dump_file(Path(self.source) / file_name),
+            )
+        return self._cached_file[1][file_position]
+
+
+def load_dump_file(path) -> list:
+    with gzip.open(path, "rt") as f:
+        return yaml.load(f, Loader=YAMLLoader) or []
@@ -0,0 +1,154 @@
+"""
+The oai_zstd dump is a directory with two files:
+
+* records.ndjson.zst - a sequence of independent zstd frames (chunks), each containing
+  newline-delimited json records {"entry": ..., "oai": ...}
+* records.index.jsonl - one line per chunk with its offset and length in the data file,
+  number of records and their OAI identifiers
+
+Tuples (as produced by the marcxml transformer) are stored as {"__tuple__": [...]},
+so that the records are read back exactly as they were written.
+"""
+
+import bisect
+import fcntl
+import json
+import os
+from pathlib import Path
+from typing import Dict, List
+
+from nr_oaipmh_harvesters.readers.random_access import RandomAccessReader
+
+DATA_FILE_NAME = "records.ndjson.zst"
+INDEX_FILE_NAME = "records.index.jsonl"
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(
+            "oai_zstd dumps need the zstandard package, "
+            "please install nr-oaipmh-harvesters[zstd]"
+        )
+    return zstandard
+
+
+def _encode_tuples(value):
+    if isinstance(value, tuple):
+        return {"__tuple__": [_encode_tuples(x) for x in value]}
+    if isinstance(value, list):
+        return [_encode_tuples(x) for x in value]
+    if isinstance(value, dict):
+        return {k: _encode_tuples(v) for k, v in value.items()}
+    return value
+
+
+def _decode_tuples(value: Dict):
+    if len(value) == 1 and "__tuple__" in value:
+        return tuple(value["__tuple__"])
+    return value
+
+
+def encode_record(record: Dict) -> str:
+    return json.dumps(
+        _encode_tuples(record), ensure_ascii=False, separators=(",", ":"), default=str
+    )
+
+
+def decode_record(line) -> Dict:
+    return json.loads(line, object_hook=_decode_tuples)
+
+
+class OAIZstdDumpWriter:
+    """
+    Appends chunks of records to an oai_zstd dump.
+    """
+
+    def __init__(self, directory, level=3):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.compressor = _zstandard().ZstdCompressor(level=int(level))
+
+    def write_chunk(self, records: List[Dict]) -> None:
+        if not records:
+            return
+        data = "".join(encode_record(r) + "\n" for r in records).encode("utf-8")
+        frame = self.compressor.compress(data)
+        # the dump may be written by several workers, the frame and its index line
+        # are appended under a lock so that the offsets match the data file
+        with open(self.directory / INDEX_FILE_NAME, "a") as index:
+            fcntl.flock(index, fcntl.LOCK_EX)
+            try:
+                with open(self.directory / DATA_FILE_NAME, "ab") as f:
+                    offset = f.seek(0, os.SEEK_END)
+                    f.write(frame)
+                index.write(
+                    json.dumps(
+                        {
+                            "offset": offset,
+                            "length": len(frame),
+                            "count": len(records),
+                            "identifiers": [
+                                r["oai"].get("identifier") for r in records
+                            ],
+                        }
+                    )
+                    + "\n"
+                )
+                index.flush()
+            finally:
+                fcntl.flock(index, fcntl.LOCK_UN)
+
+
+class OAIZstdReader(RandomAccessReader):
+    """
+    Reader of oai_zstd dumps with random access, see RandomAccessReader.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = Path(self.source)
+        with open(self.directory / INDEX_FILE_NAME) as f:
+            self.chunks = [json.loads(line) for line in f if line.strip()]
+        # position of the first record of each chunk
+        self.chunk_starts = []
+        position = 0
+        for chunk in self.chunks:
+            self.chunk_starts.append(position)
+            position += chunk["count"]
+        self.record_count = position
+        self._identifiers = None
+        self._cached_chunk = (None, None)
+        self._decompressor = _zstandard().ZstdDecompressor()
+
+    def __len__(self):
+        return self.record_count
+
+    def position(self, identifier) -> int:
+        if self._identifiers is None:
+            # the latest record wins
+            self._identifiers = {
+                idf: start + idx
+                for start, chunk in zip(self.chunk_starts, self.chunks)
+                for idx, idf in enumerate(chunk["identifiers"])
+            }
+        if identifier not in self._identifiers:
+            raise KeyError(f"OAI identifier {identifier} not found in {self.directory}")
+        return self._identifiers[identifier]
+
+    def read_record(self, position) -> Dict:
+        if position < 0 or position >= self.record_count:
+            raise IndexError(f"No record at position {position} in {self.directory}")
+        chunk_idx = bisect.bisect_right(self.chunk_starts, position) - 1
+        # records are usually read in order, so keep the last decompressed chunk
+        if self._cached_chunk[0] != chunk_idx:
+            chunk = self.chunks[chunk_idx]
+            with open(self.directory / DATA_FILE_NAME, "rb") as f:
+                f.seek(chunk["offset"])
+                frame = f.read(chunk["length"])
+            lines = self._decompressor.decompress(frame).decode("utf-8").splitlines()
+            self._cached_chunk = (chunk_idx, lines)
+        return decode_record(
+            self._cached_chunk[1][position - self.chunk_starts[chunk_idx]]
+        )
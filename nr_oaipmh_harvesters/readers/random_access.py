@@ -0,0 +1,76 @@
+import random
+from abc import abstractmethod
+from typing import Dict, Iterator, List
+
+from oarepo_runtime.datastreams import BaseReader, StreamEntry
+
+
+class RandomAccessReader(BaseReader):
+    """
+    Base of readers of locally dumped records that can read a record at any position.
+    Reading can start at any position, be restricted to a range or to a list of
+    OAI identifiers or be a random sample of the dump, without reading the records
+    in front of it. Position of the record is stored in "dump_position" of the context.
+    """
+
+    def __init__(
+        self,
+        *,
+        from_record=0,
+        to_record=None,
+        identifiers=None,
+        sample=None,
+        seed=None,
+        oai_run=None,
+        oai_harvester_id=None,
+        manual=False,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.from_record = int(from_record or 0)
+        self.to_record = int(to_record) if to_record is not None else None
+        self.identifiers = identifiers
+        self.sample = int(sample) if sample else None
+        self.seed = seed
+        self.oai_run = oai_run
+        self.oai_harvester_id = oai_harvester_id
+        self.manual = manual
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Number of records in the dump."""
+
+    @abstractmethod
+    def position(self, identifier) -> int:
+        """Position of the (latest) record with the OAI identifier."""
+
+    @abstractmethod
+    def read_record(self, position) -> Dict:
+        """Dumped record ({"entry": ..., "oai": ...}) at the position."""
+
+    def positions(self) -> List[int]:
+        if self.identifiers:
+            return [self.position(identifier) for identifier in self.identifiers]
+        positions = range(self.from_record, min(self.to_record or len(self), len(self)))
+        if self.sample:
+            rnd = random.Random(self.seed)
+            positions = sorted(rnd.sample(positions, min(self.sample, len(positions))))
+        return list(positions)
+
+    def __iter__(self) -> Iterator[StreamEntry]:
+        for position in self.positions():
+            yield self[position]
+
+    def __getitem__(self, position) -> StreamEntry:
+        record = self.read_record(position)
+        return StreamEntry(
+            record["entry"],
+            context={
+                "oai": record["oai"],
+                "oai_run": self.oai_run,
+                "oai_harvester_id": self.oai_harvester_id,
+                "manual": self.manual,
+                "dump_position": position,
+            },
+            deleted=record["oai"].get("deleted"),
+        )
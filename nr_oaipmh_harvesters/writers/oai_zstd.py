@@ -0,0 +1,24 @@
+from oarepo_runtime.datastreams import BaseWriter, StreamBatch
+
+from nr_oaipmh_harvesters.readers.oai_zstd import OAIZstdDumpWriter
+
+
+class OAIZstdWriter(BaseWriter):
+    """
+    Writes ok entries of each batch as a single compressed chunk of an oai_zstd dump,
+    see nr_oaipmh_harvesters.readers.oai_zstd for the format.
+    """
+
+    def __init__(self, *, dir, level=3, **kwargs) -> None:
+        super().__init__()
+        self.dump = OAIZstdDumpWriter(dir, level=level)
+
+    def write(self, batch: StreamBatch, *args, **kwargs):
+        self.dump.write_chunk(
+            [
+                {"entry": entry.entry, "oai": entry.context.get("oai", {})}
+                for entry in batch.entries
+                if entry.ok
+            ]
+        )
+        return batch
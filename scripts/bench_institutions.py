@@ -1,27 +1,241 @@
-from nr_oaipmh_harvesters.nusl.transformer import NUSLTransformer, vocabulary_cache
-from oarepo_oaipmh_harvester.readers.oai_dir import OAIDirReader
-from nr_metadata.documents.services.records.schema import NRDocumentRecordSchema
-import tqdm
+import collections
+import csv
 import json
+import time
+from pathlib import Path
+
+import click
+import yaml
 from invenio_app.factory import create_app
-import csv
 
+from nr_oaipmh_harvesters.nusl.transformer import vocabulary_cache
+
+FIXTURES = Path(__file__).parent.parent / "tests" / "fixtures"
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, round(p / 100 * (len(sorted_values) - 1)))
+    return sorted_values[idx]
+
+
+def parse_institutions():
+    """Returns list of (institution string, number of its occurrences in NUSL)."""
+    ret = []
+    for line in institutions.strip().split("\n"):
+        inst, count = line.strip().rsplit(" ", maxsplit=1)
+        ret.append((inst, int(count)))
+    return ret
+
+
+def load_golden(golden):
+    """Returns {institution string: expected id}, "" if it should not be resolved."""
+    with open(golden) as f:
+        return {row["institution"]: row["expected"] for row in csv.DictReader(f)}
+
+
+def load_fixture(fixture, vocab_type, created):
+    """
+    Loads the fixture vocabulary into vocab_type, items already present are kept.
+    What has been created is recorded in created as it goes, for remove_fixture.
+    """
+    from invenio_access.permissions import system_identity
+    from invenio_pidstore.errors import PIDDoesNotExistError
+    from invenio_vocabularies.proxies import current_service
+    from invenio_vocabularies.records.models import VocabularyType
+
+    if not VocabularyType.query.filter_by(id=vocab_type).one_or_none():
+        current_service.create_type(system_identity, vocab_type, "nuslbm")
+        created["type"] = True
+
+    with open(fixture) as f:
+        items = yaml.safe_load(f)
+    # parents first, their titles are copied to the hierarchy of the children
+    for item in items:
+        try:
+            current_service.read(system_identity, (vocab_type, item["id"]))
+        except PIDDoesNotExistError:
+            current_service.create(system_identity, {**item, "type": vocab_type})
+            created["items"].append(item["id"])
+    current_service.record_cls.index.refresh()
+
+
+def remove_fixture(vocab_type, created):
+    """Removes the items (children first) and the type created by load_fixture."""
+    from invenio_access.permissions import system_identity
+    from invenio_db import db
+    from invenio_vocabularies.proxies import current_service
+    from invenio_vocabularies.records.models import VocabularyType
 
-def run():
+    for item_id in reversed(created["items"]):
+        try:
+            current_service.delete(system_identity, (vocab_type, item_id))
+        except Exception as e:
+            print(f"Could not remove {vocab_type} {item_id}: {e}")
+    current_service.record_cls.index.refresh()
+    if created["type"]:
+        db.session.delete(VocabularyType.query.filter_by(id=vocab_type).one())
+        db.session.commit()
+
+
+def timed(f, *args):
+    """Returns (resolved id or "", seconds, error message or None)."""
+    start = time.perf_counter()
+    error = None
+    try:
+        ret = f(*args)
+    except Exception as e:
+        ret = None
+        error = f"{type(e).__name__}: {e}"
+    return (ret["id"] if ret else ""), time.perf_counter() - start, error
+
+
+def latency_report(latencies, counts):
+    ordered = sorted(latencies)
+    weighted_time = sum(t * c for t, c in zip(latencies, counts))
+    return {
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p90_ms": round(percentile(ordered, 90) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+        # throughput if the strings came in their real frequencies
+        "weighted_per_second": round(sum(counts) / weighted_time, 1),
+    }
+
+
+@click.command()
+@click.option(
+    "--fixture",
+    default=str(FIXTURES / "institutions.yaml"),
+    help="Vocabulary items loaded into --vocab-type before the benchmark",
+)
+@click.option(
+    "--no-fixture",
+    is_flag=True,
+    help="Do not load the fixture, benchmark an existing vocabulary",
+)
+@click.option(
+    "--keep-fixture",
+    is_flag=True,
+    help="Keep the loaded fixture, by default it is removed after the benchmark",
+)
+@click.option("--vocab-type", default="institutions-benchmark")
+@click.option(
+    "--golden",
+    default=str(FIXTURES / "institutions-golden.csv"),
+    help="Hand-checked csv with institution string and the expected id",
+)
+@click.option("--output", help="Write the report as json to this file")
+def run(fixture, no_fixture, keep_fixture, vocab_type, golden, output):
+    """
+    Benchmark of institution resolution on real degree grantor strings from NUSL,
+    weighted by their frequencies. Cold latency is the resolution itself (search
+    in the vocabulary), warm latency is get_institution served from the cache.
+
+    The strings are resolved against a small fixture vocabulary and compared with
+    a hand-checked golden list, so that the accuracy does not depend on the state
+    of the instance. Lookups that raised an exception are reported as errors and
+    are left out of the accuracy. The fixture items and type created by the benchmark
+    are removed afterwards; the benchmark is best run against a throwaway database.
+
+        python scripts/bench_institutions.py --output report.json
+    """
     app = create_app()
     with app.app_context():
-        data = []
-        for inst in institutions.strip().split("\n"):
-            inst = inst.strip()
-            inst = inst.rsplit(" ", maxsplit=1)[0]
-            print()
-            print(inst)
-            resolved = vocabulary_cache.get_institution(inst)
-            print("    ", resolved["id"] if resolved else "---")
-            data.append((inst, resolved["id"] if resolved else ""))
-        with open("/tmp/instituce.csv", "w") as f:
-            writer = csv.writer(f)
-            writer.writerows(data)
+        created = {"type": False, "items": []}
+        try:
+            if not no_fixture:
+                load_fixture(fixture, vocab_type, created)
+                print(
+                    f"Loaded {len(created['items'])} fixture institutions into {vocab_type}"
+                )
+            benchmark(vocab_type, golden, output)
+        finally:
+            if not keep_fixture and (created["type"] or created["items"]):
+                remove_fixture(vocab_type, created)
+                print(f"Removed the fixture institutions from {vocab_type}")
+
+
+def benchmark(vocab_type, golden, output):
+    data = parse_institutions()
+    counts = [count for _, count in data]
+
+    cold = [
+        timed(vocabulary_cache._resolve_institution, inst, vocab_type)
+        for inst, _ in data
+    ]
+    for inst, _ in data:
+        # fill the cache
+        timed(vocabulary_cache.get_institution, inst, vocab_type)
+    warm = [
+        timed(vocabulary_cache.get_institution, inst, vocab_type) for inst, _ in data
+    ]
+
+    errors = [
+        (inst, count, error)
+        for (inst, count), (_, _, error) in zip(data, cold)
+        if error
+    ]
+    report = {
+        "strings": len(data),
+        "occurrences": sum(counts),
+        "resolved": sum(1 for resolved, _, _ in cold if resolved),
+        "resolved_weighted": round(
+            sum(c for (resolved, _, _), c in zip(cold, counts) if resolved)
+            / sum(counts),
+            4,
+        ),
+        "errors": len(errors),
+        "errors_weighted": round(sum(count for _, count, _ in errors) / sum(counts), 4),
+        "error_messages": dict(
+            collections.Counter(error for _, _, error in errors).most_common(10)
+        ),
+        "cold": latency_report([t for _, t, _ in cold], counts),
+        "warm": latency_report([t for _, t, _ in warm], counts),
+    }
+
+    if golden:
+        expected = load_golden(golden)
+        missing = [inst for inst, _ in data if inst not in expected]
+        if missing:
+            raise click.ClickException(
+                f"{len(missing)} strings are not in {golden}, e.g. {missing[0]!r}"
+            )
+        # errored lookups say nothing about the resolution itself
+        checked = [
+            (inst, count, resolved)
+            for (inst, count), (resolved, _, error) in zip(data, cold)
+            if not error
+        ]
+        mismatches = [
+            (inst, count, expected[inst], resolved)
+            for inst, count, resolved in checked
+            if expected[inst] != resolved
+        ]
+        checked_count = sum(count for _, count, _ in checked)
+        report["checked"] = len(checked)
+        report["accuracy"] = round(
+            1 - len(mismatches) / len(checked) if checked else 0, 4
+        )
+        report["accuracy_weighted"] = round(
+            (1 - sum(x[1] for x in mismatches) / checked_count if checked_count else 0),
+            4,
+        )
+        report["wrong"] = sum(1 for x in mismatches if x[3])
+        report["unresolved"] = sum(1 for x in mismatches if not x[3])
+        for inst, count, expected_id, resolved in sorted(
+            mismatches, key=lambda x: -x[1]
+        ):
+            print(f"{count:6d} {inst}: expected {expected_id!r}, got {resolved!r}")
+
+    for inst, count, error in sorted(errors, key=lambda x: -x[1]):
+        print(f"{count:6d} {inst}: error {error}")
+
+    print(json.dumps(report, indent=4))
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=4)
 
 
 institutions = """
@@ -0,0 +1,77 @@
+from pathlib import Path
+
+import pytest
+from lxml import etree
+
+from nr_oaipmh_harvesters.nusl import transformer
+from nr_oaipmh_harvesters.nusl.marcxml import parse_marcxml
+
+RECORDS = Path(__file__).parent / "fixtures" / "nusl-records.xml"
+
+
+class StubVocabulary(dict):
+    """Every id is in the vocabulary except "unknown"."""
+
+    def __init__(self, vocabulary_type):
+        super().__init__()
+        self.vocabulary_type = vocabulary_type
+
+    def __getitem__(self, key):
+        if key == "unknown":
+            raise KeyError(key)
+        return {"id": key, "type": self.vocabulary_type, "title": {"en": key}}
+
+    def __contains__(self, key):
+        return key != "unknown"
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+
+@pytest.fixture
+def stubbed_lookups(monkeypatch):
+    cache = transformer.vocabulary_cache
+    monkeypatch.setattr(cache, "warm_up", lambda: None)
+    monkeypatch.setattr(
+        cache, "by_id", lambda vocabulary_type, *fields: StubVocabulary(vocabulary_type)
+    )
+    monkeypatch.setattr(cache, "contributor_role", lambda role: f"role-{role}")
+    monkeypatch.setattr(
+        cache,
+        "get_institution",
+        lambda inst, vocab_type="institutions": {"id": f"{vocab_type}:{inst[:20]}"},
+    )
+    monkeypatch.setattr(cache, "prefetch_institutions", lambda *args, **kwargs: None)
+    monkeypatch.setattr(
+        transformer,
+        "_do_search_award",
+        lambda number: {
+            "id": f"award-{number}",
+            "number": number,
+            "title": {"cs": number},
+            "funder": {"id": "funder", "name": "Funder"},
+        },
+    )
+    monkeypatch.setattr(
+        transformer, "_do_search_community", lambda slug: {"id": f"community-{slug}"}
+    )
+    monkeypatch.setattr(
+        transformer,
+        "_find_creatibutor",
+        lambda identifiers: ("orcid" in str(identifiers), None),
+    )
+    monkeypatch.setattr(
+        transformer,
+        "_process_affiliations_temp",
+        lambda affiliations: [{"name": a} for a in affiliations if a],
+    )
+    transformer.creatibutor_memo.clear()
+
+
+@pytest.fixture
+def sample_records():
+    """Parsed MARC records of fixtures/nusl-records.xml, the last one has errors."""
+    collection = etree.parse(str(RECORDS)).getroot()
+    return [
+        parse_marcxml(etree.tostring(record)) for record in collection.iter("{*}record")
+    ]
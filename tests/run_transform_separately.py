@@ -1,6 +1,6 @@
 from nr_oaipmh_harvesters.nusl.transformer import NUSLTransformer, vocabulary_cache
-from oarepo_oaipmh_harvester.readers.oai_dir import OAIDirReader
 from nr_metadata.documents.services.records.schema import NRDocumentRecordSchema
+from nr_oaipmh_harvesters.readers.indexed_oai_dir import IndexedOAIDirReader
 import tqdm
 import json
 from invenio_app.factory import create_app
@@ -9,17 +9,19 @@ import yaml
 import traceback
 
 
+# For a whole dump use "invenio nusl validate ../oai-data" which runs in parallel
+# and can be resumed, this script is meant for debugging of single records.
 @click.command
 @click.option("--from-record", type=int, default=0)
-def run(from_record=None):
+@click.option("--identifier", multiple=True, help="Transform just these OAI identifiers")
+def run(from_record=None, identifier=None):
     app = create_app()
     with open("/tmp/errors.yaml", "w") as errors:
         with app.app_context():
-            loader = OAIDirReader(source="../oai-data")
+            loader = IndexedOAIDirReader(
+                source="../oai-data", from_record=from_record, identifiers=identifier
+            )
             for entry in tqdm.tqdm(iter(loader)):
-                if from_record > 0:
-                    from_record -= 1
-                    continue
                 try:
                     transformer = NUSLTransformer()
                     transformer.apply_batch([entry])
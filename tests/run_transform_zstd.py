@@ -0,0 +1,29 @@
+from invenio_app.factory import create_app
+from oarepo_oaipmh_harvester.cli import _add_harvester
+from oarepo_oaipmh_harvester.harvester import harvest
+
+
+def run():
+    harvester = _add_harvester(
+        code="nusl-transformer-zstd",
+        name="NUŠL",
+        url="../oai-zstd",  # invenio nusl convert-dump ../oai-data ../oai-zstd
+        set="global",
+        prefix="marcxml",
+        loader="oai_zstd",
+        transformers=["nusl"],
+        comment="NUSL loader",
+        max_records=None,
+        batch_size=100,
+        writer="oai_zstd",
+        writer_params=[{"param": "dir", "value": "../oai-transformed"}],
+    )
+    harvest(
+        harvester_or_code="nusl-transformer-zstd", all_records=True, on_background=False
+    )
+
+
+if __name__ == "__main__":
+    app = create_app()
+    with app.app_context():
+        run()
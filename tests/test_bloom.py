@@ -0,0 +1,44 @@
+import pickle
+
+from nr_oaipmh_harvesters.nusl.bloom import BloomFilter
+
+
+def keys(prefix, count):
+    return [f"{prefix}:{idx:07d}-{idx * 7919 % 10007}" for idx in range(count)]
+
+
+def test_no_false_negatives():
+    added = keys("orcid", 10000)
+    bloom = BloomFilter(len(added))
+    for key in added:
+        bloom.add(key)
+    assert all(key in bloom for key in added)
+    assert bloom.full
+
+
+def test_no_false_negatives_over_capacity():
+    # more items than the capacity raise the error rate, but never lose an item
+    added = keys("isni", 5000)
+    bloom = BloomFilter(100)
+    for key in added:
+        bloom.add(key)
+    assert all(key in bloom for key in added)
+
+
+def test_false_positive_rate():
+    bloom = BloomFilter(10000, error_rate=0.01)
+    for key in keys("orcid", 10000):
+        bloom.add(key)
+    false_positives = sum(key in bloom for key in keys("scopus", 10000))
+    assert false_positives < 300
+
+
+def test_survives_pickling():
+    # the filter is shared with other workers through the cache
+    added = keys("orcid", 1000) + ["vedoucí práce", ""]
+    bloom = BloomFilter(len(added))
+    for key in added:
+        bloom.add(key)
+    unpickled = pickle.loads(pickle.dumps(bloom))
+    assert all(key in unpickled for key in added)
+    assert unpickled.count == len(added)
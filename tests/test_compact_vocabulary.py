@@ -0,0 +1,66 @@
+import pickle
+
+import pytest
+
+from nr_oaipmh_harvesters.nusl.compact_vocabulary import CompactVocabulary
+
+ITEMS = [
+    {"id": "eng", "title": {"cs": "angličtina", "en": "English"}, "tags": ["x"]},
+    {"id": "cze", "title": {"cs": "čeština", "en": "Czech"}, "tags": []},
+    {"id": "ger", "title": {"cs": "němčina", "en": "German"}, "tags": []},
+]
+
+
+@pytest.fixture
+def vocabulary():
+    return CompactVocabulary(ITEMS, ["id", "title"])
+
+
+def test_lookup(vocabulary):
+    # only the selected fields are kept
+    assert vocabulary["cze"] == {"id": "cze", "title": {"cs": "čeština", "en": "Czech"}}
+    assert vocabulary.get("fre") is None
+    with pytest.raises(KeyError):
+        vocabulary["fre"]
+    # every access decodes a new item, the caller may modify it
+    vocabulary["cze"]["title"]["cs"] = "changed"
+    assert vocabulary["cze"]["title"]["cs"] == "čeština"
+
+
+def test_membership(vocabulary):
+    for item in ITEMS:
+        assert item["id"] in vocabulary
+    # before the first, between and after the last id, prefixes and non-strings
+    for key in ("aaa", "dut", "zzz", "cz", "czech", "", None, 1):
+        assert key not in vocabulary
+
+
+def test_iteration(vocabulary):
+    assert list(vocabulary) == ["cze", "eng", "ger"]
+    assert len(vocabulary) == 3
+    assert dict(vocabulary) == {
+        item["id"]: {"id": item["id"], "title": item["title"]} for item in ITEMS
+    }
+
+
+def test_ids_only():
+    vocabulary = CompactVocabulary(ITEMS, ["id"])
+    assert vocabulary["ger"] == {"id": "ger"}
+    assert list(vocabulary.values()) == [{"id": "cze"}, {"id": "eng"}, {"id": "ger"}]
+
+
+def test_empty():
+    vocabulary = CompactVocabulary([], ["id", "title"])
+    assert len(vocabulary) == 0
+    assert "cze" not in vocabulary
+    assert list(vocabulary) == []
+
+
+@pytest.mark.parametrize("fields", [["id"], ["id", "title"]])
+def test_pickle(fields):
+    vocabulary = CompactVocabulary(ITEMS, fields)
+    for protocol in range(2, pickle.HIGHEST_PROTOCOL + 1):
+        unpickled = pickle.loads(pickle.dumps(vocabulary, protocol=protocol))
+        assert unpickled.fields == vocabulary.fields
+        assert dict(unpickled) == dict(vocabulary)
+        assert "eng" in unpickled
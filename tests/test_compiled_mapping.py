@@ -0,0 +1,88 @@
+"""
+Equivalence of the nusl_compiled transformer (rules compiled from nusl.mapping) and
+the hand-written rules of NUSLTransformer. The sample MARC records of
+fixtures/nusl-records.xml and random combinations of their datafields are transformed
+by both transformers with stubbed vocabularies and lookups, the transformed records,
+files and errors must be the same.
+
+    pytest tests/test_compiled_mapping.py
+"""
+
+import copy
+import json
+import random
+
+import pytest
+from oarepo_runtime.datastreams.types import StreamBatch, StreamEntry
+
+from nr_oaipmh_harvesters.nusl.compiled import NUSLCompiledTransformer
+from nr_oaipmh_harvesters.nusl.transformer import NUSLTransformer
+
+
+def combined_records(records, count, seed):
+    """Records with the datafields (all their subfields) taken from random sample records."""
+    fields = {}
+    for record in records:
+        for key, value in record.items():
+            fields.setdefault(key[:5], []).append((key, value))
+    rnd = random.Random(seed)
+    ret = []
+    for _ in range(count):
+        record = {}
+        for field in fields.values():
+            if rnd.random() < 0.5:
+                # subfields of a datafield of the same record stay together
+                source = rnd.randrange(len(records))
+                record.update(
+                    (key, value)
+                    for key, value in field
+                    if records[source].get(key) is value
+                )
+        ret.append(record)
+    return ret
+
+
+def transform(transformer_class, records):
+    entries = [
+        StreamEntry(
+            entry=copy.deepcopy(record),
+            context={"oai": {"identifier": f"oai:invenio.nusl.cz:{idx}"}},
+        )
+        for idx, record in enumerate(records)
+    ]
+    transformer_class(identity=None).apply(StreamBatch(entries=entries))
+    return [
+        {
+            "entry": json.loads(json.dumps(entry.entry, default=str)),
+            "files": [json.dumps(vars(f), default=str) for f in entry.files],
+            "errors": [
+                (error.code, error.message, error.location) for error in entry.errors
+            ],
+        }
+        for entry in entries
+    ]
+
+
+def assert_same(records):
+    expected = transform(NUSLTransformer, records)
+    compiled = transform(NUSLCompiledTransformer, records)
+    for record, x, y in zip(records, expected, compiled):
+        assert x == y, record
+
+
+def test_sample_records(stubbed_lookups, sample_records):
+    assert len(sample_records) == 5
+    assert_same(sample_records)
+
+
+def test_failing_sample_record(stubbed_lookups, sample_records):
+    errors = transform(NUSLCompiledTransformer, sample_records)[-1]["errors"]
+    assert {location for _, _, location in errors} >= {
+        "transform_04107_language",
+        "transform_998_collection",
+    }
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_combined_records(stubbed_lookups, sample_records, seed):
+    assert_same(combined_records(sample_records, 50, seed))
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+from oarepo_runtime.datastreams.types import StreamBatch, StreamEntry
+
+from nr_oaipmh_harvesters.nusl import transformer
+from nr_oaipmh_harvesters.nusl.dry_run import DryRunLookups
+from nr_oaipmh_harvesters.nusl.transformer import NUSLTransformer
+
+
+@pytest.fixture
+def no_external_lookups(monkeypatch):
+    def external(*args, **kwargs):
+        raise AssertionError("external lookup in a dry run")
+
+    for name in (
+        "_do_search_award",
+        "_do_search_community",
+        "_search_creatibutor",
+        "_find_affiliation_in_temp",
+    ):
+        monkeypatch.setattr(transformer, name, external)
+    cache = transformer.vocabulary_cache
+    for name in ("warm_up", "_by_id", "_contributor_role", "_lookup_institution"):
+        monkeypatch.setattr(cache, name, external)
+    transformer.creatibutor_memo.clear()
+
+
+def test_dry_run(no_external_lookups, sample_records, tmp_path):
+    keys_path = tmp_path / "keys.jsonl"
+    nusl = NUSLTransformer(identity=None, dry_run="true", dry_run_keys=str(keys_path))
+    entries = [
+        StreamEntry(
+            entry=record,
+            context={"oai": {"identifier": f"oai:invenio.nusl.cz:{idx}"}},
+        )
+        for idx, record in enumerate(sample_records)
+    ]
+    nusl.apply(StreamBatch(entries=entries, last=True))
+
+    # only the record with an unknown language fails
+    assert [bool(entry.errors) for entry in entries] == [False] * 4 + [True]
+    summary = nusl.lookups.summary()
+    assert summary["affiliations"]["lookups"] > 0
+    assert "vocabulary:resource-types" in summary
+
+    written = [json.loads(line) for line in keys_path.read_text().splitlines()]
+    assert {(x["kind"], x["key"]) for x in written} == {
+        (kind, key) for kind, keys in nusl.lookups.keys.items() for key in keys
+    }
+    creators = entries[0].entry["metadata"]["creators"]
+    assert any(creator.get("affiliations") for creator in creators)
+
+
+def test_stub_vocabulary():
+    lookups = DryRunLookups()
+    vocabulary = lookups.vocabulary("countries")
+    assert len(vocabulary) == 0 and list(vocabulary) == []
+
+    assert "CZ" in vocabulary
+    assert vocabulary["SK"] == {"id": "SK"}
+    assert vocabulary.get("CZ") == {"id": "CZ"}
+    # accessed ids are the items of the vocabulary
+    assert list(vocabulary) == ["CZ", "SK"]
+    assert len(vocabulary) == 2
+    assert dict(vocabulary.items()) == {"CZ": {"id": "CZ"}, "SK": {"id": "SK"}}
+    assert lookups.vocabulary("countries") is vocabulary
+    assert lookups.keys["vocabulary:countries"]["CZ"] >= 2
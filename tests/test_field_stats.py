@@ -0,0 +1,90 @@
+import csv
+import gzip
+
+import pytest
+import yaml
+
+from nr_oaipmh_harvesters.nusl.field_stats import (
+    dump_units,
+    field_stats,
+    merge_stats,
+    summary_rows,
+    unit_stats,
+    write_csv,
+)
+
+
+def write_dump(path, records):
+    with gzip.open(path, "wt") as f:
+        yaml.safe_dump(records, f)
+
+
+@pytest.fixture
+def dump(tmp_path):
+    source = tmp_path / "dump"
+    source.mkdir()
+    write_dump(
+        source / "001.yaml.gz",
+        [
+            {"id": "1", "entry": {"001": "1", "04107a": ["cze", "eng"]}},
+            {"id": "2", "entry": {"001": "2", "04107a": ["cze"], "7201_a": ""}},
+        ],
+    )
+    write_dump(
+        source / "002.yaml.gz",
+        [{"id": "3", "entry": {"001": "3", "04107a": "cze", "7201_a": "Novák"}}],
+    )
+    return source
+
+
+def test_merge_worker_stats(dump):
+    # every dump file is processed by a worker, the results are merged
+    units = dump_units(dump)
+    assert len(units) == 2
+    records, total = merge_stats(unit_stats(unit) for unit in units)
+
+    assert records == 3
+    languages = total["04107a"]
+    assert languages.records == 3
+    assert languages.values == 4
+    assert languages.counter == {"cze": 3, "eng": 1}
+    # empty values count the record but not the value
+    assert (total["7201_a"].records, total["7201_a"].values) == (2, 1)
+
+    rows = {row["tag"]: row for row in summary_rows(total, records, top=1)}
+    assert rows["04107a"]["distinct"] == 2
+    assert rows["04107a"]["distinct_exact"]
+    assert rows["04107a"]["top_values"] == '[["cze", 3]]'
+    assert rows["7201_a"]["records_ratio"] == round(2 / 3, 6)
+
+
+def test_merge_truncates_distinct_values(dump):
+    results = [unit_stats(unit) for unit in dump_units(dump)]
+    records, total = merge_stats(results, max_distinct=1)
+    # the second merge exceeds the limit, the cardinality is a lower bound
+    assert total["001"].truncated
+    assert not summary_rows(total, records)[0]["distinct_exact"]
+
+
+def test_tag_filter(dump):
+    _, stats = unit_stats(dump_units(dump)[0], tag_filter="^720")
+    assert list(stats) == ["7201_a"]
+
+
+def test_csv_output(dump, tmp_path):
+    records, total = merge_stats(unit_stats(unit) for unit in dump_units(dump))
+    output = tmp_path / "field-stats.csv"
+    write_csv(summary_rows(total, records), output)
+    with open(output, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["tag"] for row in rows] == ["001", "04107a", "7201_a"]
+    assert rows[0]["records"] == "3"
+
+
+def test_parquet_output(dump, tmp_path):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    output = tmp_path / "field-stats.parquet"
+    field_stats(dump, output, processes=1)
+    table = parquet.read_table(output).to_pydict()
+    assert table["tag"] == ["001", "04107a", "7201_a"]
+    assert table["records"] == [3, 3, 2]
@@ -0,0 +1,180 @@
+import threading
+import time
+
+import pytest
+
+from nr_oaipmh_harvesters.nusl import guard
+from nr_oaipmh_harvesters.nusl.guard import (
+    CircuitBreaker,
+    LookupGuard,
+    LookupUnavailable,
+    parse_lookup_timeouts,
+)
+from nr_oaipmh_harvesters.nusl.lookups import (
+    LookupContext,
+    current_lookup_context,
+    guarded,
+    lookup,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(guard.time, "monotonic", clock)
+    return clock
+
+
+def fail():
+    raise TimeoutError("search engine did not answer")
+
+
+def test_breaker_states(clock):
+    breaker = CircuitBreaker("institution", failures=3, reset_after=60)
+
+    # closed
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.failure()
+    assert not breaker.is_open
+
+    # open after 3 consecutive failures
+    breaker.failure()
+    assert breaker.is_open
+    assert not breaker.allow()
+    clock.now += 59
+    assert not breaker.allow()
+
+    # half open - a single trial after reset_after, a failure opens it again
+    clock.now += 1
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.failure()
+    assert not breaker.allow()
+
+    # a successful trial closes it
+    clock.now += 60
+    assert breaker.allow()
+    breaker.success()
+    assert not breaker.is_open
+    assert breaker.allow()
+    assert breaker.consecutive_failures == 0
+
+
+def test_success_resets_consecutive_failures():
+    breaker = CircuitBreaker("award", failures=2)
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    assert not breaker.is_open
+
+
+def test_guard_opens_breaker(clock):
+    lookup_guard = LookupGuard({"award": 5}, failures=2, reset_after=60)
+    calls = []
+
+    def resolve():
+        calls.append(1)
+        fail()
+
+    for _ in range(2):
+        with pytest.raises(LookupUnavailable):
+            lookup_guard.call("award", resolve)
+    # open - not called at all
+    with pytest.raises(LookupUnavailable, match="circuit breaker is open"):
+        lookup_guard.call("award", resolve)
+    assert len(calls) == 2
+
+    clock.now += 60
+    assert lookup_guard.call("award", lambda: "award") == "award"
+    assert not lookup_guard.breakers["award"].is_open
+
+
+def test_data_errors_do_not_count():
+    lookup_guard = LookupGuard({"award": 5}, failures=1)
+
+    def resolve():
+        raise IndexError("no such award")
+
+    with pytest.raises(IndexError):
+        lookup_guard.call("award", resolve)
+    assert not lookup_guard.breakers["award"].is_open
+
+
+def test_unguarded_lookup_types():
+    lookup_guard = LookupGuard(parse_lookup_timeouts("award=0"))
+    assert "award" not in lookup_guard.breakers
+    assert lookup_guard.call("award", lambda: "award") == "award"
+
+
+def test_timeout():
+    lookup_guard = LookupGuard({"institution": 0.05}, failures=5)
+    release = threading.Event()
+
+    with pytest.raises(LookupUnavailable, match="timed out"):
+        lookup_guard.call("institution", release.wait)
+    assert lookup_guard.breakers["institution"].consecutive_failures == 1
+    release.set()
+
+
+def test_busy_workers():
+    lookup_guard = LookupGuard({"institution": 0.05}, failures=5, workers=1)
+    release = threading.Event()
+
+    # the timed out lookup keeps the only worker busy
+    with pytest.raises(LookupUnavailable, match="timed out"):
+        lookup_guard.call("institution", release.wait)
+
+    started = time.monotonic()
+    with pytest.raises(LookupUnavailable, match="threads are busy"):
+        lookup_guard.call("institution", lambda: "institution")
+    # rejected without waiting for the timeout
+    assert time.monotonic() - started < 0.05
+    assert lookup_guard.breakers["institution"].consecutive_failures == 2
+
+    release.set()
+    deadline = time.monotonic() + 5
+    while lookup_guard._running and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert lookup_guard.call("institution", lambda: "institution") == "institution"
+
+
+def test_nested_lookups_run_on_the_same_worker():
+    lookup_guard = LookupGuard(
+        {"institution": 1, "vocabulary-version": 1}, failures=1, workers=1
+    )
+
+    def resolve_institution():
+        # e.g. the version check of the vocabulary within the institution lookup
+        version = guarded("vocabulary-version", lambda: "42-0")
+        return {"id": "muni", "version": version}
+
+    with LookupContext(guard=lookup_guard).active():
+        for _ in range(3):
+            assert lookup(
+                "institution", "MU", "institutions", resolve=resolve_institution
+            ) == {
+                "id": "muni",
+                "version": "42-0",
+            }
+    assert not any(breaker.is_open for breaker in lookup_guard.breakers.values())
+
+
+def test_context_is_not_shared_between_threads():
+    context = LookupContext()
+    seen = []
+    with context.active():
+        thread = threading.Thread(target=lambda: seen.append(current_lookup_context()))
+        thread.start()
+        thread.join()
+        assert current_lookup_context() is context
+    assert seen == [None]
+    assert current_lookup_context() is None
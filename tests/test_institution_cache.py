@@ -0,0 +1,75 @@
+import pytest
+
+from nr_oaipmh_harvesters.nusl import transformer
+from nr_oaipmh_harvesters.nusl.transformer import (
+    DEFAULT_UNRESOLVED_INSTITUTION_TTL,
+    DEFAULT_VOCABULARY_CACHE_TTL,
+    VocabularyCache,
+)
+
+
+class Cache(dict):
+    """invenio_cache with the timeouts of the keys."""
+
+    def __init__(self):
+        super().__init__()
+        self.timeouts = {}
+
+    def set(self, key, value, timeout=None):
+        self[key] = value
+        self.timeouts[key] = timeout
+
+    def get_many(self, *keys):
+        return [self.get(key) for key in keys]
+
+    def set_many(self, mapping, timeout=None):
+        for key, value in mapping.items():
+            self.set(key, value, timeout)
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = Cache()
+    monkeypatch.setattr(transformer, "current_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def vocabulary(monkeypatch):
+    vocabulary = VocabularyCache()
+    monkeypatch.setattr(vocabulary, "version", lambda vocab_type: "1")
+    monkeypatch.setattr(vocabulary, "institution_override", lambda *args: None)
+    monkeypatch.setattr(
+        vocabulary,
+        "_resolve_institution",
+        lambda inst, vocab_type: {"id": "vsb"} if inst == "VŠB" else None,
+    )
+    return vocabulary
+
+
+def timeouts(cache, vocabulary):
+    return {
+        inst: cache.timeouts[vocabulary._institution_cache_key(inst, "institutions")]
+        for inst in ("VŠB", "Neznámá škola")
+    }
+
+
+def test_unresolved_institution_ttl(cache, vocabulary):
+    assert vocabulary.get_institution("VŠB") == {"id": "vsb"}
+    assert vocabulary.get_institution("Neznámá škola") is None
+    assert timeouts(cache, vocabulary) == {
+        "VŠB": DEFAULT_VOCABULARY_CACHE_TTL,
+        "Neznámá škola": DEFAULT_UNRESOLVED_INSTITUTION_TTL,
+    }
+
+
+def test_unresolved_prefetched_institution_ttl(cache, vocabulary):
+    vocabulary.prefetch_institutions(["VŠB", "Neznámá škola", "VŠB"])
+    assert timeouts(cache, vocabulary) == {
+        "VŠB": DEFAULT_VOCABULARY_CACHE_TTL,
+        "Neznámá škola": DEFAULT_UNRESOLVED_INSTITUTION_TTL,
+    }
+    assert vocabulary.get_institution("Neznámá škola") is None
+    vocabulary.clear_prefetched_institutions()
+    # served from the cache
+    assert vocabulary.get_institution("VŠB") == {"id": "vsb"}
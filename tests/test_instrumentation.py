@@ -0,0 +1,112 @@
+import contextvars
+import json
+import logging
+import threading
+from types import SimpleNamespace
+
+from oarepo_runtime.datastreams.types import StreamBatch, StreamEntry
+
+from nr_oaipmh_harvesters.nusl.instrumentation import (
+    Instrumentation,
+    count_cache_hit,
+    count_lookup,
+    count_search,
+    record_unresolved_institution,
+)
+from nr_oaipmh_harvesters.nusl.report import HarvestReport
+from nr_oaipmh_harvesters.nusl.transformer import NUSLTransformer
+
+
+def test_counts_without_instrumentation():
+    # lookups outside of a transformer (e.g. a shell) are not counted anywhere
+    count_lookup("awards")
+    count_search("awards")
+
+
+def test_counts_of_guard_workers():
+    instrumentation = Instrumentation()
+    with instrumentation.active(), instrumentation.batch_stats() as stats:
+        profile = instrumentation.begin_entry()
+
+        def lookups():
+            for _ in range(1000):
+                count_lookup("institution:institutions")
+                count_cache_hit("institution:institutions")
+                count_search("institution:institutions")
+
+        # the guard runs the lookups in a copy of the context of the transformer
+        threads = [
+            threading.Thread(target=contextvars.copy_context().run, args=(lookups,))
+            for _ in range(8)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        instrumentation.end_entry(profile, StreamEntry(entry={}))
+
+    assert stats.lookups == {"institution:institutions": 8000}
+    assert stats.cache_hits == {"institution:institutions": 8000}
+    assert stats.searches == {"institution:institutions": 8000}
+    assert profile.lookups == {"institution:institutions": 8000}
+    assert instrumentation.stats is None and instrumentation.profile is None
+
+
+def test_instrumentations_are_separate():
+    first, second = Instrumentation(), Instrumentation()
+    with first.batch_stats() as first_stats, second.batch_stats() as second_stats:
+        with first.active():
+            count_lookup("awards")
+            with second.active():
+                record_unresolved_institution("VŠB", "institutions")
+            count_lookup("awards")
+    assert first_stats.lookups == {"awards": 2}
+    assert not first_stats.unresolved
+    assert second_stats.unresolved == {"institutions: VŠB": 1}
+
+
+def test_slow_record(caplog):
+    instrumentation = Instrumentation(slow_threshold=0)
+    entry = StreamEntry(entry={}, context={"oai": {"identifier": "oai:nusl:1"}})
+    with caplog.at_level(logging.WARNING, logger="oaipmh.harvester"):
+        with instrumentation.active():
+            profile = instrumentation.begin_entry()
+            count_lookup("awards")
+            instrumentation.end_entry(profile, entry)
+    report = json.loads(caplog.records[-1].getMessage().split(": ", 1)[1])
+    assert report["identifier"] == "oai:nusl:1"
+    assert report["lookups"] == {"awards": 1}
+
+
+def test_harvest_report(tmp_path):
+    report = HarvestReport(tmp_path, "run-1")
+    instrumentation = Instrumentation()
+    for seq, last in ((1, False), (2, True)):
+        batch = SimpleNamespace(
+            seq=seq, last=last, context={}, entries=[StreamEntry(entry={})] * 2
+        )
+        with instrumentation.active(), report.batch(batch, instrumentation):
+            count_lookup("awards")
+    saved = json.loads((tmp_path / "run-1.json").read_text())
+    assert saved["records"] == 4
+    assert saved["lookups"] == {"awards": 2}
+    assert "wall_seconds" in saved
+
+
+def test_transformer_report(stubbed_lookups, sample_records, tmp_path):
+    nusl = NUSLTransformer(
+        identity=None,
+        harvest_report="true",
+        report_dir=str(tmp_path),
+        oai_config={"code": "nusl"},
+        oai_run="run-1",
+    )
+    batch = StreamBatch(
+        entries=[StreamEntry(entry=record) for record in sample_records],
+        last=True,
+    )
+    nusl.apply(batch)
+    saved = json.loads((tmp_path / "nusl" / "run-1.json").read_text())
+    assert saved["records"] == 5
+    assert saved["errors"]
+    assert nusl.instrumentation.stats is None
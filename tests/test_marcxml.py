@@ -0,0 +1,73 @@
+from pathlib import Path
+
+import pytest
+from lxml import etree
+from oarepo_oaipmh_harvester.transformers.marcxml import MarcXMLTransformer
+from oarepo_runtime.datastreams.types import StreamBatch, StreamEntry
+
+from nr_oaipmh_harvesters.nusl.marcxml import NUSLMarcXMLTransformer, parse_marcxml
+from nr_oaipmh_harvesters.nusl.transformer import NUSLTransformer
+
+RECORDS = Path(__file__).parent / "fixtures" / "nusl-records.xml"
+
+EDGE_CASES = """
+<record xmlns="http://www.loc.gov/MARC21/slim">
+  <leader>00000nam a2200000 a 4500</leader>
+  <controlfield tag="001">1</controlfield>
+  <controlfield tag="005">20210101</controlfield>
+  <datafield tag="720" ind1=" " ind2=" ">
+    <subfield code="a">Novák, Jan</subfield>
+    <subfield code="5">VŠB</subfield>
+    <subfield code="5">ČVUT</subfield>
+  </datafield>
+  <datafield tag="720" ind1=" " ind2=" ">
+    <subfield code="a">Nová, Jana</subfield>
+    <subfield code="6">orcid</subfield>
+  </datafield>
+  <datafield tag="720" ind1="" ind2="#">
+    <subfield code="a">Nový, Petr</subfield>
+  </datafield>
+  <datafield tag="653" ind1="0" ind2=" ">
+    <subfield code="a"/>
+  </datafield>
+</record>
+"""
+
+
+def xml_records():
+    collection = etree.parse(str(RECORDS)).getroot()
+    return [etree.tostring(record) for record in collection.iter("{*}record")] + [
+        EDGE_CASES.encode("utf-8")
+    ]
+
+
+def dojson_parse(xml):
+    return MarcXMLTransformer().apply_entry(StreamEntry(entry=xml)).entry
+
+
+@pytest.mark.parametrize("idx", range(len(xml_records())))
+def test_same_as_marcxml_transformer(idx):
+    xml = xml_records()[idx]
+    assert parse_marcxml(xml) == dojson_parse(xml)
+
+
+def test_same_transformed_records(stubbed_lookups):
+    def entries():
+        return [
+            StreamEntry(
+                entry=xml, context={"oai": {"identifier": f"oai:invenio.nusl.cz:{idx}"}}
+            )
+            for idx, xml in enumerate(xml_records())
+        ]
+
+    expected = entries()
+    MarcXMLTransformer().apply(StreamBatch(entries=expected))
+    NUSLTransformer(identity=None).apply(StreamBatch(entries=expected))
+
+    single_stage = entries()
+    NUSLMarcXMLTransformer(identity=None).apply(StreamBatch(entries=single_stage))
+
+    for x, y in zip(expected, single_stage):
+        assert x.context["marcxml_parsed"] == y.context["marcxml_parsed"]
+        assert x.entry == y.entry
+        assert [e.message for e in x.errors] == [e.message for e in y.errors]
@@ -0,0 +1,61 @@
+from nr_oaipmh_harvesters.nusl import transformer
+from nr_oaipmh_harvesters.nusl.memo import BoundedMemo
+
+
+def test_lru_eviction():
+    memo = BoundedMemo(2)
+    memo.set("a", 1)
+    memo.set("b", 2)
+    # "a" is used, so "b" is the least recently used one
+    assert memo.get("a") == (True, 1)
+    memo.set("c", 3)
+    assert memo.get("b") == (False, None)
+    assert memo.get("a") == (True, 1)
+    assert memo.get("c") == (True, 3)
+    assert len(memo) == 2
+
+    # setting an existing key makes it the most recent as well
+    memo.set("a", 10)
+    memo.set("d", 4)
+    assert memo.get("c") == (False, None)
+    assert memo.get("a") == (True, 10)
+
+
+def test_stats():
+    memo = BoundedMemo(10)
+    assert memo.stats()["hit_rate"] == 0.0
+    memo.set("a", None)
+    # None is a memoized value, not a miss
+    assert memo.get("a") == (True, None)
+    memo.get("b")
+    assert memo.stats() == {"size": 1, "hits": 1, "misses": 1, "hit_rate": 0.5}
+    memo.clear()
+    assert len(memo) == 0
+
+
+def test_resolved_creatibutors_are_not_shared(monkeypatch):
+    calls = []
+
+    def resolve(name, affiliations, identifiers, value):
+        calls.append(name)
+        return [{"name": "VŠB"}], {"name": name, "identifiers": [{"scheme": "orcid"}]}
+
+    monkeypatch.setattr(transformer, "creatibutor_memo", BoundedMemo(10))
+    monkeypatch.setattr(transformer, "_do_resolve_creatibutor", resolve)
+
+    value = ("Novák, Jan", ["VŠB"], None)
+    first = transformer._resolve_creatibutor("Novák, Jan", ["VŠB"], None, value)
+    first[0][0]["name"] = "changed"
+    first[1]["identifiers"].append({"scheme": "isni"})
+
+    second = transformer._resolve_creatibutor("Novák, Jan", ["VŠB"], None, value)
+    assert calls == ["Novák, Jan"]
+    assert second == (
+        [{"name": "VŠB"}],
+        {"name": "Novák, Jan", "identifiers": [{"scheme": "orcid"}]},
+    )
+    assert second[1] is not first[1]
+
+    # different affiliations are a different key
+    transformer._resolve_creatibutor("Novák, Jan", ["MU"], None, value)
+    assert calls == ["Novák, Jan", "Novák, Jan"]
@@ -0,0 +1,52 @@
+import multiprocessing
+
+from nr_oaipmh_harvesters.readers.oai_zstd import OAIZstdDumpWriter, OAIZstdReader
+
+
+def record(idx):
+    return {
+        "entry": {"001": str(idx), "24500a": ("a", None)},
+        "oai": {"identifier": f"oai:nusl:{idx}"},
+    }
+
+
+def write_chunks(directory, worker, chunks, per_chunk):
+    writer = OAIZstdDumpWriter(directory)
+    for chunk in range(chunks):
+        start = (worker * chunks + chunk) * per_chunk
+        writer.write_chunk([record(idx) for idx in range(start, start + per_chunk)])
+
+
+def test_round_trip(tmp_path):
+    OAIZstdDumpWriter(tmp_path).write_chunk([record(1), record(2)])
+    OAIZstdDumpWriter(tmp_path).write_chunk([record(3)])
+    reader = OAIZstdReader(source=str(tmp_path))
+    assert len(reader) == 3
+    assert reader.read_record(reader.position("oai:nusl:3")) == record(3)
+    assert reader.read_record(0)["entry"]["24500a"] == ("a", None)
+
+
+def test_concurrent_writers(tmp_path):
+    workers, chunks, per_chunk = 4, 20, 5
+    processes = [
+        multiprocessing.Process(
+            target=write_chunks, args=(tmp_path, worker, chunks, per_chunk)
+        )
+        for worker in range(workers)
+    ]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+
+    reader = OAIZstdReader(source=str(tmp_path))
+    # every index line points to its own frame
+    records = [reader.read_record(pos) for pos in range(len(reader))]
+    assert sorted(int(r["entry"]["001"]) for r in records) == list(
+        range(workers * chunks * per_chunk)
+    )
+    for start, chunk in zip(reader.chunk_starts, reader.chunks):
+        assert [
+            reader.read_record(start + idx)["oai"]["identifier"]
+            for idx in range(chunk["count"])
+        ] == chunk["identifiers"]
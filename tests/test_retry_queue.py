@@ -0,0 +1,194 @@
+import json
+import threading
+
+import pytest
+from oarepo_runtime.datastreams.types import StreamEntry
+
+from nr_oaipmh_harvesters.nusl import retry_queue
+from nr_oaipmh_harvesters.nusl.retry_queue import (
+    RETRY_ATTEMPTS_KEY,
+    RETRY_ORIGINAL_DATA_KEY,
+    RetryQueue,
+    RetryQueueReader,
+    deferred_item,
+    restore_original_data,
+)
+from nr_oaipmh_harvesters.readers.oai_zstd import decode_record
+
+
+def item(idx):
+    return {
+        "id": f"oai:nusl:{idx}",
+        "entry": {"001": str(idx), "24500a": ("a", None)},
+        "context": {},
+    }
+
+
+def read_ids(path):
+    with open(path) as f:
+        return [decode_record(line)["id"] for line in f]
+
+
+def test_push_take_done(tmp_path):
+    queue = RetryQueue(tmp_path, "nusl")
+    assert queue.take() is None
+
+    queue.push([item(1), item(2)])
+    assert len(queue) == 2
+
+    taken = queue.take()
+    assert read_ids(taken) == ["oai:nusl:1", "oai:nusl:2"]
+    # tuples survive the round trip
+    with open(taken) as f:
+        assert decode_record(f.readline())["entry"]["24500a"] == ("a", None)
+    assert len(queue) == 0
+
+    # deferred again during the retry
+    queue.push([item(2)])
+    queue.done()
+    assert not taken.exists()
+    assert read_ids(queue.take()) == ["oai:nusl:2"]
+
+
+def test_take_keeps_unfinished_retry(tmp_path):
+    queue = RetryQueue(tmp_path, "nusl")
+    queue.push([item(1)])
+    queue.take()
+    # the retry did not finish, the next take retries its entries as well
+    queue.push([item(2)])
+    assert read_ids(queue.take()) == ["oai:nusl:1", "oai:nusl:2"]
+
+
+def test_concurrent_push_and_take(tmp_path):
+    queue = RetryQueue(tmp_path, "nusl")
+    pushers = 4
+    per_pusher = 50
+
+    def push(worker):
+        for idx in range(per_pusher):
+            RetryQueue(tmp_path, "nusl").push([item(worker * per_pusher + idx)])
+
+    def take():
+        for _ in range(20):
+            RetryQueue(tmp_path, "nusl").take()
+
+    threads = [threading.Thread(target=push, args=(x,)) for x in range(pushers)]
+    threads += [threading.Thread(target=take) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    taken = queue.take()
+    ids = read_ids(taken)
+    # nothing lost, nothing duplicated, no torn lines
+    assert sorted(ids) == sorted(f"oai:nusl:{x}" for x in range(pushers * per_pusher))
+    assert len(queue) == 0
+
+
+def test_deferred_item_and_reader(tmp_path):
+    raw = {"001": "1"}
+    entry = StreamEntry(
+        entry={"metadata": {}},
+        id="oai:nusl:1",
+        context={
+            "marcxml_parsed": raw,
+            "original_data": "<record/>",
+            "oai": {"identifier": "oai:nusl:1"},
+        },
+    )
+    queued = deferred_item(entry, raw, "nusl", "run-1")
+    assert queued["attempts"] == 1
+    assert "marcxml_parsed" not in queued["context"]
+    assert queued["context"][RETRY_ORIGINAL_DATA_KEY] == "<record/>"
+
+    queue = RetryQueue(tmp_path, "nusl")
+    queue.push([queued])
+    entries = list(RetryQueueReader(path=queue.take(), oai_run="run-2", manual=True))
+    assert [e.entry for e in entries] == [raw]
+    read = entries[0]
+    assert read.context["oai_run"] == "run-2"
+    assert read.context[RETRY_ATTEMPTS_KEY] == 1
+
+    # the retry run replaces original_data, the transformer puts the queued one back
+    read.context["original_data"] = raw
+    restore_original_data(read)
+    assert read.context["original_data"] == "<record/>"
+
+    # deferred again
+    assert deferred_item(read, raw, "nusl", "run-2")["attempts"] == 2
+
+
+class FakeRun:
+    status = "finished"
+
+
+@pytest.fixture
+def fake_harvest(tmp_path, monkeypatch):
+    """Harvest that reads the loader as the harvester would, returns what it has read."""
+    import oarepo_oaipmh_harvester.harvester
+    import oarepo_oaipmh_harvester.models
+
+    harvested = {}
+
+    def harvest(harvester, manual=False, title=None):
+        name, params = harvester["loader"].split("{", 1)
+        path = json.loads(params[len("path=") : -1])
+        harvested.update(
+            loader=name,
+            transformers=harvester["transformers"],
+            manual=manual,
+            ids=[e.id for e in RetryQueueReader(path=path)],
+        )
+        return "run-1"
+
+    class FakeRunModel:
+        query = type("Query", (), {"get": staticmethod(lambda run_id: FakeRun)})
+
+    monkeypatch.setattr(oarepo_oaipmh_harvester.harvester, "harvest", harvest)
+    monkeypatch.setattr(oarepo_oaipmh_harvester.models, "OAIHarvesterRun", FakeRunModel)
+    monkeypatch.setattr(retry_queue, "retry_queue_dir", lambda: tmp_path)
+    monkeypatch.setattr(
+        retry_queue,
+        "_get_harvester",
+        lambda code: {
+            "code": code,
+            "loader": "sickle",
+            "transformers": ["marcxml", "nusl{guard_lookups=true}", "nusl_validate"],
+            "writers": ["service{service=nr_documents}"],
+        },
+    )
+    # the transformers from the NUSL one on
+    monkeypatch.setattr(retry_queue, "_nusl_transformers", lambda t: t[1:])
+    return harvested
+
+
+def test_retry_deferred(tmp_path, fake_harvest, monkeypatch):
+    queue = RetryQueue(tmp_path, "nusl")
+    queue.push([item(1), item(2)])
+
+    assert retry_queue.retry_deferred("nusl") == "run-1"
+    assert fake_harvest == {
+        "loader": "nusl_retry_queue",
+        "transformers": ["nusl{guard_lookups=true}", "nusl_validate"],
+        "manual": True,
+        "ids": ["oai:nusl:1", "oai:nusl:2"],
+    }
+    # finished run, the entries are removed
+    assert queue.take() is None
+
+
+def test_retry_deferred_keeps_entries_of_failed_run(
+    tmp_path, fake_harvest, monkeypatch
+):
+    monkeypatch.setattr(FakeRun, "status", "failed")
+    queue = RetryQueue(tmp_path, "nusl")
+    queue.push([item(1)])
+
+    retry_queue.retry_deferred("nusl")
+    assert read_ids(queue.take()) == ["oai:nusl:1"]
+
+
+def test_retry_deferred_empty_queue(fake_harvest):
+    assert retry_queue.retry_deferred("nusl") is None
+    assert fake_harvest == {}
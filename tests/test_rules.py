@@ -0,0 +1,126 @@
+import copy
+import json
+import random
+
+import pytest
+from oarepo_oaipmh_harvester.transformers import rule
+from oarepo_runtime.datastreams.types import StreamBatch, StreamEntry
+
+from nr_oaipmh_harvesters.nusl.compiled import NUSLCompiledTransformer
+from nr_oaipmh_harvesters.nusl.rules import RuleError, deduplicate, matches
+from nr_oaipmh_harvesters.nusl.transformer import NUSLTransformer
+
+
+@pytest.mark.parametrize(
+    "transformer_class", [NUSLTransformer, NUSLCompiledTransformer]
+)
+def test_failing_rule(stubbed_lookups, transformer_class):
+    entry = StreamEntry(
+        entry={
+            "001": "1",
+            "24500a": "Název",
+            "04107a": ["cze", "xyz"],
+            "656_7a": "Fyzika / Optika",
+        },
+        context={"oai": {"identifier": "oai:invenio.nusl.cz:1"}},
+    )
+    transformer_class(identity=None).apply(StreamBatch(entries=[entry]))
+
+    assert len(entry.errors) == 1
+    error = entry.errors[0]
+    assert error.location == "transform_04107_language"
+    assert {key: error.info[key] for key in ("rule", "tags", "value")} == {
+        "rule": "transform_04107_language",
+        "tags": ["04107a", "04107b"],
+        "value": "xyz",
+    }
+    assert error.info["message"] == "Bad language xyz - no alpha2 equivalent"
+    md = entry.entry["metadata"]
+    # the value before the failing one is kept
+    assert md["languages"] == [{"id": "cs"}]
+    # the rules after the failing one are applied
+    assert md["thesis"]["studyFields"] == ["Fyzika", "Optika"]
+
+
+def test_rule_error():
+    @matches("520__a", "520__9", paired=True)
+    def transform_520(md, entry, value):
+        md.setdefault("abstract", []).append(value[0].upper())
+
+    entry = StreamEntry(entry={"520__a": ["a", None], "520__9": ["cze", "eng"]})
+    entry.processed = set()
+    md = {}
+    with pytest.raises(RuleError) as e:
+        transform_520(md, entry)
+    assert e.value.info == {
+        "rule": "transform_520",
+        "tags": ["520__a", "520__9"],
+        "value": [None, "eng"],
+    }
+    assert isinstance(e.value.__cause__, AttributeError)
+    assert e.value.stream_error().location == "transform_520"
+    assert md == {"abstract": ["A"]}
+
+
+DEDUPLICATE_CASES = [
+    [],
+    [{"id": "cze"}, {"id": "eng"}, {"id": "cze"}],
+    # key order does not matter
+    [{"a": 1, "b": [1, 2]}, {"b": [1, 2], "a": 1}],
+    # tuples are serialized as lists
+    [{"a": (1, 2)}, {"a": [1, 2]}],
+    # but 1, 1.0 and True differ in json
+    [{"a": 1}, {"a": 1.0}, {"a": True}, {"a": "1"}, {"a": None}, {"a": 1}],
+    [[1, [2]], [1, [2]], [[1], 2]],
+    ["x", "x", "y", "x"],
+    [
+        {"person_or_org": {"name": "Novák, Jan", "type": "personal"}},
+        {"person_or_org": {"type": "personal", "name": "Novák, Jan"}},
+        {"person_or_org": {"name": "Novák, Jan", "type": "organizational"}},
+    ],
+]
+
+
+def random_value(rnd, depth=0):
+    kind = rnd.randrange(6 if depth < 3 else 3)
+    if kind == 0:
+        return rnd.choice([0, 1, 1.0, True, False, None])
+    if kind in (1, 2):
+        return rnd.choice(["a", "b", "č"])
+    if kind == 3:
+        return [random_value(rnd, depth + 1) for _ in range(rnd.randrange(3))]
+    if kind == 4:
+        return tuple(random_value(rnd, depth + 1) for _ in range(rnd.randrange(3)))
+    return {
+        rnd.choice("xyz"): random_value(rnd, depth + 1) for _ in range(rnd.randrange(3))
+    }
+
+
+def random_cases(count):
+    rnd = random.Random(42)
+    for _ in range(count):
+        values = [random_value(rnd) for _ in range(rnd.randrange(1, 5))]
+        yield [copy.deepcopy(rnd.choice(values)) for _ in range(rnd.randrange(8))]
+
+
+@pytest.mark.parametrize("items", DEDUPLICATE_CASES + list(random_cases(200)))
+def test_deduplicate_as_upstream(items):
+    expected = {"items": copy.deepcopy(items)}
+    rule.deduplicate(expected, "items")
+    deduplicated = {"items": items}
+    deduplicate(deduplicated, "items")
+    # 1, 1.0 and True are equal in python, compare as the upstream does
+    assert json.dumps(deduplicated, sort_keys=True) == json.dumps(
+        expected, sort_keys=True
+    )
+
+
+def test_deduplicate_in_place():
+    items = [{"id": "cze"}, {"id": "cze"}]
+    md = {"languages": items}
+    deduplicate(md, "languages")
+    assert md["languages"] is items and items == [{"id": "cze"}]
+    # missing list is left alone
+    md = {}
+    deduplicate(md, "languages")
+    assert md == {}
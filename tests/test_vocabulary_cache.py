@@ -0,0 +1,150 @@
+from types import SimpleNamespace
+
+import invenio_vocabularies.proxies
+import pytest
+
+from nr_oaipmh_harvesters.nusl import transformer
+from nr_oaipmh_harvesters.nusl.transformer import (
+    DEFAULT_VOCABULARY_VERSION_CHECK_INTERVAL,
+    VocabularyCache,
+)
+
+
+class VocabularyService:
+    """Vocabulary service with the items of a single vocabulary type."""
+
+    record_cls = None
+    config = SimpleNamespace(search=None)
+
+    def __init__(self, items, updated=1):
+        self.items = items
+        self.updated = updated
+        self.searches = 0
+
+    def create_search(self, identity, record_cls, search, extra_filter=None):
+        self.searches += 1
+        return Search(self)
+
+    def scan(self, identity, extra_filter=None):
+        return iter(self.items)
+
+
+class Search:
+    def __init__(self, service):
+        self.service = service
+        self.aggs = SimpleNamespace(metric=lambda *args, **kwargs: None)
+
+    def extra(self, **kwargs):
+        return self
+
+    def execute(self):
+        return SimpleNamespace(
+            aggregations=SimpleNamespace(
+                updated=SimpleNamespace(value=self.service.updated)
+            ),
+            hits=SimpleNamespace(total=SimpleNamespace(value=len(self.service.items))),
+        )
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(transformer.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def service(monkeypatch):
+    service = VocabularyService([{"id": "other", "title": {"en": "Other"}}])
+    monkeypatch.setattr(invenio_vocabularies.proxies, "current_service", service)
+    return service
+
+
+def test_version_is_checked_after_interval(clock, service):
+    vocabulary = VocabularyCache()
+    assert vocabulary.version("contributor-types") == "1-1"
+    assert service.searches == 1
+
+    # in between the checks the last known version is returned
+    service.updated = 2
+    clock.now += DEFAULT_VOCABULARY_VERSION_CHECK_INTERVAL - 1
+    assert vocabulary.version("contributor-types") == "1-1"
+    assert service.searches == 1
+
+    clock.now += 1
+    assert vocabulary.version("contributor-types") == "1-2"
+    assert service.searches == 2
+
+    # the interval starts again from the last check
+    clock.now += DEFAULT_VOCABULARY_VERSION_CHECK_INTERVAL - 1
+    assert vocabulary.version("contributor-types") == "1-2"
+    assert service.searches == 2
+
+
+def test_versions_of_vocabulary_types_are_separate(clock, service):
+    vocabulary = VocabularyCache()
+    vocabulary.version("contributor-types")
+    vocabulary.version("languages")
+    assert service.searches == 2
+
+
+class Cache(dict):
+    def set(self, key, value, timeout=None):
+        self[key] = value
+
+
+CONTRIBUTOR_TYPES = [
+    {"id": "other", "title": {"cs": "Jiná", "en": "Other"}},
+    {"id": "editor", "title": {"cs": "Editor", "en": "Editor"}},
+    {"id": "supervisor", "title": {"cs": "Vedoucí práce", "en": "Supervisor"}},
+    # english title is the id of another type - resolved to that type
+    {"id": "ed", "title": {"cs": "Redaktor", "en": "editor"}},
+    # the first type with the title wins
+    {"id": "supervisor-2", "title": {"cs": "Vedoucí práce", "en": "Advisor"}},
+]
+
+
+@pytest.fixture
+def roles(monkeypatch, clock):
+    service = VocabularyService(CONTRIBUTOR_TYPES)
+    monkeypatch.setattr(invenio_vocabularies.proxies, "current_service", service)
+    monkeypatch.setattr(transformer, "current_cache", Cache())
+    return service
+
+
+def test_contributor_role(roles):
+    vocabulary = VocabularyCache()
+    assert vocabulary.contributor_role("Vedoucí práce") == "supervisor"
+    assert vocabulary.contributor_role("Supervisor") == "supervisor"
+    assert vocabulary.contributor_role("Advisor") == "supervisor-2"
+    assert vocabulary.contributor_role("Redaktor") == "editor"
+    # case and whitespace insensitive
+    assert vocabulary.contributor_role("  vedoucí   PRÁCE ") == "supervisor"
+    # unknown and missing roles
+    assert vocabulary.contributor_role("Oponent") == "other"
+    assert vocabulary.contributor_role("") == "other"
+    assert vocabulary.contributor_role(None) == "other"
+
+
+def test_contributor_roles_are_rebuilt_when_vocabulary_changes(roles, clock):
+    vocabulary = VocabularyCache()
+    assert vocabulary.contributor_role("Oponent") == "other"
+    _, exact, normalized, _ = vocabulary._contributor_roles
+    assert exact["Vedoucí práce"] == normalized["vedoucí práce"] == "supervisor"
+
+    roles.items = CONTRIBUTOR_TYPES + [
+        {"id": "referee", "title": {"cs": "Oponent", "en": "Referee"}}
+    ]
+    # the index is kept until the next version check
+    assert vocabulary.contributor_role("Oponent") == "other"
+    clock.now += DEFAULT_VOCABULARY_VERSION_CHECK_INTERVAL
+    assert vocabulary.contributor_role("Oponent") == "referee"
+    assert vocabulary.contributor_role("referee") == "referee"